@@ -0,0 +1,368 @@
+"""Vectorized analytics over the stored training history.
+
+The history is loaded from SQLite into columnar NumPy arrays, streaming the
+rows chunk by chunk, and every statistic is computed with array operations
+rather than per-row Python loops. Loaded columns are kept in a snapshot file
+next to the database; later loads only read sessions added since, so a
+history of a million answered questions is summarized in well under a
+second.
+"""
+import logging
+import os
+import time
+
+import numpy as np
+
+
+logger = logging.getLogger(__name__)
+
+SESSION_DTYPE = np.dtype([
+    ('id', 'i8'),
+    ('date', 'i8'),
+    ('difficulty', 'i2'),  # index into History.difficulties
+    ('total_questions', 'i4'),
+    ('correct_answers', 'i4'),
+])
+
+ATTEMPT_DTYPE = np.dtype([
+    ('session', 'i8'),  # session id
+    ('num1', 'i4'),
+    ('num2', 'i4'),
+    ('is_correct', 'i1'),
+    ('time_taken', 'f8'),
+    ('multiplication', 'i1'),  # 1 for multiplication questions
+])
+
+# Sessions as read from the database, before difficulties are encoded
+_SESSION_ROW_DTYPE = np.dtype([
+    ('id', 'i8'),
+    ('date', 'i8'),
+    ('difficulty', 'O'),  # generator labels have no length limit
+    ('total_questions', 'i4'),
+    ('correct_answers', 'i4'),
+])
+
+# Version of the snapshot file layout; snapshots of other versions are
+# rebuilt from the database
+SNAPSHOT_VERSION = 2
+
+SECONDS_PER_HOUR = 3600
+SECONDS_PER_DAY = 86400
+PERCENTILES = (50, 90, 99)
+ROLLING_WINDOW = 7  # active days
+HEATMAP_MAX_SIDE = 101  # operands shown per heatmap axis
+TREND_DAYS_SHOWN = 7
+
+# Heatmap colors (RGBA): accuracy 0 -> WRONG, 1 -> RIGHT; unseen facts -> UNSEEN
+HEATMAP_WRONG = np.array([231, 76, 60, 255], dtype=np.float64)
+HEATMAP_RIGHT = np.array([46, 204, 113, 255], dtype=np.float64)
+HEATMAP_UNSEEN = np.array([128, 128, 128, 60], dtype=np.uint8)
+
+
+def _read_array(chunks, dtype):
+    """Concatenate row chunks (lists of tuples) into one structured array."""
+    parts = [np.fromiter(rows, dtype, len(rows)) for rows in chunks]
+    if not parts:
+        return np.empty(0, dtype)
+    return np.concatenate(parts)
+
+
+class History:
+    """Columnar session and attempt history.
+
+    Attributes:
+        sessions: SESSION_DTYPE array ordered by session id.
+        attempts: ATTEMPT_DTYPE array ordered by session id, then question.
+        difficulties: Difficulty names indexed by sessions['difficulty'].
+    """
+
+    def __init__(self, sessions=None, attempts=None, difficulties=()):
+        self.sessions = np.empty(0, SESSION_DTYPE) if sessions is None else sessions
+        self.attempts = np.empty(0, ATTEMPT_DTYPE) if attempts is None else attempts
+        self.difficulties = list(difficulties)
+        self._attempt_session = None
+
+    @property
+    def last_session_id(self):
+        """Id of the newest loaded session (0 when empty)."""
+        return int(self.sessions['id'][-1]) if len(self.sessions) else 0
+
+    @property
+    def attempt_session(self):
+        """Row in sessions of every attempt."""
+        if self._attempt_session is None:
+            self._attempt_session = np.searchsorted(self.sessions['id'], self.attempts['session'])
+        return self._attempt_session
+
+    def attempt_dates(self):
+        """Epoch date of the session of every attempt."""
+        return self.sessions['date'][self.attempt_session]
+
+    def attempt_difficulties(self):
+        """Difficulty code of the session of every attempt."""
+        return self.sessions['difficulty'][self.attempt_session]
+
+    def _encode_difficulties(self, names):
+        """Map difficulty names to codes, registering new names."""
+        unique, inverse = np.unique(names, return_inverse=True)
+        codes = np.empty(len(unique), dtype=np.int16)
+        for i, name in enumerate(unique.tolist()):
+            if name not in self.difficulties:
+                self.difficulties.append(name)
+            codes[i] = self.difficulties.index(name)
+        return codes[inverse]
+
+    def extend(self, db, chunk_size=None):
+        """Append sessions (and their attempts) added to db since the last load.
+
+        Returns the number of sessions added.
+        """
+        kwargs = {'chunk_size': chunk_size} if chunk_size else {}
+        after = self.last_session_id
+        rows = _read_array(db.iter_session_rows(after, **kwargs), _SESSION_ROW_DTYPE)
+        if not len(rows):
+            return 0
+        sessions = np.empty(len(rows), SESSION_DTYPE)
+        for name in ('id', 'date', 'total_questions', 'correct_answers'):
+            sessions[name] = rows[name]
+        sessions['difficulty'] = self._encode_difficulties(rows['difficulty'])
+        attempts = _read_array(db.iter_attempt_rows(after, **kwargs), ATTEMPT_DTYPE)
+
+        self.sessions = np.concatenate([self.sessions, sessions])
+        self.attempts = np.concatenate([self.attempts, attempts])
+        self._attempt_session = None
+        return len(sessions)
+
+    def save(self, path):
+        """Write the columns to a snapshot file (atomically)."""
+        temp_path = f"{path}.{os.getpid()}.tmp"
+        with open(temp_path, 'wb') as f:
+            np.savez(f, version=SNAPSHOT_VERSION, sessions=self.sessions,
+                     attempts=self.attempts, difficulties=np.array(self.difficulties, dtype=str))
+        os.replace(temp_path, path)
+
+    @classmethod
+    def open(cls, path):
+        """Read a snapshot written by save(); raises ValueError (KeyError for
+        snapshots older than versioning) if it has another layout."""
+        with np.load(path) as data:
+            if int(data['version']) != SNAPSHOT_VERSION:
+                raise ValueError(f"Unsupported history snapshot version {int(data['version'])}")
+            return cls(data['sessions'], data['attempts'], data['difficulties'].tolist())
+
+
+def snapshot_path(db):
+    """Snapshot of the current profile's history, kept next to the database
+    file (None for in-memory databases)."""
+    if db.db_path == ':memory:':
+        return None
+    return f"{db.db_path}.profile{db.profile_id}.history.npz"
+
+
+def load_history(db, use_snapshot=True, chunk_size=None):
+    """Load the history of db as a History.
+
+    With use_snapshot, the columns saved by the previous load are reused and
+    only newer sessions are read from the database. The snapshot is
+    discarded if sessions it covers were deleted.
+    """
+    path = snapshot_path(db) if use_snapshot else None
+    history = None
+    if path and os.path.exists(path):
+        try:
+            history = History.open(path)
+        except (OSError, ValueError, KeyError) as e:
+            logger.warning("Ignoring unreadable history snapshot %s: %s", path, e)
+        if history is not None and db.count_sessions(history.last_session_id) != len(history.sessions):
+            history = None
+    if history is None:
+        history = History()
+
+    added = history.extend(db, chunk_size)
+    if path and added:
+        try:
+            history.save(path)
+        except OSError as e:
+            logger.warning("Could not save history snapshot %s: %s", path, e)
+    return history
+
+
+def local_days(epochs):
+    """Local calendar day (days since 1970-01-01) of each epoch time.
+
+    The UTC offset, which changes with daylight saving time, is looked up
+    once per distinct hour rather than per value.
+    """
+    hours, index = np.unique(epochs // SECONDS_PER_HOUR, return_inverse=True)
+    offsets = np.array(
+        [time.localtime(hour * SECONDS_PER_HOUR).tm_gmtoff for hour in hours.tolist()],
+        dtype=np.int64
+    )
+    return (epochs + offsets[index]) // SECONDS_PER_DAY
+
+
+def local_day_start(day):
+    """Epoch time of local midnight at the start of a local_days() day."""
+    year, month, mday = time.gmtime(int(day) * SECONDS_PER_DAY)[:3]
+    return int(time.mktime((year, month, mday, 0, 0, 0, 0, 0, -1)))
+
+
+def rolling_sum(values, window):
+    """Sum of each value and up to window - 1 values before it."""
+    cumulative = np.cumsum(values, dtype=np.float64)
+    result = cumulative.copy()
+    result[window:] -= cumulative[:-window]
+    return result
+
+
+def daily_trend(history, window=ROLLING_WINDOW):
+    """Per-day accuracy and answer time, plus rolling averages.
+
+    Days are local calendar days. Returns a dict of equally long arrays:
+    'day' (epoch of the local day start), 'questions', 'accuracy' (%),
+    'mean_time' (seconds), and 'rolling_accuracy' and 'rolling_time' over
+    the last `window` days with activity.
+    """
+    attempts = history.attempts
+    session_days = local_days(history.sessions['date'])
+    days, index = np.unique(session_days[history.attempt_session], return_inverse=True)
+    questions = np.bincount(index, minlength=len(days))
+    correct = np.bincount(index, weights=attempts['is_correct'], minlength=len(days))
+    seconds = np.bincount(index, weights=attempts['time_taken'], minlength=len(days))
+
+    rolling_questions = rolling_sum(questions, window)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return {
+            'day': np.array([local_day_start(day) for day in days.tolist()], dtype=np.int64),
+            'questions': questions,
+            'accuracy': correct / questions * 100,
+            'mean_time': seconds / questions,
+            'rolling_accuracy': rolling_sum(correct, window) / rolling_questions * 100,
+            'rolling_time': rolling_sum(seconds, window) / rolling_questions,
+        }
+
+
+def difficulty_breakdown(history, percentiles=PERCENTILES):
+    """Accuracy and answer time percentiles per difficulty.
+
+    Returns {difficulty: {'questions', 'accuracy', 'p50', ...}} with answer
+    time percentiles in seconds.
+    """
+    attempts = history.attempts
+    codes = history.attempt_difficulties()
+    order = np.argsort(codes, kind='stable')
+    sorted_codes = codes[order]
+    bounds = np.searchsorted(sorted_codes, np.arange(len(history.difficulties) + 1))
+
+    breakdown = {}
+    for code, name in enumerate(history.difficulties):
+        rows = order[bounds[code]:bounds[code + 1]]
+        if not len(rows):
+            continue
+        times = np.percentile(attempts['time_taken'][rows], percentiles)
+        stats = {
+            'questions': len(rows),
+            'accuracy': attempts['is_correct'][rows].mean() * 100,
+        }
+        stats.update({f"p{p}": float(t) for p, t in zip(percentiles, times)})
+        breakdown[name] = stats
+    return breakdown
+
+
+def fact_heatmap(history, min_range=None, max_range=None):
+    """Per-fact counts, accuracy and mean time over the multiplication grid.
+
+    Only multiplication attempts count; other operations' operands are not
+    facts of the grid. The grid covers operands min_range..max_range (both
+    axes); by default the range of those attempts, capped at
+    HEATMAP_MAX_SIDE operands.
+
+    Returns a dict with 'min_range', 'max_range' and side x side arrays
+    'questions', 'accuracy' (0..1, NaN for unseen facts) and 'mean_time',
+    indexed [num1 - min_range, num2 - min_range].
+    """
+    attempts = history.attempts[history.attempts['multiplication'] == 1]
+    num1, num2 = attempts['num1'], attempts['num2']
+    if min_range is None:
+        min_range = int(min(num1.min(), num2.min())) if len(attempts) else 0
+    if max_range is None:
+        max_range = int(max(num1.max(), num2.max())) if len(attempts) else min_range
+    max_range = min(max_range, min_range + HEATMAP_MAX_SIDE - 1)
+    side = max_range - min_range + 1
+
+    inside = ((num1 >= min_range) & (num1 <= max_range)
+              & (num2 >= min_range) & (num2 <= max_range))
+    cell = (num1[inside] - min_range) * side + (num2[inside] - min_range)
+    questions = np.bincount(cell, minlength=side * side)
+    correct = np.bincount(cell, weights=attempts['is_correct'][inside], minlength=side * side)
+    seconds = np.bincount(cell, weights=attempts['time_taken'][inside], minlength=side * side)
+
+    with np.errstate(invalid='ignore', divide='ignore'):
+        accuracy = correct / questions
+        mean_time = seconds / questions
+    return {
+        'min_range': min_range,
+        'max_range': max_range,
+        'questions': questions.reshape(side, side),
+        'accuracy': accuracy.reshape(side, side),
+        'mean_time': mean_time.reshape(side, side),
+    }
+
+
+def heatmap_rgba(accuracy):
+    """Color a heatmap accuracy grid as an RGBA uint8 image (rows = num1)."""
+    seen = ~np.isnan(accuracy)
+    weight = np.where(seen, accuracy, 0)[..., np.newaxis]
+    image = (HEATMAP_WRONG + (HEATMAP_RIGHT - HEATMAP_WRONG) * weight).astype(np.uint8)
+    image[~seen] = HEATMAP_UNSEEN
+    return image
+
+
+def build_report(db, use_snapshot=True):
+    """Load the history and compute everything the stats screen shows.
+
+    Returns a dict of display texts plus the heatmap as an RGBA image
+    ('heatmap') and its operand range ('heatmap_range').
+    """
+    history = load_history(db, use_snapshot)
+    attempts = history.attempts
+    if not len(attempts):
+        return {
+            'summary_text': "No answered questions yet.",
+            'difficulty_text': "",
+            'trend_text': "",
+            'heatmap': None,
+            'heatmap_range': None,
+        }
+
+    summary_text = (
+        f"Questions answered: {len(attempts)} in {len(history.sessions)} sessions\n"
+        f"Accuracy: {attempts['is_correct'].mean() * 100:.1f}%   "
+        f"Median time: {np.median(attempts['time_taken']):.1f}s"
+    )
+
+    difficulty_lines = []
+    for name, stats in difficulty_breakdown(history).items():
+        times = " / ".join(f"{stats[f'p{p}']:.1f}" for p in PERCENTILES)
+        difficulty_lines.append(
+            f"{name}: {stats['accuracy']:.0f}% of {stats['questions']}, "
+            f"p{'/'.join(map(str, PERCENTILES))} {times}s"
+        )
+
+    trend = daily_trend(history)
+    trend_lines = []
+    for i in range(max(0, len(trend['day']) - TREND_DAYS_SHOWN), len(trend['day'])):
+        day = time.strftime('%Y-%m-%d', time.localtime(int(trend['day'][i])))
+        trend_lines.append(
+            f"{day}: {trend['accuracy'][i]:.0f}% ({trend['rolling_accuracy'][i]:.0f}% "
+            f"{ROLLING_WINDOW}-day), {trend['mean_time'][i]:.1f}s"
+        )
+
+    heatmap = fact_heatmap(history)
+    return {
+        'summary_text': summary_text,
+        'difficulty_text': "\n".join(difficulty_lines),
+        'trend_text': "\n".join(trend_lines),
+        'heatmap': heatmap_rgba(heatmap['accuracy']),
+        'heatmap_range': (heatmap['min_range'], heatmap['max_range']),
+    }
@@ -0,0 +1,74 @@
+"""Asynchronous access to the database from the Kivy UI thread."""
+import logging
+from concurrent.futures import ThreadPoolExecutor
+
+
+logger = logging.getLogger(__name__)
+
+
+def _kivy_dispatch(func):
+    """Run func on the Kivy main thread at the next frame."""
+    from kivy.clock import Clock
+    Clock.schedule_once(lambda dt: func(), 0)
+
+
+class AsyncDatabase:
+    """Runs Database calls on a dedicated worker thread.
+
+    Calls are executed one at a time in submission order, so a read submitted
+    after a write always sees that write. Results are handed back through
+    callbacks that run on the UI thread, so callbacks may touch widgets.
+    """
+
+    def __init__(self, db, dispatch=None):
+        """Wrap a Database; dispatch schedules callbacks on the UI thread."""
+        self.db = db
+        self._dispatch = dispatch or _kivy_dispatch
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='database')
+
+    def submit(self, method, *args, callback=None, error_callback=None, **kwargs):
+        """Call a Database method in the background.
+
+        Args:
+            method: Name of the Database method to call.
+            callback: Called on the UI thread with the method's return value.
+            error_callback: Called on the UI thread with the exception if the
+                call fails. Failures are logged either way.
+
+        Returns:
+            A concurrent.futures.Future for the call.
+        """
+        future = self._executor.submit(getattr(self.db, method), *args, **kwargs)
+        future.add_done_callback(
+            lambda f: self._deliver(method, f, callback, error_callback)
+        )
+        return future
+
+    def run(self, func, *args, callback=None, error_callback=None, **kwargs):
+        """Run func(db, *args, **kwargs) on the worker thread.
+
+        Useful for work that combines several Database calls or processes
+        their results, which should not happen on the UI thread either.
+        Callbacks behave as in submit().
+        """
+        future = self._executor.submit(func, self.db, *args, **kwargs)
+        name = getattr(func, '__name__', 'function')
+        future.add_done_callback(
+            lambda f: self._deliver(name, f, callback, error_callback)
+        )
+        return future
+
+    def _deliver(self, method, future, callback, error_callback):
+        """Hand a finished call's outcome to the UI thread."""
+        error = future.exception()
+        if error is not None:
+            logger.error("Database call %s failed: %s", method, error)
+            if error_callback:
+                self._dispatch(lambda: error_callback(error))
+        elif callback:
+            result = future.result()
+            self._dispatch(lambda: callback(result))
+
+    def close(self):
+        """Wait for pending calls to finish and stop the worker thread."""
+        self._executor.shutdown(wait=True)
@@ -0,0 +1,98 @@
+"""Write-behind persistence of question attempts."""
+import logging
+import queue
+import threading
+import time
+
+
+logger = logging.getLogger(__name__)
+
+# Default flush triggers
+DEFAULT_BATCH_SIZE = 50
+DEFAULT_FLUSH_INTERVAL = 5.0  # seconds
+
+_FLUSH = object()
+_STOP = object()
+
+
+class AttemptWriter:
+    """Buffers question attempts and writes them on a background thread.
+
+    Callers only enqueue attempts, which never touches the disk. The worker
+    thread collects them and stores each batch with one executemany
+    transaction when the buffer reaches batch_size, when flush_interval
+    seconds have passed since the oldest buffered attempt, or when a flush is
+    requested (e.g. at the end of a session).
+    """
+
+    def __init__(self, db, batch_size=DEFAULT_BATCH_SIZE,
+                 flush_interval=DEFAULT_FLUSH_INTERVAL):
+        """Start the writer thread for the given Database."""
+        self.db = db
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self._queue = queue.Queue()
+        self._thread = threading.Thread(
+            target=self._run, name='attempt-writer', daemon=True
+        )
+        self._thread.start()
+
+    def add(self, attempt):
+        """Queue one attempt tuple (ATTEMPT_COLUMNS order) for writing."""
+        self._queue.put(attempt)
+
+    def flush(self):
+        """Ask the writer to store everything queued so far.
+
+        Returns a threading.Event that is set once the flush has completed.
+        The caller may wait on it, but does not have to.
+        """
+        done = threading.Event()
+        self._queue.put((_FLUSH, done))
+        return done
+
+    def close(self, timeout=None):
+        """Flush pending attempts and stop the writer thread."""
+        if self._thread.is_alive():
+            self._queue.put((_STOP, None))
+            self._thread.join(timeout)
+
+    def _run(self):
+        """Worker loop collecting attempts into batches."""
+        buffer = []
+        deadline = None
+        while True:
+            timeout = None if deadline is None else max(0.0, deadline - time.monotonic())
+            try:
+                item = self._queue.get(timeout=timeout)
+            except queue.Empty:
+                item = None
+
+            if item is None or (isinstance(item, tuple) and item[0] in (_FLUSH, _STOP)):
+                self._write(buffer)
+                buffer = []
+                deadline = None
+                if item is not None:
+                    command, done = item
+                    if done is not None:
+                        done.set()
+                    if command is _STOP:
+                        return
+                continue
+
+            buffer.append(item)
+            if deadline is None:
+                deadline = time.monotonic() + self.flush_interval
+            if len(buffer) >= self.batch_size:
+                self._write(buffer)
+                buffer = []
+                deadline = None
+
+    def _write(self, batch):
+        """Store one batch, logging instead of raising on failure."""
+        if not batch:
+            return
+        try:
+            self.db.add_question_attempts(batch)
+        except Exception:
+            logger.exception("Failed to store %d question attempts", len(batch))
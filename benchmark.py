@@ -0,0 +1,583 @@
+#!/usr/bin/env python
+"""Benchmarks for Brain Trainer hot paths.
+
+Each benchmark reports latency (mean, p50, p99 in milliseconds) and, for
+operations run with memory tracking, the peak memory allocated per call and
+the number of garbage collections triggered.
+
+Usage:
+    python benchmark.py                        # run every available benchmark
+    python benchmark.py popup                  # run selected benchmarks
+    python benchmark.py database --db-sizes 1000 100000
+    python benchmark.py replay replay_screen --session-logs recordings/*.jsonl
+    python benchmark.py --output results.json  # save results for later
+    python benchmark.py --compare results.json # compare with saved results
+    python benchmark.py database --workdir bench   # keep the created databases
+"""
+import argparse
+import gc
+import importlib.util
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+from latency import summarize
+
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+# Command line options are for this script, not for Kivy
+os.environ['KIVY_NO_ARGS'] = '1'
+
+# name -> (function, required modules)
+BENCHMARKS = {}
+
+
+def benchmark(name, requires=()):
+    """Register a benchmark function returning {case: stats}."""
+    def register(func):
+        BENCHMARKS[name] = (func, tuple(requires))
+        return func
+    return register
+
+
+def measure(operation, repeat=200, memory_repeat=50, warmup=5):
+    """Run operation() repeatedly and summarize its cost.
+
+    Timing and memory are measured in separate passes because tracemalloc
+    slows down every allocation.
+    """
+    for _ in range(warmup):
+        operation()
+
+    gc_before = sum(stat['collections'] for stat in gc.get_stats())
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        operation()
+        timings.append((time.perf_counter() - start) * 1000)
+    gc_collections = sum(stat['collections'] for stat in gc.get_stats()) - gc_before
+
+    peaks = []
+    if memory_repeat:
+        tracemalloc.start()
+        try:
+            for _ in range(memory_repeat):
+                tracemalloc.reset_peak()
+                current = tracemalloc.get_traced_memory()[0]
+                operation()
+                peaks.append(tracemalloc.get_traced_memory()[1] - current)
+        finally:
+            tracemalloc.stop()
+
+    stats = summarize(timings)
+    stats['gc_collections'] = gc_collections
+    if peaks:
+        stats['alloc_kib'] = statistics.fmean(peaks) / 1024
+    return stats
+
+
+_APP = None
+
+
+def kivy_app():
+    """Build the app once without running its event loop."""
+    global _APP
+    if _APP is None:
+        import main
+        from kivy.app import App
+
+        app = main.BrainTrainerApp()
+        app.load_kv(filename=os.path.join(HERE, 'braintrainer.kv'))
+        App._running_app = app
+        app.root = app.build()
+        _APP = app
+    return _APP
+
+
+@benchmark('popup', requires=('kivy',))
+def bench_popup():
+    """Wrong answer: show the result popup, then press Enter for the next question."""
+    from kivy.core.window import Window
+    import main
+
+    screen = kivy_app().root.get_screen('training')
+    screen.setup_training('Easy', main.UNLIMITED_TIME)
+    screen.on_enter()
+
+    def wrong_answer():
+        screen.check_answer('-1')
+        Window.dispatch('on_keyboard', main.KEYCODE_ENTER, 0, '', [])
+
+    try:
+        return {'wrong_answer': measure(wrong_answer, repeat=300)}
+    finally:
+        screen.on_leave()
+
+
+@benchmark('theme', requires=('kivy',))
+def bench_theme():
+    """Theme switch with every screen built, including the frame's canvas update."""
+    from kivy.lang import Builder
+    from theme import PALETTES
+
+    app = kivy_app()
+    for name in list(app.root._factories):
+        app.root.get_screen(name)
+
+    def switch_theme():
+        app.theme_mode = 'dark' if app.theme_mode == 'light' else 'light'
+        # Canvas expressions are re-evaluated once per frame
+        Builder.sync()
+
+    stats = measure(switch_theme, repeat=200)
+    changed = [key for key, color in PALETTES['light'].items() if PALETTES['dark'][key] != color]
+    stats['bindings'] = sum(len(app.theme.get_property_observers(key)) for key in changed)
+    return {'switch': stats}
+
+
+# Stored sessions the database benchmarks run against (--db-sizes)
+DB_SIZES = (1000, 100000, 1000000)
+
+# Answered questions per session for the results benchmarks
+HISTORY_SIZES = (10, 100, 1000, 10000)
+
+# Sessions inserted per transaction while filling a benchmark database
+SEED_BATCH = 50000
+
+
+def _seed_sessions(db, start, stop):
+    """Store sessions number start..stop-1, spread over days and difficulties."""
+    difficulties = ('Easy', 'Medium', 'Hard', 'Custom')
+    base_date = 1_600_000_000
+    for first in range(start, stop, SEED_BATCH):
+        db.import_session_records(
+            (f"{number:032x}", difficulties[number % 4], 20, number % 21, 10,
+             base_date + number * 600)
+            for number in range(first, min(first + SEED_BATCH, stop))
+        )
+
+
+def _throughput(stats):
+    """Add operations per second to the stats of one operation."""
+    stats['ops_per_s'] = 1000 / stats['mean_ms'] if stats['mean_ms'] else 0.0
+    return stats
+
+
+@benchmark('database')
+def bench_database():
+    """Session inserts and statistics / recent-session reads at each DB_SIZES."""
+    from database import Database
+
+    db = Database('benchmark.db')
+    results = {}
+    stored = 0
+    try:
+        for size in sorted(DB_SIZES):
+            _seed_sessions(db, stored, size)
+            stored = size
+            results[f"add_session.{size}"] = _throughput(measure(
+                lambda: db.add_training_session('Easy', 20, 15, 10),
+                repeat=200, memory_repeat=0
+            ))
+            stored += 200 + 5  # measured calls and warmup
+            results[f"statistics.{size}"] = measure(db.get_statistics, repeat=500)
+            results[f"statistics_difficulty.{size}"] = measure(
+                lambda: db.get_statistics('Hard'), repeat=500
+            )
+            results[f"recent_sessions.{size}"] = measure(db.get_recent_sessions, repeat=500)
+    finally:
+        db.close()
+    return results
+
+
+@benchmark('questions')
+def bench_questions():
+    """Question generation as the training screen does it, per difficulty
+    and generator."""
+    import random
+    from generators import GENERATORS
+    from question_pipeline import QuestionPipeline
+    from session_engine import DIFFICULTY_RANGES, TrainingSession
+
+    results = {}
+    for difficulty in DIFFICULTY_RANGES:
+        session = TrainingSession(difficulty, 0, rng=random.Random(1))
+        results[f"next_question.{difficulty}"] = _throughput(
+            measure(session.next_question, repeat=20000, memory_repeat=200)
+        )
+
+    # Other drills draw their questions in batches
+    for name in GENERATORS:
+        if name != 'multiplication':
+            session = TrainingSession(name, 0, 0, 100, rng=random.Random(1))
+            results[f"next_question.{name}"] = _throughput(
+                measure(session.next_question, repeat=20000, memory_repeat=200)
+            )
+
+    # The screen takes questions prepared by the pipeline thread
+    session = TrainingSession('Hard', 0, rng=random.Random(1))
+    pipeline = QuestionPipeline(session.pick)
+    pipeline.start()
+
+    def pipelined_question():
+        session.next_question(pipeline.next().question)
+
+    try:
+        results['pipeline.Hard'] = _throughput(
+            measure(pipelined_question, repeat=20000, memory_repeat=200)
+        )
+    finally:
+        pipeline.stop()
+    return results
+
+
+def _question_history(size):
+    """History of a finished session with `size` answered questions."""
+    import random
+    from session_engine import TrainingSession
+    from simulate import SimulatedClock, SimulatedLearner
+
+    rng = random.Random(size)
+    clock = SimulatedClock()
+    session = TrainingSession('Hard', 10, clock=clock, rng=rng)
+    learner = SimulatedLearner(rng)
+    for _ in range(size):
+        question = session.next_question()
+        answer, seconds = learner.respond(question)
+        clock.advance(seconds)
+        session.answer(answer)
+    return session
+
+
+@benchmark('results')
+def bench_results():
+    """Summary text and result rows of a finished session, per HISTORY_SIZES."""
+    from session_engine import summarize_history
+
+    results = {}
+    for size in HISTORY_SIZES:
+        session = _question_history(size)
+        results[f"summarize.{size}"] = measure(
+            lambda: summarize_history(
+                session.history, session.correct_answers, session.total_questions
+            ),
+            repeat=max(20, 20000 // size), memory_repeat=max(5, 2000 // size)
+        )
+    return results
+
+
+@benchmark('results_screen', requires=('kivy',))
+def bench_results_screen():
+    """ResultsScreen.show_results per HISTORY_SIZES; row widgets come next frame."""
+    screen = kivy_app().root.get_screen('results')
+    results = {}
+    for size in HISTORY_SIZES:
+        session = _question_history(size)
+        results[f"show_results.{size}"] = measure(
+            lambda: screen.show_results(
+                session.history, session.correct_answers, session.total_questions
+            ),
+            repeat=max(20, 20000 // size), memory_repeat=max(5, 2000 // size)
+        )
+    return results
+
+
+@benchmark('tracing')
+def bench_tracing():
+    """Cost of tracing an operation with three phases, disabled and enabled."""
+    from tracing import Tracer
+
+    results = {}
+    for enabled in (False, True):
+        tracer = Tracer(enabled=enabled)
+
+        def traced_operation():
+            trace = tracer.begin('operation')
+            trace.phase('first')
+            trace.phase('second')
+            trace.phase('third')
+            trace.end()
+
+        results['enabled' if enabled else 'disabled'] = measure(
+            traced_operation, repeat=20000, memory_repeat=200
+        )
+    return results
+
+
+# Recorded sessions replayed by the replay benchmarks (--session-logs); a
+# simulated session of REPLAY_QUESTIONS questions is recorded when none
+# are given
+SESSION_LOGS = ()
+REPLAY_QUESTIONS = 500
+REPLAY_REPEAT = 5
+
+
+def _session_logs():
+    """(name, SessionLog) of every session log to replay."""
+    from session_log import SessionLog
+    from simulate import simulate
+
+    paths = SESSION_LOGS
+    if not paths:
+        path = 'simulated_session.jsonl'
+        if not os.path.exists(path):
+            simulate(REPLAY_QUESTIONS, 'Hard', seed=1, record=path)
+        paths = (path,)
+    return [(os.path.splitext(os.path.basename(path))[0], SessionLog.read(path))
+            for path in paths]
+
+
+def _per_question(stats, questions):
+    """Add questions per second to the stats of replaying a whole session."""
+    stats['questions_per_s'] = questions * 1000 / stats['mean_ms'] if stats['mean_ms'] else 0.0
+    return stats
+
+
+@benchmark('replay')
+def bench_replay():
+    """Recorded sessions replayed at full speed through the session engine,
+    alone and with attempts and the session stored as in the app."""
+    from database import Database
+    from session_log import replay
+
+    results = {}
+    db = Database('replay.db')
+    try:
+        for name, log in _session_logs():
+            questions = len(log.questions())
+            results[f"engine.{name}"] = _per_question(measure(
+                lambda: replay(log), repeat=REPLAY_REPEAT * 4, memory_repeat=0, warmup=1
+            ), questions)
+            results[f"persist.{name}"] = _per_question(measure(
+                lambda: replay(log, db), repeat=REPLAY_REPEAT, memory_repeat=0, warmup=1
+            ), questions)
+    finally:
+        db.close()
+    return results
+
+
+@benchmark('replay_screen', requires=('kivy',))
+def bench_replay_screen():
+    """Recorded sessions replayed at full speed through the training screen:
+    each answer (check_answer, plus Next after a wrong one) and the end.
+
+    Every question the screen shows is checked against the log, so a replay
+    that drifts from the recorded session fails instead of measuring
+    another one.
+    """
+    from session_log import ANSWER, END, QUESTION, ReplaySession
+    from simulate import SimulatedClock
+
+    screen = kivy_app().root.get_screen('training')
+    results = {}
+    for name, log in _session_logs():
+        answer_timings = []
+        end_timings = []
+        for _ in range(REPLAY_REPEAT):
+            clock = SimulatedClock()
+            session = ReplaySession(log, clock)
+            screen.start_session(session)
+            for kind, offset, *payload in log.events:
+                clock.now = offset
+                if kind == QUESTION:
+                    session.check_question(payload)
+                    continue
+                start = time.perf_counter()
+                if kind == ANSWER:
+                    screen.check_answer(payload[0])
+                    if not session.history[-1]['is_correct']:
+                        screen.popup_next()
+                    answer_timings.append((time.perf_counter() - start) * 1000)
+                elif kind == END:
+                    screen.end_training_session()
+                    end_timings.append((time.perf_counter() - start) * 1000)
+        results[f"answer.{name}"] = summarize(answer_timings)
+        results[f"end.{name}"] = summarize(end_timings)
+    return results
+
+
+# Cold start of the app in a fresh interpreter; prints timings as JSON
+STARTUP_SCRIPT = '''
+import json, os, sys, time
+start = time.perf_counter()
+os.environ['KIVY_NO_ARGS'] = '1'
+sys.path.insert(0, {here!r})
+import main
+imported = time.perf_counter()
+from kivy.app import App
+app = main.BrainTrainerApp()
+App._running_app = app
+app.load_kv(filename=os.path.join({here!r}, 'braintrainer.kv'))
+app.root = app.build()
+built = time.perf_counter()
+for name in list(app.root._factories):
+    app.root.get_screen(name)
+app.on_stop()
+print(json.dumps({{
+    'import': imported - start,
+    'build': built - imported,
+    'screens': app.root.build_times,
+}}))
+'''
+
+# Cold starts measured per startup benchmark run
+STARTUP_RUNS = 5
+
+
+def _main_imports(importtime_output):
+    """Cumulative seconds of each module imported directly by main.
+
+    Parses the stderr of `python -X importtime`, where a module's own
+    imports are listed before it, indented one level deeper.
+    """
+    pending = []
+    for line in importtime_output.splitlines():
+        if not line.startswith('import time:') or '|' not in line:
+            continue
+        _, cumulative, name = line.split('|')
+        if not cumulative.strip().isdigit():
+            continue  # header line
+        depth = (len(name) - len(name.lstrip())) // 2
+        children = []
+        while pending and pending[-1][0] > depth:
+            children.append(pending.pop())
+        if name.strip() == 'main':
+            return {module: seconds for level, module, seconds in reversed(children)
+                    if level == depth + 1}
+        pending.append((depth, name.strip(), int(cumulative) / 1e6))
+    return {}
+
+
+@benchmark('startup', requires=('kivy',))
+def bench_startup():
+    """Cold start: import time per module, app build and first build of each screen."""
+    samples = {}
+    script = STARTUP_SCRIPT.format(here=HERE)
+    for _ in range(STARTUP_RUNS):
+        result = subprocess.run(
+            [sys.executable, '-X', 'importtime', '-c', script],
+            capture_output=True, text=True, check=True
+        )
+        timings = json.loads(result.stdout.strip().splitlines()[-1])
+        run_samples = {'import': timings['import'], 'build': timings['build']}
+        run_samples.update(
+            (f"screen.{name}", seconds) for name, seconds in timings['screens'].items()
+        )
+        run_samples.update(
+            (f"import.{module}", seconds)
+            for module, seconds in _main_imports(result.stderr).items()
+        )
+        for case, seconds in run_samples.items():
+            samples.setdefault(case, []).append(seconds * 1000)
+    return {case: summarize(timings) for case, timings in samples.items()}
+
+
+def _git_revision():
+    """Short hash of the checked out commit, if available."""
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], cwd=HERE,
+            capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run(names):
+    """Run the named benchmarks and return the results document."""
+    results = {}
+    for name in names:
+        func, requires = BENCHMARKS[name]
+        missing = [module for module in requires if importlib.util.find_spec(module) is None]
+        if missing:
+            print(f"Skipping {name}: requires {', '.join(missing)}")
+            continue
+        print(f"Running {name}...")
+        results[name] = func()
+    return {
+        'revision': _git_revision(),
+        'python': platform.python_version(),
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'results': results,
+    }
+
+
+def print_results(document, baseline=None):
+    """Print results, with the change against a baseline when given."""
+    base_results = (baseline or {}).get('results', {})
+    for name, cases in document['results'].items():
+        for case, stats in cases.items():
+            line = f"{name}.{case}:"
+            for metric, value in stats.items():
+                if metric == 'runs':
+                    continue
+                line += f" {metric}={value:,.3f}"
+                old = base_results.get(name, {}).get(case, {}).get(metric)
+                if old:
+                    line += f" ({(value - old) / old * 100:+.0f}%)"
+            print(f"  {line}")
+
+
+def main(argv=None):
+    """Command line entry point."""
+    global DB_SIZES, SESSION_LOGS
+    parser = argparse.ArgumentParser(description='Run Brain Trainer benchmarks')
+    parser.add_argument('names', nargs='*', help=f"Benchmarks to run: {', '.join(BENCHMARKS)}")
+    parser.add_argument('--output', help='Write results to this JSON file')
+    parser.add_argument('--compare', help='Compare with results saved by --output')
+    parser.add_argument('--db-sizes', type=int, nargs='+', default=DB_SIZES,
+                        help='Stored sessions for the database benchmark')
+    parser.add_argument('--session-logs', nargs='+', default=(),
+                        help='Recorded sessions for the replay benchmarks')
+    parser.add_argument('--workdir',
+                        help='Keep the databases and files benchmarks create in this '
+                             'directory (default: a temporary one, removed at exit)')
+    args = parser.parse_args(argv)
+
+    unknown = [name for name in args.names if name not in BENCHMARKS]
+    if unknown:
+        parser.error(f"Unknown benchmark(s): {', '.join(unknown)}")
+    DB_SIZES = tuple(args.db_sizes)
+    SESSION_LOGS = tuple(os.path.abspath(path) for path in args.session_logs)
+
+    output = os.path.abspath(args.output) if args.output else None
+    baseline = None
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+
+    # Benchmarks create databases and settings files; keep them out of the tree
+    temp_dir = None
+    if args.workdir:
+        workdir = os.path.abspath(args.workdir)
+        os.makedirs(workdir, exist_ok=True)
+    else:
+        temp_dir = tempfile.TemporaryDirectory(prefix='brain_trainer_bench_')
+        workdir = temp_dir.name
+    previous_dir = os.getcwd()
+    os.chdir(workdir)
+    sys.path.insert(0, HERE)
+    try:
+        document = run(args.names or list(BENCHMARKS))
+    finally:
+        os.chdir(previous_dir)
+        if temp_dir:
+            temp_dir.cleanup()
+    print_results(document, baseline)
+
+    if output:
+        with open(output, 'w') as f:
+            json.dump(document, f, indent=2)
+        print(f"Results written to {output}")
+    return 0
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
@@ -1,88 +1,982 @@
 """Database module for brain training app."""
+import json
+import random
 import sqlite3
 import os
+import threading
+import time
+import uuid
 from datetime import datetime
 
+from scheduler import EMA_ALPHA
+
+
+# SQL statements are kept as module constants so every call passes the exact
+# same text to sqlite3, which lets the per-connection statement cache reuse
+# the prepared statement instead of re-parsing it.
+INSERT_SESSION_SQL = '''
+    INSERT INTO training_sessions
+    (difficulty, total_questions, correct_answers, time_per_question, date, uid, profile_id)
+    VALUES (?, ?, ?, ?, ?, ?, ?)
+'''
+
+# Column order of the tuples passed to add_question_attempts()
+ATTEMPT_COLUMNS = (
+    'session_uid', 'seq', 'num1', 'num2', 'question', 'user_answer',
+    'correct_answer', 'is_correct', 'time_taken'
+)
+
+INSERT_ATTEMPT_SQL = f'''
+    INSERT OR IGNORE INTO question_attempts ({', '.join(ATTEMPT_COLUMNS)})
+    VALUES ({', '.join('?' * len(ATTEMPT_COLUMNS))})
+'''
+
+STATISTICS_SQL = '''
+    SELECT total_sessions, total_questions, correct_answers
+    FROM session_totals
+    WHERE profile_id = ? AND difficulty = ?
+'''
+
+COMPUTED_TOTALS_SQL = '''
+    SELECT profile_id, difficulty, COUNT(*), SUM(total_questions), SUM(correct_answers)
+    FROM training_sessions
+    GROUP BY profile_id, difficulty
+'''
+
+# Every query below reads one profile's sessions. The profile indexes hold
+# all the columns these queries return, so they never visit the table rows
+# of other profiles, however many students share the database.
+RECENT_SESSIONS_SQL = '''
+    SELECT difficulty, total_questions, correct_answers, date
+    FROM training_sessions
+    WHERE profile_id = ?
+    ORDER BY date DESC, id DESC
+    LIMIT ?
+'''
+
+# Keyset pagination: rows strictly older than the (date, id) cursor, newest
+# first. Both orderings are served directly by the profile indexes.
+SESSION_COLUMNS = 'id, difficulty, total_questions, correct_answers, time_per_question, date'
+
+SESSION_PAGE_SQL = {
+    (False, False): f'''
+        SELECT {SESSION_COLUMNS} FROM training_sessions
+        WHERE profile_id = ?
+        ORDER BY date DESC, id DESC LIMIT ?
+    ''',
+    (True, False): f'''
+        SELECT {SESSION_COLUMNS} FROM training_sessions
+        WHERE profile_id = ? AND (date, id) < (?, ?)
+        ORDER BY date DESC, id DESC LIMIT ?
+    ''',
+    (False, True): f'''
+        SELECT {SESSION_COLUMNS} FROM training_sessions
+        WHERE profile_id = ? AND difficulty = ?
+        ORDER BY date DESC, id DESC LIMIT ?
+    ''',
+    (True, True): f'''
+        SELECT {SESSION_COLUMNS} FROM training_sessions
+        WHERE profile_id = ? AND difficulty = ? AND (date, id) < (?, ?)
+        ORDER BY date DESC, id DESC LIMIT ?
+    ''',
+}
+
+# Bulk reads for analytics, in insertion order so a reader can resume
+# after the last session id it has seen
+HISTORY_SESSIONS_SQL = '''
+    SELECT id, date, difficulty, total_questions, correct_answers
+    FROM training_sessions
+    WHERE profile_id = ? AND id > ?
+    ORDER BY id
+'''
+
+HISTORY_ATTEMPTS_SQL = '''
+    SELECT s.id, a.num1, a.num2, a.is_correct, a.time_taken,
+           a.question LIKE '% x %'
+    FROM training_sessions s
+    JOIN question_attempts a ON a.session_uid = s.uid
+    WHERE s.profile_id = ? AND s.id > ?
+    ORDER BY s.id, a.seq
+'''
+
+FACT_STATS_SQL = '''
+    SELECT num1, num2, attempts, ema_error, ema_time
+    FROM fact_stats
+    WHERE profile_id = ? AND num1 BETWEEN ? AND ? AND num2 BETWEEN ? AND ?
+'''
+
+# Full session records for export and import, keyed by uid
+SESSION_RECORD_COLUMNS = (
+    'uid', 'difficulty', 'total_questions', 'correct_answers',
+    'time_per_question', 'date'
+)
+
+EXPORT_SESSIONS_SQL = f'''
+    SELECT {', '.join(SESSION_RECORD_COLUMNS)} FROM training_sessions
+    WHERE profile_id = ?
+    ORDER BY id
+'''
+
+EXPORT_ATTEMPTS_SQL = f'''
+    SELECT {', '.join('a.' + column for column in ATTEMPT_COLUMNS)}
+    FROM training_sessions s
+    JOIN question_attempts a ON a.session_uid = s.uid
+    WHERE s.profile_id = ?
+    ORDER BY s.id, a.seq
+'''
+
+# Imported sessions join the profile given as the last parameter
+IMPORT_SESSION_SQL = f'''
+    INSERT OR IGNORE INTO training_sessions ({', '.join(SESSION_RECORD_COLUMNS)}, profile_id)
+    VALUES ({', '.join('?' * (len(SESSION_RECORD_COLUMNS) + 1))})
+'''
+
+# Sync: sessions of every profile after a device's high-water mark, with
+# their attempts, in id order
+SYNC_SESSIONS_SQL = f'''
+    SELECT s.id, {', '.join('s.' + column for column in SESSION_RECORD_COLUMNS)}, p.name
+    FROM training_sessions s
+    JOIN profiles p ON p.id = s.profile_id
+    WHERE s.id > ?
+    ORDER BY s.id
+    LIMIT ?
+'''
+
+SYNC_ATTEMPTS_SQL = f'''
+    SELECT {', '.join('a.' + column for column in ATTEMPT_COLUMNS)}
+    FROM training_sessions s
+    JOIN question_attempts a ON a.session_uid = s.uid
+    WHERE s.id > ? AND s.id <= ?
+    ORDER BY s.id, a.seq
+'''
+
+SYNC_STATE_SQL = 'SELECT device_id, last_session_id FROM sync_state WHERE server = ?'
+
+PROFILES_SQL = 'SELECT id, name FROM profiles ORDER BY name'
+
+CREATE_PROFILE_SQL = 'INSERT INTO profiles (name, created) VALUES (?, ?)'
+
+# Default number of rows fetched per chunk by the iter_* methods
+FETCH_CHUNK_ROWS = 10000
+
+# Settings are stored as key -> JSON-encoded value
+SETTINGS_SQL = 'SELECT key, value FROM settings'
+
+SAVE_SETTING_SQL = 'INSERT OR REPLACE INTO settings (key, value) VALUES (?, ?)'
+
+# Number of prepared statements each connection keeps cached
+STATEMENT_CACHE_SIZE = 64
+
+# Key of the session_totals row holding totals across all difficulties
+OVERALL_KEY = '*'
+
+# Profile owning the history recorded before profiles existed
+DEFAULT_PROFILE_ID = 1
+DEFAULT_PROFILE_NAME = 'Default'
+
+# Seconds a statement waits for another connection's lock before failing.
+# Several devices may share one database file (use journal_mode='DELETE'
+# on network volumes, which do not support WAL).
+BUSY_TIMEOUT = 5.0
+# Write transactions that still find the database locked are retried,
+# waiting WRITE_BACKOFF * 2**n seconds (with jitter) before retry n
+WRITE_RETRIES = 5
+WRITE_BACKOFF = 0.05
+
+
+def is_lock_error(error):
+    """Whether an OperationalError means another connection holds a lock."""
+    message = str(error)
+    return 'locked' in message or 'busy' in message
+
+
+def _create_sessions_table(conn):
+    """Schema version 1: the original training sessions table."""
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS training_sessions (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            difficulty TEXT NOT NULL,
+            total_questions INTEGER NOT NULL,
+            correct_answers INTEGER NOT NULL,
+            time_per_question INTEGER NOT NULL,
+            date TEXT NOT NULL
+        )
+    ''')
+
+
+def _create_session_totals(conn):
+    """Schema version 2: totals kept up to date by triggers."""
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS session_totals (
+            difficulty TEXT PRIMARY KEY,
+            total_sessions INTEGER NOT NULL DEFAULT 0,
+            total_questions INTEGER NOT NULL DEFAULT 0,
+            correct_answers INTEGER NOT NULL DEFAULT 0
+        )
+    ''')
+    _create_session_totals_triggers(conn)
+    _rebuild_session_totals(conn)
+
+
+def _create_session_totals_triggers(conn):
+    """Create the triggers that keep session_totals in sync."""
+    # Triggers run inside the inserting transaction, so the totals can never
+    # disagree with the rows that produced them
+    conn.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS session_totals_insert
+        AFTER INSERT ON training_sessions
+        BEGIN
+            INSERT OR IGNORE INTO session_totals (difficulty)
+            VALUES ('{OVERALL_KEY}'), (NEW.difficulty);
+            UPDATE session_totals SET
+                total_sessions = total_sessions + 1,
+                total_questions = total_questions + NEW.total_questions,
+                correct_answers = correct_answers + NEW.correct_answers
+            WHERE difficulty IN ('{OVERALL_KEY}', NEW.difficulty);
+        END
+    ''')
+    conn.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS session_totals_delete
+        AFTER DELETE ON training_sessions
+        BEGIN
+            UPDATE session_totals SET
+                total_sessions = total_sessions - 1,
+                total_questions = total_questions - OLD.total_questions,
+                correct_answers = correct_answers - OLD.correct_answers
+            WHERE difficulty IN ('{OVERALL_KEY}', OLD.difficulty);
+        END
+    ''')
+
+
+def _rebuild_session_totals(conn):
+    """Recompute session_totals from the training_sessions table."""
+    conn.execute('DELETE FROM session_totals')
+    conn.execute('''
+        INSERT INTO session_totals
+        (difficulty, total_sessions, total_questions, correct_answers)
+        SELECT difficulty, COUNT(*), SUM(total_questions), SUM(correct_answers)
+        FROM training_sessions
+        GROUP BY difficulty
+    ''')
+    conn.execute(f'''
+        INSERT INTO session_totals
+        (difficulty, total_sessions, total_questions, correct_answers)
+        SELECT '{OVERALL_KEY}', COUNT(*), COALESCE(SUM(total_questions), 0),
+               COALESCE(SUM(correct_answers), 0)
+        FROM training_sessions
+    ''')
+
+
+def _iso_to_epoch(value):
+    """Convert a legacy ISO-8601 (local time) date to epoch seconds."""
+    try:
+        return int(datetime.fromisoformat(value).timestamp())
+    except (TypeError, ValueError):
+        return 0
+
+
+def _index_session_dates(conn):
+    """Schema version 3: integer epoch dates with indexes for history queries."""
+    conn.create_function('iso_to_epoch', 1, _iso_to_epoch, deterministic=True)
+    conn.execute('''
+        CREATE TABLE training_sessions_new (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            difficulty TEXT NOT NULL,
+            total_questions INTEGER NOT NULL,
+            correct_answers INTEGER NOT NULL,
+            time_per_question INTEGER NOT NULL,
+            date INTEGER NOT NULL
+        )
+    ''')
+    conn.execute('''
+        INSERT INTO training_sessions_new
+        (id, difficulty, total_questions, correct_answers, time_per_question, date)
+        SELECT id, difficulty, total_questions, correct_answers, time_per_question,
+               iso_to_epoch(date)
+        FROM training_sessions
+    ''')
+    # Dropping the old table also drops its triggers; the totals themselves
+    # are unaffected because the rows are carried over unchanged
+    conn.execute('DROP TABLE training_sessions')
+    conn.execute('ALTER TABLE training_sessions_new RENAME TO training_sessions')
+    _create_session_totals_triggers(conn)
+    conn.execute(
+        'CREATE INDEX IF NOT EXISTS idx_training_sessions_date '
+        'ON training_sessions (date)'
+    )
+    conn.execute(
+        'CREATE INDEX IF NOT EXISTS idx_training_sessions_difficulty_date '
+        'ON training_sessions (difficulty, date)'
+    )
+
+
+def _create_question_attempts(conn):
+    """Schema version 4: session uids and per-question attempts."""
+    # A uid identifies a session before its row exists, so attempts can be
+    # written while the session is still running
+    conn.execute('ALTER TABLE training_sessions ADD COLUMN uid TEXT')
+    conn.execute(
+        'UPDATE training_sessions SET uid = lower(hex(randomblob(16))) '
+        'WHERE uid IS NULL'
+    )
+    conn.execute(
+        'CREATE UNIQUE INDEX IF NOT EXISTS idx_training_sessions_uid '
+        'ON training_sessions (uid)'
+    )
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS question_attempts (
+            session_uid TEXT NOT NULL,
+            seq INTEGER NOT NULL,
+            num1 INTEGER NOT NULL,
+            num2 INTEGER NOT NULL,
+            question TEXT NOT NULL,
+            user_answer TEXT,
+            correct_answer INTEGER NOT NULL,
+            is_correct INTEGER NOT NULL,
+            time_taken REAL NOT NULL,
+            PRIMARY KEY (session_uid, seq)
+        ) WITHOUT ROWID
+    ''')
+
+
+def _create_settings_table(conn):
+    """Schema version 5: app settings, kept in the same file as the history."""
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS settings (
+            key TEXT PRIMARY KEY,
+            value TEXT NOT NULL
+        ) WITHOUT ROWID
+    ''')
+
+
+def _create_profile_totals_triggers(conn):
+    """Create the triggers that keep the per-profile session_totals in sync."""
+    conn.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS session_totals_insert
+        AFTER INSERT ON training_sessions
+        BEGIN
+            INSERT OR IGNORE INTO session_totals (profile_id, difficulty)
+            VALUES (NEW.profile_id, '{OVERALL_KEY}'), (NEW.profile_id, NEW.difficulty);
+            UPDATE session_totals SET
+                total_sessions = total_sessions + 1,
+                total_questions = total_questions + NEW.total_questions,
+                correct_answers = correct_answers + NEW.correct_answers
+            WHERE profile_id = NEW.profile_id
+              AND difficulty IN ('{OVERALL_KEY}', NEW.difficulty);
+        END
+    ''')
+    conn.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS session_totals_delete
+        AFTER DELETE ON training_sessions
+        BEGIN
+            UPDATE session_totals SET
+                total_sessions = total_sessions - 1,
+                total_questions = total_questions - OLD.total_questions,
+                correct_answers = correct_answers - OLD.correct_answers
+            WHERE profile_id = OLD.profile_id
+              AND difficulty IN ('{OVERALL_KEY}', OLD.difficulty);
+        END
+    ''')
+
+
+def _rebuild_profile_totals(conn):
+    """Recompute the per-profile session_totals from training_sessions."""
+    conn.execute('DELETE FROM session_totals')
+    conn.execute('''
+        INSERT INTO session_totals
+        (profile_id, difficulty, total_sessions, total_questions, correct_answers)
+        SELECT profile_id, difficulty, COUNT(*), SUM(total_questions), SUM(correct_answers)
+        FROM training_sessions
+        GROUP BY profile_id, difficulty
+    ''')
+    conn.execute(f'''
+        INSERT INTO session_totals
+        (profile_id, difficulty, total_sessions, total_questions, correct_answers)
+        SELECT id, '{OVERALL_KEY}',
+               (SELECT COUNT(*) FROM training_sessions WHERE profile_id = profiles.id),
+               (SELECT COALESCE(SUM(total_questions), 0) FROM training_sessions
+                WHERE profile_id = profiles.id),
+               (SELECT COALESCE(SUM(correct_answers), 0) FROM training_sessions
+                WHERE profile_id = profiles.id)
+        FROM profiles
+    ''')
+
+
+def _create_profiles(conn):
+    """Schema version 6: profiles, each owning its sessions and totals."""
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS profiles (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            name TEXT NOT NULL UNIQUE COLLATE NOCASE,
+            created INTEGER NOT NULL
+        )
+    ''')
+    # Existing history belongs to the default profile
+    conn.execute(
+        'INSERT OR IGNORE INTO profiles (id, name, created) VALUES (?, ?, ?)',
+        (DEFAULT_PROFILE_ID, DEFAULT_PROFILE_NAME, int(time.time()))
+    )
+    conn.execute(
+        'ALTER TABLE training_sessions ADD COLUMN '
+        f'profile_id INTEGER NOT NULL DEFAULT {DEFAULT_PROFILE_ID}'
+    )
+
+    # Covering indexes: profile first, then the query order (id included
+    # as the tie-breaker), then every other column the history reads
+    conn.execute('DROP INDEX IF EXISTS idx_training_sessions_date')
+    conn.execute('DROP INDEX IF EXISTS idx_training_sessions_difficulty_date')
+    conn.execute('''
+        CREATE INDEX IF NOT EXISTS idx_training_sessions_profile_date
+        ON training_sessions (profile_id, date, id, difficulty,
+                              total_questions, correct_answers, time_per_question)
+    ''')
+    conn.execute('''
+        CREATE INDEX IF NOT EXISTS idx_training_sessions_profile_difficulty_date
+        ON training_sessions (profile_id, difficulty, date, id,
+                              total_questions, correct_answers, time_per_question)
+    ''')
+
+    # Totals are kept per profile and difficulty
+    conn.execute('DROP TRIGGER IF EXISTS session_totals_insert')
+    conn.execute('DROP TRIGGER IF EXISTS session_totals_delete')
+    conn.execute('DROP TABLE session_totals')
+    conn.execute('''
+        CREATE TABLE session_totals (
+            profile_id INTEGER NOT NULL,
+            difficulty TEXT NOT NULL,
+            total_sessions INTEGER NOT NULL DEFAULT 0,
+            total_questions INTEGER NOT NULL DEFAULT 0,
+            correct_answers INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (profile_id, difficulty)
+        ) WITHOUT ROWID
+    ''')
+    _create_profile_totals_triggers(conn)
+    _rebuild_profile_totals(conn)
+
+
+def _create_sync_state(conn):
+    """Schema version 7: per-server high-water marks of synced sessions."""
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS sync_state (
+            server TEXT PRIMARY KEY,
+            device_id TEXT NOT NULL,
+            last_session_id INTEGER NOT NULL DEFAULT 0,
+            last_sync INTEGER
+        )
+    ''')
+
+
+# Multiplication facts' answers, folded into the moving averages of
+# fact_stats oldest first; selected rows are (profile_id, num1, num2,
+# error, time_taken)
+_FACT_STATS_UPSERT = f'''
+    INSERT INTO fact_stats (profile_id, num1, num2, attempts, ema_error, ema_time)
+    {{select}}
+    ON CONFLICT (profile_id, num1, num2) DO UPDATE SET
+        attempts = attempts + 1,
+        ema_error = ema_error + {EMA_ALPHA} * (excluded.ema_error - ema_error),
+        ema_time = ema_time + {EMA_ALPHA} * (excluded.ema_time - ema_time)
+'''
+
+
+def _rebuild_fact_stats(conn):
+    """Recompute fact_stats from the whole attempt history."""
+    conn.execute('DELETE FROM fact_stats')
+    conn.execute(_FACT_STATS_UPSERT.format(select='''
+        SELECT s.profile_id, a.num1, a.num2, 1, 1 - a.is_correct, a.time_taken
+        FROM training_sessions s
+        JOIN question_attempts a ON a.session_uid = s.uid
+        WHERE a.question LIKE '% x %'
+        ORDER BY s.profile_id, s.date, s.id, a.seq
+    '''))
+
+
+def _create_fact_stats(conn):
+    """Schema version 8: per-fact moving averages for the adaptive scheduler."""
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS fact_stats (
+            profile_id INTEGER NOT NULL,
+            num1 INTEGER NOT NULL,
+            num2 INTEGER NOT NULL,
+            attempts INTEGER NOT NULL,
+            ema_error REAL NOT NULL,
+            ema_time REAL NOT NULL,
+            PRIMARY KEY (profile_id, num1, num2)
+        ) WITHOUT ROWID
+    ''')
+    # A session row is stored after its attempts, so its answers are folded
+    # in when the row arrives (from the app, an import or a sync)
+    upsert = _FACT_STATS_UPSERT.format(select='''
+        SELECT NEW.profile_id, num1, num2, 1, 1 - is_correct, time_taken
+        FROM question_attempts
+        WHERE session_uid = NEW.uid AND question LIKE '% x %'
+        ORDER BY seq
+    ''')
+    conn.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS fact_stats_insert
+        AFTER INSERT ON training_sessions
+        BEGIN
+            {upsert};
+        END
+    ''')
+    _rebuild_fact_stats(conn)
+
+
+# Schema migrations, applied in order. The database's PRAGMA user_version
+# records how many of them have already run.
+MIGRATIONS = [
+    _create_sessions_table,
+    _create_session_totals,
+    _index_session_dates,
+    _create_question_attempts,
+    _create_settings_table,
+    _create_profiles,
+    _create_sync_state,
+    _create_fact_stats,
+]
+
+SCHEMA_VERSION = len(MIGRATIONS)
+
 
 class Database:
-    """Manages SQLite database for training statistics."""
-    
-    def __init__(self, db_path='brain_trainer.db'):
-        """Initialize database connection."""
+    """Manages SQLite database for training statistics.
+
+    A single Database instance is meant to be shared by the whole app. Each
+    thread that touches it gets one long-lived connection, configured once
+    when it is opened, instead of connecting and disconnecting per call.
+    """
+
+    def __init__(self, db_path='brain_trainer.db', journal_mode='WAL',
+                 profile_id=DEFAULT_PROFILE_ID, busy_timeout=BUSY_TIMEOUT,
+                 write_retries=WRITE_RETRIES):
+        """Initialize database connection.
+
+        History is read and written for one profile at a time, profile_id,
+        which can be changed at any time (see get_profiles()).
+
+        When other processes share the file, statements wait up to
+        busy_timeout seconds for their locks, and write transactions that
+        still fail are retried write_retries times (see _write()).
+        """
         self.db_path = db_path
+        self.journal_mode = journal_mode
+        self.profile_id = profile_id
+        self.busy_timeout = busy_timeout
+        self.write_retries = write_retries
+        # Write transactions retried because the database was locked
+        self.lock_retries = 0
+        self._local = threading.local()
+        self._connections = []
+        self._connections_lock = threading.Lock()
+        self._schema_initialized = False
         self.init_db()
-    
-    def init_db(self):
-        """Create tables if they don't exist."""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        
-        # Create training sessions table
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS training_sessions (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                difficulty TEXT NOT NULL,
-                total_questions INTEGER NOT NULL,
-                correct_answers INTEGER NOT NULL,
-                time_per_question INTEGER NOT NULL,
-                date TEXT NOT NULL
+
+    def get_connection(self):
+        """Get the connection owned by the calling thread, opening it if needed."""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(
+                self.db_path,
+                timeout=self.busy_timeout,
+                cached_statements=STATEMENT_CACHE_SIZE,
+                check_same_thread=False
             )
-        ''')
-        
-        conn.commit()
-        conn.close()
-    
-    def add_training_session(self, difficulty, total_questions, correct_answers, time_per_question):
-        """Add a new training session record."""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        
-        cursor.execute('''
-            INSERT INTO training_sessions 
-            (difficulty, total_questions, correct_answers, time_per_question, date)
-            VALUES (?, ?, ?, ?, ?)
-        ''', (difficulty, total_questions, correct_answers, time_per_question, 
-              datetime.now().isoformat()))
-        
-        conn.commit()
-        conn.close()
-    
-    def get_statistics(self):
-        """Get overall statistics."""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        
-        cursor.execute('''
-            SELECT 
-                COUNT(*) as total_sessions,
-                SUM(total_questions) as total_questions,
-                SUM(correct_answers) as correct_answers
-            FROM training_sessions
-        ''')
-        
-        result = cursor.fetchone()
-        conn.close()
-        
+            if self.journal_mode:
+                conn.execute(f'PRAGMA journal_mode={self.journal_mode}')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn = conn
+            with self._connections_lock:
+                self._connections.append(conn)
+        return conn
+
+    def close(self):
+        """Close every connection opened by this instance."""
+        with self._connections_lock:
+            connections = self._connections
+            self._connections = []
+        for conn in connections:
+            try:
+                conn.close()
+            except sqlite3.Error:
+                pass
+        # Threads still holding a closed connection will reopen on next use
+        self._local = threading.local()
+
+    def init_db(self):
+        """Create tables and apply pending schema migrations."""
+        if self._schema_initialized:
+            return
+
+        conn = self.get_connection()
+        version = conn.execute('PRAGMA user_version').fetchone()[0]
+
+        for number, migration in enumerate(MIGRATIONS[version:], version + 1):
+            # Each migration runs in its own transaction together with the
+            # version bump, so a failed upgrade leaves the old schema intact
+            conn.execute('BEGIN IMMEDIATE')
+            # Another process sharing the file may have applied it meanwhile
+            if conn.execute('PRAGMA user_version').fetchone()[0] >= number:
+                conn.rollback()
+                continue
+            try:
+                migration(conn)
+                conn.execute(f'PRAGMA user_version = {number}')
+                conn.commit()
+            except Exception:
+                conn.rollback()
+                raise
+
+        self._schema_initialized = True
+
+    def _write(self, operation, *args):
+        """Run operation(conn, *args) in a write transaction and return its result.
+
+        The transaction takes the write lock up front (BEGIN IMMEDIATE),
+        waiting up to busy_timeout for other connections. If the database
+        is still locked, the whole transaction is retried with exponential
+        backoff, so contention on a shared file delays a write instead of
+        losing it. Arguments must survive being used more than once (lists,
+        not generators). A transaction the thread already has open is
+        joined and committed instead.
+        """
+        conn = self.get_connection()
+        if conn.in_transaction:
+            with conn:
+                return operation(conn, *args)
+        for attempt in range(self.write_retries + 1):
+            try:
+                conn.execute('BEGIN IMMEDIATE')
+                try:
+                    result = operation(conn, *args)
+                    conn.commit()
+                except BaseException:
+                    conn.rollback()
+                    raise
+                return result
+            except sqlite3.OperationalError as error:
+                if attempt == self.write_retries or not is_lock_error(error):
+                    raise
+                self.lock_retries += 1
+                time.sleep(WRITE_BACKOFF * 2 ** attempt * random.uniform(0.5, 1.0))
+
+    def add_training_session(self, difficulty, total_questions, correct_answers,
+                             time_per_question, uid=None, profile_id=None):
+        """Add a new training session record.
+
+        The session belongs to profile_id, or to the current profile when
+        omitted. Returns the session uid, which links the session to its
+        question attempts. A new uid is generated when none is given.
+        """
+        uid = uid or uuid.uuid4().hex
+        self._write(lambda conn: conn.execute(INSERT_SESSION_SQL, (
+            difficulty, total_questions, correct_answers, time_per_question,
+            int(time.time()), uid, profile_id or self.profile_id
+        )))
+        return uid
+
+    def add_question_attempts(self, attempts):
+        """Insert question attempts in a single transaction.
+
+        Args:
+            attempts: Iterable of tuples in ATTEMPT_COLUMNS order. Attempts
+                already stored (same session uid and seq) are skipped.
+
+        Returns the number of attempts inserted.
+        """
+        attempts = list(attempts)
+        return self._write(lambda conn: conn.executemany(INSERT_ATTEMPT_SQL, attempts).rowcount)
+
+    def import_session_records(self, records):
+        """Insert sessions from another database in a single transaction.
+
+        Args:
+            records: Iterable of tuples in SESSION_RECORD_COLUMNS order.
+                They join the current profile. Sessions already stored
+                (same uid) are skipped.
+
+        Returns the number of sessions inserted.
+        """
+        profile = (self.profile_id,)
+        rows = [tuple(record) + profile for record in records]
+        return self._write(lambda conn: conn.executemany(IMPORT_SESSION_SQL, rows).rowcount)
+
+    def get_profiles(self):
+        """Get every profile as (id, name), ordered by name."""
+        return self.get_connection().execute(PROFILES_SQL).fetchall()
+
+    def create_profile(self, name):
+        """Add a profile and return its id.
+
+        Raises sqlite3.IntegrityError when the name (ignoring case) is taken.
+        """
+        return self._write(
+            lambda conn: conn.execute(CREATE_PROFILE_SQL, (name, int(time.time()))).lastrowid
+        )
+
+    def get_fact_attempts(self, min_range, max_range):
+        """Get (num1, num2, is_correct, time_taken) of every multiplication
+        attempt of the current profile with both operands in
+        [min_range, max_range], oldest first."""
+        return self.get_connection().execute('''
+            SELECT a.num1, a.num2, a.is_correct, a.time_taken
+            FROM training_sessions s
+            JOIN question_attempts a ON a.session_uid = s.uid
+            WHERE s.profile_id = ?
+              AND a.num1 BETWEEN ? AND ? AND a.num2 BETWEEN ? AND ?
+              AND a.question LIKE '% x %'
+            ORDER BY s.date, s.id, a.seq
+        ''', (self.profile_id, min_range, max_range, min_range, max_range))
+
+    def get_fact_stats(self, min_range, max_range):
+        """Get (num1, num2, attempts, ema_error, ema_time) of every
+        multiplication fact the current profile has answered with both
+        operands in [min_range, max_range].
+
+        The moving averages are maintained as sessions are stored, so this
+        reads at most one row per fact however long the history is.
+        """
+        return self.get_connection().execute(FACT_STATS_SQL, (
+            self.profile_id, min_range, max_range, min_range, max_range
+        )).fetchall()
+
+    def iter_session_rows(self, after_id=0, chunk_size=FETCH_CHUNK_ROWS):
+        """Yield lists of (id, date, difficulty, total_questions,
+        correct_answers) for the current profile's sessions with
+        id > after_id, in id order.
+
+        Rows are fetched chunk by chunk, so the whole history never has to
+        be held as Python tuples at once.
+        """
+        return self._iter_chunks(
+            HISTORY_SESSIONS_SQL, (self.profile_id, after_id), chunk_size
+        )
+
+    def iter_attempt_rows(self, after_session_id=0, chunk_size=FETCH_CHUNK_ROWS):
+        """Yield lists of (session id, num1, num2, is_correct, time_taken,
+        is_multiplication) for attempts of the current profile's sessions
+        with id > after_session_id, in session order."""
+        return self._iter_chunks(
+            HISTORY_ATTEMPTS_SQL, (self.profile_id, after_session_id), chunk_size
+        )
+
+    def iter_session_records(self, chunk_size=FETCH_CHUNK_ROWS):
+        """Yield lists of the current profile's sessions in
+        SESSION_RECORD_COLUMNS order."""
+        return self._iter_chunks(EXPORT_SESSIONS_SQL, (self.profile_id,), chunk_size)
+
+    def iter_attempt_records(self, chunk_size=FETCH_CHUNK_ROWS):
+        """Yield lists of the current profile's question attempts in
+        ATTEMPT_COLUMNS order."""
+        return self._iter_chunks(EXPORT_ATTEMPTS_SQL, (self.profile_id,), chunk_size)
+
+    def _iter_chunks(self, sql, params, chunk_size):
+        """Run a query and yield its rows chunk by chunk."""
+        cursor = self.get_connection().execute(sql, params)
+        while True:
+            rows = cursor.fetchmany(chunk_size)
+            if not rows:
+                return
+            yield rows
+
+    def count_sessions(self, up_to_id=None):
+        """Number of the current profile's sessions, optionally only those
+        with id <= up_to_id."""
+        if up_to_id is None:
+            return self.get_connection().execute(
+                'SELECT COUNT(*) FROM training_sessions WHERE profile_id = ?',
+                (self.profile_id,)
+            ).fetchone()[0]
+        return self.get_connection().execute(
+            'SELECT COUNT(*) FROM training_sessions WHERE profile_id = ? AND id <= ?',
+            (self.profile_id, up_to_id)
+        ).fetchone()[0]
+
+    def get_sync_state(self, server):
+        """Get (device_id, last synced session id) for a sync server.
+
+        The first call for a server creates its state with a new device id.
+        """
+        conn = self.get_connection()
+        row = conn.execute(SYNC_STATE_SQL, (server,)).fetchone()
+        if row is None:
+            self._write(lambda conn: conn.execute(
+                'INSERT OR IGNORE INTO sync_state (server, device_id) VALUES (?, ?)',
+                (server, uuid.uuid4().hex)
+            ))
+            row = conn.execute(SYNC_STATE_SQL, (server,)).fetchone()
+        return row
+
+    def set_sync_mark(self, server, last_session_id):
+        """Record that sessions up to last_session_id reached a sync server."""
+        self._write(lambda conn: conn.execute(
+            'UPDATE sync_state SET last_session_id = ?, last_sync = ? WHERE server = ?',
+            (last_session_id, int(time.time()), server)
+        ))
+
+    def get_unsynced_sessions(self, after_id, limit):
+        """Get up to limit sessions of every profile with id > after_id.
+
+        Returns (id, *SESSION_RECORD_COLUMNS, profile name) tuples in id
+        order.
+        """
+        return self.get_connection().execute(SYNC_SESSIONS_SQL, (after_id, limit)).fetchall()
+
+    def get_session_range_attempts(self, after_id, last_id):
+        """Get the attempts (ATTEMPT_COLUMNS order) of sessions with
+        after_id < id <= last_id."""
+        return self.get_connection().execute(SYNC_ATTEMPTS_SQL, (after_id, last_id)).fetchall()
+
+    def get_settings(self):
+        """Get every stored setting as a dict."""
+        rows = self.get_connection().execute(SETTINGS_SQL)
+        return {key: json.loads(value) for key, value in rows}
+
+    def save_settings(self, settings):
+        """Store settings (a dict) in a single transaction."""
+        rows = [(key, json.dumps(value)) for key, value in settings.items()]
+        self._write(lambda conn: conn.executemany(SAVE_SETTING_SQL, rows))
+
+    def get_question_attempts(self, session_uid):
+        """Get the question attempts of one session, in the order asked."""
+        cursor = self.get_connection().execute(
+            f'SELECT {", ".join(ATTEMPT_COLUMNS)} FROM question_attempts '
+            'WHERE session_uid = ? ORDER BY seq',
+            (session_uid,)
+        )
+        return cursor.fetchall()
+
+    def get_statistics(self, difficulty=None):
+        """Get the current profile's overall statistics, or those of a
+        single difficulty.
+
+        Reads the totals maintained by the session_totals triggers, so the
+        cost does not grow with the number of recorded sessions.
+        """
+        key = OVERALL_KEY if difficulty is None else difficulty
+        cursor = self.get_connection().execute(STATISTICS_SQL, (self.profile_id, key))
+        result = cursor.fetchone() or (0, 0, 0)
+
         return {
             'total_sessions': result[0] or 0,
             'total_questions': result[1] or 0,
             'correct_answers': result[2] or 0,
             'accuracy': (result[2] / result[1] * 100) if result[1] else 0
         }
-    
+
+    def rebuild_statistics(self):
+        """Recompute the materialized totals and fact statistics from the
+        session history."""
+        self._write(_rebuild_profile_totals)
+        self._write(_rebuild_fact_stats)
+
+    def verify_statistics(self):
+        """Compare the materialized totals with the session history.
+
+        Checks every profile. Returns a list of ((profile_id, difficulty),
+        stored, computed) tuples for every key whose totals disagree; an
+        empty list means the totals are consistent.
+        """
+        conn = self.get_connection()
+        computed = {}
+        for (profile_id,) in conn.execute('SELECT id FROM profiles'):
+            computed[profile_id, OVERALL_KEY] = (0, 0, 0)
+        for profile_id, difficulty, sessions, questions, correct in conn.execute(
+                COMPUTED_TOTALS_SQL):
+            computed[profile_id, difficulty] = (sessions, questions, correct)
+            overall = computed.get((profile_id, OVERALL_KEY), (0, 0, 0))
+            computed[profile_id, OVERALL_KEY] = (
+                overall[0] + sessions, overall[1] + questions, overall[2] + correct
+            )
+
+        stored = {
+            tuple(row[:2]): tuple(row[2:])
+            for row in conn.execute(
+                'SELECT profile_id, difficulty, total_sessions, total_questions, '
+                'correct_answers FROM session_totals'
+            )
+        }
+
+        mismatches = []
+        for key in sorted(set(computed) | set(stored)):
+            expected = computed.get(key, (0, 0, 0))
+            actual = stored.get(key, (0, 0, 0))
+            if expected != actual:
+                mismatches.append((key, actual, expected))
+        return mismatches
+
     def get_recent_sessions(self, limit=5):
-        """Get recent training sessions."""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        
-        cursor.execute('''
-            SELECT difficulty, total_questions, correct_answers, date
-            FROM training_sessions
-            ORDER BY date DESC
-            LIMIT ?
-        ''', (limit,))
-        
-        results = cursor.fetchall()
-        conn.close()
-        
-        return results
+        """Get the current profile's recent training sessions."""
+        cursor = self.get_connection().execute(
+            RECENT_SESSIONS_SQL, (self.profile_id, limit)
+        )
+        return [
+            (difficulty, total_questions, correct_answers,
+             datetime.fromtimestamp(date).isoformat())
+            for difficulty, total_questions, correct_answers, date in cursor
+        ]
+
+    def get_session_page(self, limit=20, before=None, difficulty=None):
+        """Get one page of the current profile's session history, newest first.
+
+        Args:
+            limit: Maximum number of sessions to return.
+            before: Keyset cursor; only sessions older than it are returned.
+                Either an epoch timestamp or a (date, id) tuple as returned in
+                the previous page's cursor.
+            difficulty: Restrict the page to one difficulty.
+
+        Returns:
+            (rows, next_before) where rows are (id, difficulty, total_questions,
+            correct_answers, time_per_question, date) tuples with epoch dates,
+            and next_before is the cursor for the following page, or None
+            when there are no more sessions.
+        """
+        params = [self.profile_id]
+        if difficulty is not None:
+            params.append(difficulty)
+        if before is not None:
+            if isinstance(before, (tuple, list)):
+                params.extend(before)
+            else:
+                # A bare timestamp excludes every session at that second
+                params.extend((before, -1))
+        params.append(limit)
+
+        sql = SESSION_PAGE_SQL[(before is not None, difficulty is not None)]
+        rows = self.get_connection().execute(sql, params).fetchall()
+
+        next_before = (rows[-1][5], rows[-1][0]) if len(rows) == limit else None
+        return rows, next_before
+
+
+def main(argv=None):
+    """Command line maintenance for the statistics tables."""
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Brain Trainer database maintenance')
+    parser.add_argument('command', choices=['rebuild-stats', 'verify-stats'])
+    parser.add_argument('--db', default='brain_trainer.db', help='Path to the database file')
+    args = parser.parse_args(argv)
+
+    db = Database(args.db)
+    try:
+        if args.command == 'rebuild-stats':
+            db.rebuild_statistics()
+            print("Statistics rebuilt.")
+            return 0
+
+        mismatches = db.verify_statistics()
+        for (profile_id, difficulty), stored, computed in mismatches:
+            label = 'overall' if difficulty == OVERALL_KEY else difficulty
+            print(f"profile {profile_id}, {label}: stored {stored}, computed {computed}")
+        if mismatches:
+            print("Statistics are out of date; run 'rebuild-stats' to fix them.")
+            return 1
+        print("Statistics are consistent.")
+        return 0
+    finally:
+        db.close()
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
@@ -0,0 +1,53 @@
+"""In-app overlay showing the statistics of a Tracer."""
+from kivy.clock import Clock
+from kivy.core.window import Window
+from kivy.graphics import Color, Rectangle
+from kivy.uix.label import Label
+
+
+# Seconds between overlay refreshes
+REFRESH_INTERVAL = 1.0
+
+OVERLAY_BACKGROUND = (0, 0, 0, 0.75)
+
+
+class TraceOverlay(Label):
+    """Per-span counts and latencies (ms), drawn above every screen."""
+
+    def __init__(self, tracer, **kwargs):
+        super().__init__(
+            font_name='RobotoMono-Regular', font_size='11sp', color=(1, 1, 1, 1),
+            halign='left', valign='top', size_hint=(None, None), padding=(6, 6),
+            **kwargs
+        )
+        self.tracer = tracer
+        self.shown = False
+        self.bind(texture_size=self.setter('size'))
+        with self.canvas.before:
+            Color(*OVERLAY_BACKGROUND)
+            self._background = Rectangle()
+        self.bind(pos=self._update_background, size=self._update_background)
+        self._refresh_trigger = Clock.create_trigger(
+            self.refresh, REFRESH_INTERVAL, interval=True
+        )
+
+    def _update_background(self, *args):
+        self._background.pos = self.pos
+        self._background.size = self.size
+
+    def refresh(self, *args):
+        """Show the current statistics in the top left corner."""
+        self.text = self.tracer.summary_text()
+        self.texture_update()
+        self.pos = (0, Window.height - self.texture_size[1])
+
+    def toggle(self):
+        """Show the overlay if hidden, hide it otherwise."""
+        if self.shown:
+            self._refresh_trigger.cancel()
+            Window.remove_widget(self)
+        else:
+            Window.add_widget(self)
+            self.refresh()
+            self._refresh_trigger()
+        self.shown = not self.shown
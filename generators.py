@@ -0,0 +1,261 @@
+"""Question generators: the kinds of drill a training session can run.
+
+A generator asks one kind of question (multiplication, addition, ...)
+about operands in a range. Operands and answers are drawn in batches from
+a seeded NumPy random generator, so a long drill costs a few array
+operations per batch plus building each question's tuple and text, and a
+seed always gives the same questions. Multiplication can also build single questions from
+operands chosen by the adaptive scheduler.
+
+A session's generator and range are stored as its difficulty, e.g.
+'addition:0-20'. The preset names 'Easy', 'Medium' and 'Hard' stand for
+multiplication over their ranges, as they always have.
+"""
+import re
+from collections import namedtuple
+
+
+# Operand range of each preset difficulty
+DIFFICULTY_RANGES = {
+    'Easy': (0, 10),
+    'Medium': (10, 20),
+    'Hard': (20, 100),
+}
+
+# Questions drawn per batch
+BATCH_SIZE = 256
+
+# Words spoken for the symbols in question expressions
+SPOKEN_SYMBOLS = {
+    'x': 'times',
+    '+': 'plus',
+    '-': 'minus',
+    '÷': 'divided by',
+}
+SQUARED = '²'
+
+_SPEC_PATTERN = re.compile(r'(\w+):(-?\d+)-(-?\d+)')
+
+
+class Question(namedtuple('Question', 'num1 num2 answer expression')):
+    """A question: its operands, answer and expression, e.g. '7 x 8'."""
+
+    __slots__ = ()
+
+    @property
+    def text(self):
+        """Question as shown to the user."""
+        return f"{self.expression} = ?"
+
+
+def spoken_text(expression):
+    """Text to speak for an expression, e.g. '7 x 8' -> '7 times 8'."""
+    words = []
+    for token in expression.split():
+        if token.endswith(SQUARED):
+            words.extend((token[:-len(SQUARED)], 'squared'))
+        else:
+            words.append(SPOKEN_SYMBOLS.get(token, token))
+    return ' '.join(words)
+
+
+class QuestionGenerator:
+    """Base class of generators of binary operation questions.
+
+    Subclasses set name and symbol, compute answers (for ints or NumPy
+    arrays alike) and may change how operands are drawn.
+    """
+
+    name = None
+    symbol = None
+    # Whether questions are single facts that the adaptive scheduler can
+    # pick; other generators only produce batches
+    adaptive = False
+
+    def __init__(self, min_range, max_range):
+        """Create a generator for operands in [min_range, max_range]."""
+        self.min_range, self.max_range = sorted((min_range, max_range))
+
+    @property
+    def spec(self):
+        """Generator and range, e.g. 'addition:0-20'."""
+        return f"{self.name}:{self.min_range}-{self.max_range}"
+
+    @property
+    def label(self):
+        """Difficulty stored with sessions of this generator."""
+        return self.spec
+
+    def answer(self, num1, num2):
+        """Answer to num1 <symbol> num2."""
+        raise NotImplementedError
+
+    def expression(self, num1, num2):
+        """Expression shown for a question."""
+        return f"{num1} {self.symbol} {num2}"
+
+    def question(self, num1, num2):
+        """The question about two operands."""
+        return Question(num1, num2, self.answer(num1, num2), self.expression(num1, num2))
+
+    def draw(self, rng, count):
+        """Operand arrays (num1, num2) of count questions."""
+        low, high = self.min_range, self.max_range + 1
+        return rng.integers(low, high, count), rng.integers(low, high, count)
+
+    def batch(self, rng, count=BATCH_SIZE):
+        """Draw count questions with a numpy.random.Generator."""
+        num1, num2 = self.draw(rng, count)
+        answers = self.answer(num1, num2)
+        expression = self.expression
+        return [
+            Question(a, b, answer, expression(a, b))
+            for a, b, answer in zip(num1.tolist(), num2.tolist(), answers.tolist())
+        ]
+
+
+class MultiplicationGenerator(QuestionGenerator):
+    """num1 x num2; facts are scheduled adaptively."""
+
+    name = 'multiplication'
+    symbol = 'x'
+    adaptive = True
+
+    @property
+    def label(self):
+        """Preset name for the preset ranges, as older sessions were stored."""
+        for name, preset in DIFFICULTY_RANGES.items():
+            if preset == (self.min_range, self.max_range):
+                return name
+        return self.spec
+
+    def answer(self, num1, num2):
+        return num1 * num2
+
+
+class AdditionGenerator(QuestionGenerator):
+    """num1 + num2."""
+
+    name = 'addition'
+    symbol = '+'
+
+    def answer(self, num1, num2):
+        return num1 + num2
+
+
+class SubtractionGenerator(QuestionGenerator):
+    """num1 - num2 with num1 >= num2, so answers are never negative."""
+
+    name = 'subtraction'
+    symbol = '-'
+
+    def draw(self, rng, count):
+        import numpy as np
+        a, b = super().draw(rng, count)
+        return np.maximum(a, b), np.minimum(a, b)
+
+    def answer(self, num1, num2):
+        return num1 - num2
+
+
+class DivisionGenerator(QuestionGenerator):
+    """num1 ÷ num2 with a whole answer: the divisor and the answer come
+    from the range (the divisor is never 0) and num1 is their product."""
+
+    name = 'division'
+    symbol = '÷'
+
+    def __init__(self, min_range, max_range):
+        super().__init__(min_range, max_range)
+        if self.max_range < 1:
+            raise ValueError("Division needs a range that includes a positive divisor")
+
+    def draw(self, rng, count):
+        divisors = rng.integers(max(self.min_range, 1), self.max_range + 1, count)
+        answers = rng.integers(self.min_range, self.max_range + 1, count)
+        return divisors * answers, divisors
+
+    def answer(self, num1, num2):
+        return num1 // num2
+
+
+class SquaresGenerator(QuestionGenerator):
+    """num1² (num2 is num1)."""
+
+    name = 'squares'
+
+    def draw(self, rng, count):
+        num1 = rng.integers(self.min_range, self.max_range + 1, count)
+        return num1, num1
+
+    def answer(self, num1, num2):
+        return num1 * num2
+
+    def expression(self, num1, num2):
+        return f"{num1}{SQUARED}"
+
+
+class MixedGenerator(QuestionGenerator):
+    """Every other generator's questions, in random order; generators that
+    cannot ask about the range (division without a positive divisor) are
+    left out."""
+
+    name = 'mixed'
+
+    def __init__(self, min_range, max_range):
+        super().__init__(min_range, max_range)
+        self.parts = []
+        for name, generator_class in GENERATORS.items():
+            if name == self.name:
+                continue
+            try:
+                self.parts.append(generator_class(self.min_range, self.max_range))
+            except ValueError:
+                pass
+
+    def batch(self, rng, count=BATCH_SIZE):
+        kinds = rng.integers(len(self.parts), size=count)
+        batches = [
+            iter(part.batch(rng, int((kinds == index).sum())))
+            for index, part in enumerate(self.parts)
+        ]
+        return [next(batches[kind]) for kind in kinds.tolist()]
+
+
+GENERATORS = {
+    generator_class.name: generator_class
+    for generator_class in (
+        MultiplicationGenerator,
+        AdditionGenerator,
+        SubtractionGenerator,
+        DivisionGenerator,
+        SquaresGenerator,
+        MixedGenerator,
+    )
+}
+
+
+def get_generator(spec, min_range=None, max_range=None):
+    """Create the generator a difficulty or generator spec describes.
+
+    Args:
+        spec: A preset difficulty ('Easy', 'Medium', 'Hard'), a spec such
+            as 'addition:0-20', or a generator name ('addition', or
+            'Custom' for multiplication) together with min_range and
+            max_range.
+
+    Raises ValueError for unknown generators or a missing range.
+    """
+    if spec in DIFFICULTY_RANGES:
+        return MultiplicationGenerator(*DIFFICULTY_RANGES[spec])
+    match = _SPEC_PATTERN.fullmatch(spec)
+    if match:
+        spec, min_range, max_range = match.group(1), int(match.group(2)), int(match.group(3))
+    if spec == 'Custom':
+        spec = MultiplicationGenerator.name
+    generator_class = GENERATORS.get(spec)
+    if generator_class is None:
+        raise ValueError(f"Unknown question generator {spec!r}")
+    if min_range is None or max_range is None:
+        raise ValueError(f"Generator {spec!r} needs an explicit range")
+    return generator_class(min_range, max_range)
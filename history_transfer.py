@@ -0,0 +1,282 @@
+#!/usr/bin/env python
+"""Export and import training history.
+
+Streams sessions and question attempts between a database and dump files,
+so history can be collected from several devices into one database. Rows
+are read with fetchmany in chunks and imported in batches, one transaction
+per batch, so memory use stays the same however large the history is.
+Sessions and attempts that are already stored are skipped, so merging the
+same dump twice changes nothing.
+
+A dump is a directory holding sessions.<ext> and attempts.<ext>, as CSV,
+JSON Lines or Parquet (Parquet needs pyarrow). It holds the history of one
+profile; imports add it to a profile of the target database, which is
+created if needed.
+
+Usage:
+    python history_transfer.py export dump --format csv
+    python history_transfer.py export dump --format parquet --db kiosk.db
+    python history_transfer.py import dump --db central.db
+    python history_transfer.py --profile Ada export dump
+"""
+import argparse
+import csv
+import json
+import os
+
+from database import (
+    ATTEMPT_COLUMNS, DEFAULT_PROFILE_NAME, FETCH_CHUNK_ROWS, SESSION_RECORD_COLUMNS,
+    Database
+)
+
+
+# table -> (columns, Database method reading chunks, Database method importing a batch)
+TABLES = {
+    'sessions': (SESSION_RECORD_COLUMNS, 'iter_session_records', 'import_session_records'),
+    'attempts': (ATTEMPT_COLUMNS, 'iter_attempt_records', 'add_question_attempts'),
+}
+
+# Attempts go first, so a session never appears without its questions
+IMPORT_ORDER = ('attempts', 'sessions')
+
+# Python type of every column, for formats that store text
+COLUMN_TYPES = {
+    'uid': str,
+    'difficulty': str,
+    'total_questions': int,
+    'correct_answers': int,
+    'time_per_question': int,
+    'date': int,
+    'session_uid': str,
+    'seq': int,
+    'num1': int,
+    'num2': int,
+    'question': str,
+    'user_answer': str,
+    'correct_answer': int,
+    'is_correct': int,
+    'time_taken': float,
+}
+
+# Columns that may be NULL (written as an empty CSV field)
+NULLABLE_COLUMNS = {'user_answer'}
+
+
+def _write_csv(path, columns, chunks):
+    """Write row chunks to a CSV file with a header row."""
+    count = 0
+    with open(path, 'w', newline='', encoding='utf-8') as f:
+        writer = csv.writer(f)
+        writer.writerow(columns)
+        for rows in chunks:
+            writer.writerows(rows)
+            count += len(rows)
+    return count
+
+
+def _read_csv(path, columns, batch_size):
+    """Yield batches of typed row tuples from a CSV file."""
+    with open(path, newline='', encoding='utf-8') as f:
+        reader = csv.reader(f)
+        header = next(reader, None)
+        if header is None:
+            return
+        missing = set(columns) - set(header)
+        if missing:
+            raise ValueError(f"{path} lacks column(s): {', '.join(sorted(missing))}")
+        positions = [header.index(column) for column in columns]
+        converters = [
+            (position, COLUMN_TYPES[column], column in NULLABLE_COLUMNS)
+            for position, column in zip(positions, columns)
+        ]
+        batch = []
+        for record in reader:
+            batch.append(tuple(
+                None if nullable and record[position] == '' else convert(record[position])
+                for position, convert, nullable in converters
+            ))
+            if len(batch) >= batch_size:
+                yield batch
+                batch = []
+        if batch:
+            yield batch
+
+
+def _write_jsonl(path, columns, chunks):
+    """Write row chunks as one JSON object per line."""
+    encode = json.JSONEncoder(ensure_ascii=False).encode
+    count = 0
+    with open(path, 'w', encoding='utf-8') as f:
+        for rows in chunks:
+            f.writelines(encode(dict(zip(columns, row))) + '\n' for row in rows)
+            count += len(rows)
+    return count
+
+
+def _read_jsonl(path, columns, batch_size):
+    """Yield batches of row tuples from a JSON Lines file."""
+    with open(path, encoding='utf-8') as f:
+        batch = []
+        for line in f:
+            if not line.strip():
+                continue
+            record = json.loads(line)
+            batch.append(tuple(record.get(column) for column in columns))
+            if len(batch) >= batch_size:
+                yield batch
+                batch = []
+        if batch:
+            yield batch
+
+
+def _parquet_schema(columns):
+    """Arrow schema for a table's columns."""
+    import pyarrow as pa
+    types = {str: pa.string(), int: pa.int64(), float: pa.float64()}
+    return pa.schema([(column, types[COLUMN_TYPES[column]]) for column in columns])
+
+
+def _write_parquet(path, columns, chunks):
+    """Write row chunks to a Parquet file, one row group per chunk."""
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    schema = _parquet_schema(columns)
+    count = 0
+    with pq.ParquetWriter(path, schema) as writer:
+        for rows in chunks:
+            arrays = [
+                pa.array(values, type=field.type)
+                for values, field in zip(zip(*rows), schema)
+            ]
+            writer.write_table(pa.Table.from_arrays(arrays, schema=schema))
+            count += len(rows)
+    return count
+
+
+def _read_parquet(path, columns, batch_size):
+    """Yield batches of row tuples from a Parquet file."""
+    import pyarrow.parquet as pq
+
+    parquet_file = pq.ParquetFile(path)
+    for record_batch in parquet_file.iter_batches(batch_size, columns=list(columns)):
+        values = record_batch.to_pydict()
+        yield list(zip(*(values[column] for column in columns)))
+
+
+# format -> (file extension, writer, reader)
+FORMATS = {
+    'csv': ('csv', _write_csv, _read_csv),
+    'jsonl': ('jsonl', _write_jsonl, _read_jsonl),
+    'parquet': ('parquet', _write_parquet, _read_parquet),
+}
+
+
+def dump_path(directory, table, fmt):
+    """File of one table in a dump directory."""
+    return os.path.join(directory, f"{table}.{FORMATS[fmt][0]}")
+
+
+def use_profile(db, name, create=False):
+    """Make the profile called name (ignoring case) current in db.
+
+    The profile is added when missing and create is set; otherwise a
+    ValueError is raised. Returns its id.
+    """
+    for profile_id, profile_name in db.get_profiles():
+        if profile_name.lower() == name.lower():
+            db.profile_id = profile_id
+            return profile_id
+    if not create:
+        raise ValueError(f"No profile named {name!r}")
+    db.profile_id = db.create_profile(name)
+    return db.profile_id
+
+
+def export_history(db, directory, fmt='csv', chunk_size=FETCH_CHUNK_ROWS):
+    """Write every session and attempt of db's current profile to a dump directory.
+
+    Returns {table: rows written}.
+    """
+    _, write, _ = FORMATS[fmt]
+    os.makedirs(directory, exist_ok=True)
+    counts = {}
+    for table, (columns, iterate, _) in TABLES.items():
+        path = dump_path(directory, table, fmt)
+        # Write next to the target and rename, so a dump is never half written
+        temp_path = f"{path}.tmp"
+        counts[table] = write(temp_path, columns, getattr(db, iterate)(chunk_size))
+        os.replace(temp_path, path)
+    return counts
+
+
+def detect_format(directory):
+    """Format of the dump in a directory, from the files it contains."""
+    for fmt in FORMATS:
+        if all(os.path.exists(dump_path(directory, table, fmt)) for table in TABLES):
+            return fmt
+    raise FileNotFoundError(f"No complete history dump found in {directory}")
+
+
+def import_history(db, directory, fmt=None, batch_size=FETCH_CHUNK_ROWS):
+    """Merge a dump directory into db's current profile, skipping rows
+    already stored.
+
+    Returns {table: (rows read, rows inserted)}.
+    """
+    fmt = fmt or detect_format(directory)
+    _, _, read = FORMATS[fmt]
+    counts = {}
+    for table in IMPORT_ORDER:
+        columns, _, insert = TABLES[table]
+        read_count = inserted = 0
+        for batch in read(dump_path(directory, table, fmt), columns, batch_size):
+            inserted += getattr(db, insert)(batch)
+            read_count += len(batch)
+        counts[table] = (read_count, inserted)
+    return counts
+
+
+def main(argv=None):
+    """Command line entry point."""
+    parser = argparse.ArgumentParser(description='Export or import training history')
+    parser.add_argument('--db', default='brain_trainer.db', help='Database file')
+    parser.add_argument('--batch-size', type=int, default=FETCH_CHUNK_ROWS,
+                        help='Rows per fetch and per import transaction')
+    parser.add_argument('--profile', default=DEFAULT_PROFILE_NAME,
+                        help='Profile whose history is exported or imported')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    export_parser = commands.add_parser('export', help='Write the history to a dump directory')
+    export_parser.add_argument('directory')
+    export_parser.add_argument('--format', choices=list(FORMATS), default='csv')
+
+    import_parser = commands.add_parser('import', help='Merge a dump directory into the database')
+    import_parser.add_argument('directory')
+    import_parser.add_argument('--format', choices=list(FORMATS),
+                               help='Dump format (detected when omitted)')
+    args = parser.parse_args(argv)
+
+    db = Database(args.db)
+    try:
+        use_profile(db, args.profile, create=args.command == 'import')
+        if args.command == 'export':
+            counts = export_history(db, args.directory, args.format, args.batch_size)
+            for table, count in counts.items():
+                print(f"Exported {count} {table}")
+        else:
+            counts = import_history(db, args.directory, args.format, args.batch_size)
+            for table, (read_count, inserted) in counts.items():
+                print(f"Imported {inserted} of {read_count} {table} "
+                      f"({read_count - inserted} already present)")
+    except ImportError as e:
+        parser.exit(1, f"Parquet dumps need pyarrow ({e})\n")
+    except (OSError, ValueError) as e:
+        parser.exit(1, f"Error: {e}\n")
+    finally:
+        db.close()
+    return 0
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
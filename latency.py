@@ -0,0 +1,19 @@
+"""Latency summaries shared by the benchmark and stress scripts."""
+import statistics
+
+
+def _percentile(sorted_values, fraction):
+    """Nearest-rank percentile of already sorted values."""
+    index = min(len(sorted_values) - 1, int(round(fraction * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+def summarize(timings):
+    """Run count, mean, p50 and p99 of timings in milliseconds."""
+    timings = sorted(timings)
+    return {
+        'runs': len(timings),
+        'mean_ms': statistics.fmean(timings),
+        'p50_ms': _percentile(timings, 0.5),
+        'p99_ms': _percentile(timings, 0.99),
+    }
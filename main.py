@@ -1,6 +1,8 @@
 """Brain Training App - Main application file."""
 import os
 import logging
+import sqlite3
+import time
 
 # Suppress clipboard warnings before Kivy initialization
 # Use CRITICAL to completely suppress Cutbuffer logger messages
@@ -16,74 +18,207 @@ Config.set('kivy', 'exit_on_escape', '0')
 # Set log level to warning to suppress info messages
 Config.set('kivy', 'log_level', 'warning')
 
-import random
-import time
+# Only what the first screen needs is imported here; widgets used by other
+# screens are loaded with their kv rules, and the speech stack once voice
+# is enabled
 from kivy.app import App
 from kivy.core.window import Window
+from kivy.lang import Builder
 from kivy.uix.screenmanager import ScreenManager, Screen
 from kivy.uix.boxlayout import BoxLayout
-from kivy.uix.label import Label
-from kivy.uix.button import Button
-from kivy.uix.textinput import TextInput
-from kivy.uix.spinner import Spinner
-from kivy.uix.checkbox import CheckBox
-from kivy.uix.popup import Popup
 from kivy.clock import Clock
-from kivy.properties import StringProperty, NumericProperty, BooleanProperty, DictProperty
-from kivy.core.audio import SoundLoader
-from database import Database
-import json
+from kivy.properties import (
+    StringProperty, BooleanProperty, ObjectProperty, NumericProperty
+)
+from kivy.graphics.texture import Texture
+from kivy.uix.button import Button
+from database import Database, DEFAULT_PROFILE_NAME
+from attempt_writer import AttemptWriter
+from async_db import AsyncDatabase
+from question_pipeline import QuestionPipeline
+from session_engine import DIFFICULTY_RANGES, TrainingSession, summarize_history
+from question_timer import QuestionTimer
+from theme import Theme
+from settings_store import DatabaseSettings, JsonSettingsFile, SettingsStore
+from tracing import Tracer, tracing_requested
+from session_log import SessionRecorder, recording_dir
+
+logger = logging.getLogger(__name__)
+
+# Per-screen kv rules, loaded when a screen is first built
+KV_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'kv')
 
 # Keyboard key codes
 KEYCODE_ENTER = 13
 KEYCODE_ESCAPE = 27
+KEYCODE_F11 = 292
+KEYCODE_F12 = 293
 
 # UI timing constants
 FOCUS_DELAY = 0.1  # Small delay to ensure UI is ready before setting focus
+TIMER_TICK = 0.05  # Timer refresh interval; text only changes when the value does
+
+# Statistics placeholder shown while the database is being queried
+STATS_LOADING_TEXT = "Loading statistics..."
+
+# Longest the database thread waits for a session's attempts to be written
+# before storing the session row
+ATTEMPT_FLUSH_TIMEOUT = 10.0
+
+# Settings live in the database next to the history, so startup opens one
+# file; set to False to keep them in SETTINGS_FILE instead. An existing
+# settings file is imported into the database the first time.
+SETTINGS_IN_DATABASE = True
+SETTINGS_FILE = 'brain_trainer_settings.json'
 
 # Unlimited time constant
 UNLIMITED_TIME = 0  # 0 means unlimited time (no countdown timer)
 
-# Text-to-speech support
-try:
-    from gtts import gTTS
-    import os
-    import tempfile
-    TTS_AVAILABLE = True
-except ImportError:
-    TTS_AVAILABLE = False
+# History is synced in the background when the 'sync_server' setting holds
+# a server URL (see sync.py); every SYNC_INTERVAL seconds and after each
+# saved session
+SYNC_INTERVAL = 300.0
+SYNC_STOP_TIMEOUT = 2.0  # longest exit waits for a sync in progress
+
+# Written on exit and on F11 while tracing (BRAIN_TRAINER_TRACE=1)
+TRACE_FILE = 'brain_trainer_trace.json'
+
+
+def save_session(db, session, profile_id, attempts_written, tracer):
+    """Store a finished session of a profile once its attempts are written.
+    
+    Runs on the database thread, so a reader that sees a session row also
+    sees all of its question attempts.
+    """
+    trace = tracer.begin('save_session')
+    attempts_written.wait(ATTEMPT_FLUSH_TIMEOUT)
+    trace.phase('wait_attempts')
+    uid = db.add_training_session(
+        session.difficulty,
+        session.total_questions,
+        session.correct_answers,
+        session.time_per_question,
+        uid=session.uid,
+        profile_id=profile_id
+    )
+    trace.phase('insert')
+    trace.end()
+    return uid
+
+
+def build_progress_report(db):
+    """Compute the progress screen's analytics (runs on the database thread)."""
+    # NumPy is only loaded once progress is first viewed
+    import analytics
+    return analytics.build_report(db)
 
 
 class MainScreen(Screen):
     """Main menu screen with statistics."""
     
-    stats_text = StringProperty("Loading statistics...")
+    stats_text = StringProperty(STATS_LOADING_TEXT)
     
     def on_enter(self):
         """Called when entering the screen."""
         self.update_statistics()
     
     def update_statistics(self):
-        """Update statistics display."""
-        db = Database()
-        stats = db.get_statistics()
-        
+        """Request fresh statistics without blocking the UI thread."""
+        self.stats_text = STATS_LOADING_TEXT
+        App.get_running_app().async_db.submit(
+            'get_statistics',
+            callback=self.show_statistics,
+            error_callback=self.show_statistics_error
+        )
+    
+    def show_statistics(self, stats):
+        """Display statistics delivered by the database worker."""
         self.stats_text = (
             f"Total Sessions: {stats['total_sessions']}\n"
             f"Total Questions: {stats['total_questions']}\n"
             f"Correct Answers: {stats['correct_answers']}\n"
             f"Accuracy: {stats['accuracy']:.1f}%"
         )
+    
+    def show_statistics_error(self, error):
+        """Display a notice when statistics could not be loaded."""
+        self.stats_text = "Statistics are unavailable right now."
+
+
+class ProfileScreen(Screen):
+    """Profile picker, shown before the main menu when several profiles exist."""
+    
+    status_text = StringProperty("")
+    
+    def on_enter(self):
+        """Called when entering the screen."""
+        self.load_profiles()
+    
+    def load_profiles(self):
+        """Request the profile list without blocking the UI thread."""
+        App.get_running_app().async_db.submit(
+            'get_profiles',
+            callback=self.show_profiles,
+            error_callback=self.show_error
+        )
+    
+    def show_profiles(self, profiles):
+        """Display the profiles delivered by the database worker."""
+        current = App.get_running_app().db.profile_id
+        self.ids.profile_list.data = [
+            {'text': name, 'profile_id': profile_id, 'current': profile_id == current}
+            for profile_id, name in profiles
+        ]
+    
+    def add_profile(self, name):
+        """Create a profile and switch to it."""
+        name = name.strip()
+        if not name:
+            self.status_text = "Enter a name for the new profile."
+            return
+        self.status_text = ""
+        App.get_running_app().async_db.submit(
+            'create_profile', name,
+            callback=lambda profile_id: self.profile_created(profile_id, name),
+            error_callback=self.show_error
+        )
+    
+    def profile_created(self, profile_id, name):
+        """Switch to a newly created profile."""
+        self.ids.new_profile_input.text = ""
+        App.get_running_app().select_profile(profile_id, name)
+    
+    def show_error(self, error):
+        """Display a notice when profiles could not be read or created."""
+        if isinstance(error, sqlite3.IntegrityError):
+            self.status_text = "A profile with that name already exists."
+        else:
+            self.status_text = "Profiles are unavailable right now."
+
+
+class ProfileRow(Button):
+    """One profile in the picker list (recycled by the RecycleView)."""
+    
+    profile_id = NumericProperty(0)
+    current = BooleanProperty(False)
 
 
 class NewTrainScreen(Screen):
     """Screen for starting a new training session."""
     
+    # Why the chosen settings cannot start a session ('' when they can)
+    error_text = StringProperty("")
+    
     def __init__(self, **kwargs):
         super().__init__(**kwargs)
+        self.operation = "multiplication"
         self.difficulty = "Easy"
         self.time_per_question = 10
     
+    def set_operation(self, operation):
+        """Set the question generator, e.g. 'Addition'."""
+        self.operation = operation.lower()
+    
     def set_difficulty(self, difficulty):
         """Set training difficulty."""
         self.difficulty = difficulty
@@ -115,11 +250,19 @@ class NewTrainScreen(Screen):
             except (ValueError, AttributeError):
                 min_range = 0
                 max_range = 10
-            
-            training_screen.setup_custom_training(min_range, max_range, self.time_per_question)
         else:
-            training_screen.setup_training(self.difficulty, self.time_per_question)
+            min_range, max_range = DIFFICULTY_RANGES[self.difficulty]
         
+        try:
+            training_screen.setup_training(
+                self.operation, self.time_per_question, min_range, max_range
+            )
+        except ValueError as error:
+            # e.g. division over a range without a positive divisor
+            self.error_text = str(error)
+            return
+        
+        self.error_text = ""
         app.root.current = 'training'
 
 
@@ -132,300 +275,266 @@ class TrainingScreen(Screen):
     
     def __init__(self, **kwargs):
         super().__init__(**kwargs)
-        self.current_num1 = 0
-        self.current_num2 = 0
-        self.correct_answer = 0
-        self.remaining_time = 10
-        self.time_per_question = 10
-        self.difficulty = "Easy"
-        self.min_range = 0
-        self.max_range = 10
-        self.total_questions = 0
-        self.correct_answers = 0
-        self.timer_event = None
+        # Training logic lives in the session; the screen only drives it
+        self.session = None
+        self.tracer = App.get_running_app().tracer
+        self.question_timer = None
+        # One timer event for the screen's lifetime, started and stopped
+        # rather than re-created for every question
+        self._timer_tick = Clock.create_trigger(self._on_timer_tick, TIMER_TICK, interval=True)
         self.current_sound = None
-        self.current_temp_file = None
-        # Track question history for results screen
-        self.question_history = []
-        # Track time for each question
-        self.question_start_time = None
-        self.unlimited_timer_event = None
-    
-    def setup_training(self, difficulty, time_per_question):
-        """Setup training parameters."""
-        self.difficulty = difficulty
-        self.time_per_question = time_per_question
-        self.remaining_time = time_per_question
-        self.total_questions = 0
-        self.correct_answers = 0
-        self.question_history = []  # Reset history for new session
-        
-        # Set number ranges based on difficulty
-        if difficulty == "Easy":
-            self.min_range = 0
-            self.max_range = 10
-        elif difficulty == "Medium":
-            self.min_range = 10
-            self.max_range = 20
-        elif difficulty == "Hard":
-            self.min_range = 20
-            self.max_range = 100
-        
-        self.generate_question()
-        self.start_timer()
+        self.question_pipeline = None
+        # Wrong-answer popup, built on first use and then reused
+        self._result_popup = None
+        self._result_label = None
+        self._popup_shown = False
+    
+    def setup_training(self, difficulty, time_per_question, min_range=None, max_range=None):
+        """Setup training parameters.
+        
+        difficulty is a preset, a generator spec, or a generator name with
+        a range (see TrainingSession).
+        """
+        self.start_session(
+            TrainingSession(difficulty, time_per_question, min_range, max_range)
+        )
     
-    def setup_custom_training(self, min_range, max_range, time_per_question):
-        """Setup custom training parameters."""
-        self.difficulty = "Custom"
-        self.min_range = min_range
-        self.max_range = max_range
-        self.time_per_question = time_per_question
-        self.remaining_time = time_per_question
-        self.total_questions = 0
-        self.correct_answers = 0
-        self.question_history = []  # Reset history for new session
-        
+    def start_session(self, session):
+        """Start driving a new training session."""
+        self.session = session
+        record_dir = recording_dir()
+        if record_dir:
+            os.makedirs(record_dir, exist_ok=True)
+            session.recorder = SessionRecorder(
+                os.path.join(record_dir, f"{session.uid}.jsonl"), session
+            )
+        self.question_timer = QuestionTimer(session)
+        self.load_fact_history()
+        self.prefetch_audio()
+        self.start_question_pipeline()
         self.generate_question()
         self.start_timer()
     
-    def generate_question(self):
-        """Generate a new question."""
-        self.current_num1 = random.randint(self.min_range, self.max_range)
-        self.current_num2 = random.randint(self.min_range, self.max_range)
-        self.correct_answer = self.current_num1 * self.current_num2
-        
-        self.question_text = f"{self.current_num1} x {self.current_num2} = ?"
-        self.score_text = f"Score: {self.correct_answers}/{self.total_questions}"
-        
-        # Start tracking time for this question
-        self.question_start_time = time.time()
-        
-        # Clean up previous audio if still playing
-        if self.current_sound:
-            self.current_sound.stop()
-        if self.current_temp_file:
-            self._cleanup_temp_file(self.current_temp_file)
-        
-        # Speak the question if voice is enabled
+    def load_fact_history(self):
+        """Load the stored per-fact statistics into the session's scheduler.
+        
+        Runs on the database thread; until it is done every fact is equally
+        likely.
+        """
+        scheduler = self.session.scheduler
+        if scheduler is None:
+            return  # only multiplication facts are scheduled
+        min_range, max_range = self.session.min_range, self.session.max_range
+        App.get_running_app().async_db.run(
+            lambda db: scheduler.load_facts(db.get_fact_stats(min_range, max_range))
+        )
+    
+    def prefetch_audio(self):
+        """Warm the audio cache for the current range in the background."""
         app = App.get_running_app()
-        if app.voice_enabled and TTS_AVAILABLE:
-            try:
-                # Create speech text
-                speech_text = f"{self.current_num1} times {self.current_num2}"
-                
-                # Generate speech audio file
-                tts = gTTS(text=speech_text, lang='en', slow=False)
-                
-                # Save to temporary file
-                with tempfile.NamedTemporaryFile(delete=False, suffix='.mp3') as fp:
-                    temp_file = fp.name
-                    tts.save(temp_file)
-                
-                # Play the audio file using Kivy's SoundLoader
-                sound = SoundLoader.load(temp_file)
-                if sound:
-                    self.current_sound = sound
-                    self.current_temp_file = temp_file
-                    
-                    # Bind to on_stop event to clean up after playback
-                    sound.bind(on_stop=lambda instance: self._cleanup_temp_file(temp_file))
-                    sound.play()
-                else:
-                    # If sound loading fails, clean up immediately
-                    self._cleanup_temp_file(temp_file)
-            except Exception:
-                # Silently fail if TTS doesn't work
-                pass
+        # The cache prefetches multiplication questions
+        if app.voice_enabled and app.audio_cache and self.session.generator.adaptive:
+            app.audio_cache.start_prefetch(self.session.min_range, self.session.max_range)
+    
+    def start_question_pipeline(self):
+        """Start preparing questions for the current range ahead of time."""
+        self.stop_question_pipeline()
+        app = App.get_running_app()
+        load_sound = self._load_question_sound if app.voice_enabled and app.audio_cache else None
+        self.question_pipeline = QuestionPipeline(self.session.pick, load_sound)
+        self.question_pipeline.start()
+    
+    def stop_question_pipeline(self):
+        """Stop the question pipeline and drop the questions it prepared."""
+        if self.question_pipeline:
+            self.question_pipeline.stop()
+            self.question_pipeline = None
+    
+    def _load_question_sound(self, question):
+        """Load the spoken question (runs on the pipeline thread)."""
+        # Cached clips load immediately; a miss synthesizes and stores one
+        from kivy.core.audio import SoundLoader
+        from generators import spoken_text
+        trace = self.tracer.begin('load_question_sound')
+        clip = App.get_running_app().audio_cache.get_or_create(spoken_text(question.expression))
+        trace.phase('tts')
+        sound = SoundLoader.load(clip)
+        trace.phase('decode')
+        trace.end()
+        return sound
+    
+    def generate_question(self):
+        """Show the next prepared question."""
+        trace = self.tracer.begin('generate_question')
+        prepared = self.question_pipeline.next()
+        trace.phase('pipeline')
+        # Starts timing the question
+        question = self.session.next_question(prepared.question)
+        
+        self.question_text = question.text
+        self.score_text = self.session.score_text
+        trace.phase('display')
+        
+        # Stop previous audio if still playing
+        self._stop_sound()
+        
+        # Speak the question; its audio was loaded by the pipeline
+        if prepared.sound:
+            self.current_sound = prepared.sound
+            prepared.sound.play()
+        trace.phase('sound')
         
         # Set focus on answer input field
         Clock.schedule_once(lambda dt: self.focus_answer_input(), FOCUS_DELAY)
+        trace.end()
     
-    def _cleanup_temp_file(self, filepath):
-        """Clean up temporary audio file."""
-        try:
-            if os.path.exists(filepath):
-                os.remove(filepath)
-            if self.current_temp_file == filepath:
-                self.current_temp_file = None
-        except Exception:
-            pass
+    def _stop_sound(self):
+        """Stop and release the current question audio."""
+        if self.current_sound:
+            self.current_sound.stop()
+            self.current_sound.unload()
+            self.current_sound = None
     
     def start_timer(self):
-        """Start the countdown timer."""
-        self.remaining_time = self.time_per_question
-        
-        # Handle unlimited time mode
-        if self.time_per_question == UNLIMITED_TIME:
-            self.timer_text = "Time: 0s"
-            # Don't start a countdown timer, but start counting up
-            if self.timer_event:
-                self.timer_event.cancel()
-            # Start counting up for unlimited mode
-            if self.unlimited_timer_event:
-                self.unlimited_timer_event.cancel()
-            self.unlimited_timer_event = Clock.schedule_interval(self.update_unlimited_timer, 1)
-            return
-        
-        self.timer_text = f"Time: {self.remaining_time}"
-        
-        if self.timer_event:
-            self.timer_event.cancel()
-        
-        if self.unlimited_timer_event:
-            self.unlimited_timer_event.cancel()
-        
-        self.timer_event = Clock.schedule_interval(self.update_timer, 1)
-    
-    def update_timer(self, dt):
-        """Update the countdown timer."""
-        self.remaining_time -= 1
-        self.timer_text = f"Time: {self.remaining_time}"
-        
-        if self.remaining_time <= 0:
+        """Start timing the current question."""
+        self.question_timer.reset()
+        self.timer_text = self.question_timer.update()
+        # No-op if already running
+        self._timer_tick()
+    
+    def stop_timer(self):
+        """Stop the timer until the next question starts."""
+        self._timer_tick.cancel()
+    
+    def _on_timer_tick(self, dt):
+        """Refresh the timer text and time out the question at its deadline."""
+        text = self.question_timer.update()
+        if text is not None:
+            self.timer_text = text
+        if self.question_timer.expired():
             self.check_answer("")
     
-    def update_unlimited_timer(self, dt):
-        """Update the count-up timer for unlimited mode."""
-        if self.question_start_time:
-            elapsed = int(time.time() - self.question_start_time)
-            self.timer_text = f"Time: {elapsed}s"
-    
     def check_answer(self, answer):
         """Check the user's answer."""
-        if self.timer_event:
-            self.timer_event.cancel()
-        if self.unlimited_timer_event:
-            self.unlimited_timer_event.cancel()
-        
-        # Calculate time taken for this question
-        time_taken = time.time() - self.question_start_time if self.question_start_time else 0
-        
-        self.total_questions += 1
+        trace = self.tracer.begin('check_answer')
+        self.stop_timer()
         
-        try:
-            user_answer = int(answer) if answer else -1
-        except ValueError:
-            user_answer = -1
-        
-        is_correct = user_answer == self.correct_answer
+        entry = self.session.answer(answer)
+        trace.phase('score')
         
-        if is_correct:
-            self.correct_answers += 1
+        # Queue the attempt for background persistence (no disk I/O here)
+        App.get_running_app().attempt_writer.add(self.session.attempt_row(entry))
+        trace.phase('queue_attempt')
         
-        # Save question history
-        self.question_history.append({
-            'question': f"{self.current_num1} x {self.current_num2}",
-            'user_answer': answer if answer else "(no answer)",
-            'correct_answer': self.correct_answer,
-            'is_correct': is_correct,
-            'time_taken': time_taken
-        })
-        
-        if is_correct:
+        if entry['is_correct']:
             # For correct answers, automatically go to next question without popup
             # This provides faster feedback and keeps the training flow smooth
             self.generate_question()
             self.start_timer()
+            trace.phase('next_question')
         else:
             # For wrong answers, show popup with correct answer and wait for user action
-            result_text = f"Wrong! The answer was {self.correct_answer}"
+            result_text = f"Wrong! The answer was {entry['correct_answer']}"
             self.show_result_popup(result_text)
+            trace.phase('popup')
+        trace.end()
     
-    def show_result_popup(self, result_text):
-        """Show result popup with keyboard navigation support."""
+    def _build_result_popup(self):
+        """Build the wrong-answer popup once; later answers reuse it."""
+        from kivy.uix.label import Label
+        from kivy.uix.popup import Popup
+        
         content = BoxLayout(orientation='vertical', padding=10, spacing=10)
-        content.add_widget(Label(text=result_text, size_hint=(1, 0.7)))
+        self._result_label = Label(size_hint=(1, 0.7))
+        content.add_widget(self._result_label)
         
         btn_layout = BoxLayout(size_hint=(1, 0.3), spacing=10)
         
         next_btn = Button(text='Next Question (Enter)')
         end_btn = Button(text='End Training (Esc)')
-        
-        popup = Popup(title='Result', content=content, size_hint=(0.8, 0.4))
-        
-        # Track if handler is bound to prevent double unbinding
-        handler_bound = [True]  # Use list for mutable closure variable
-        
-        def unbind_handler():
-            """Safely unbind the keyboard handler if still bound."""
-            if handler_bound[0]:
-                Window.unbind(on_keyboard=handle_keyboard)
-                handler_bound[0] = False
-        
-        def cleanup_and_next():
-            """Unbind keyboard and proceed to next question."""
-            unbind_handler()
-            popup.dismiss()
-            self.generate_question()
-            self.start_timer()
-        
-        def cleanup_and_end():
-            """Unbind keyboard and end training."""
-            unbind_handler()
-            popup.dismiss()
-            self.end_training_session()
-        
-        def handle_keyboard(instance, key, scancode, codepoint, modifier):
-            """Handle keyboard input in popup.
-            
-            Note: This handler unbinds itself before taking action to prevent
-            memory leaks and ensure clean lifecycle management.
-            """
-            if key == KEYCODE_ENTER:
-                cleanup_and_next()
-                return True
-            elif key == KEYCODE_ESCAPE:
-                cleanup_and_end()
-                return True
-            return False
-        
-        # Button handlers use the same cleanup functions
-        next_btn.bind(on_press=lambda instance: cleanup_and_next())
-        end_btn.bind(on_press=lambda instance: cleanup_and_end())
+        next_btn.bind(on_press=lambda instance: self.popup_next())
+        end_btn.bind(on_press=lambda instance: self.popup_end())
         
         btn_layout.add_widget(next_btn)
         btn_layout.add_widget(end_btn)
         content.add_widget(btn_layout)
         
-        # Bind keyboard immediately (before popup opens) to handle all cases
-        Window.bind(on_keyboard=handle_keyboard)
-        # Unbind on dismiss as safety cleanup for any programmatic dismissals
-        popup.bind(on_dismiss=lambda instance: unbind_handler())
-        
-        popup.open()
+        # Esc and outside taps are routed through handle_keyboard and the
+        # buttons instead of silently closing the popup
+        self._result_popup = Popup(
+            title='Result', content=content, size_hint=(0.8, 0.4), auto_dismiss=False
+        )
+    
+    def show_result_popup(self, result_text):
+        """Show result popup with keyboard navigation support.
+        
+        Keys are handled by the screen's own keyboard handler, which is
+        bound for as long as the screen is shown.
+        """
+        trace = self.tracer.begin('show_result_popup')
+        if self._result_popup is None:
+            self._build_result_popup()
+            trace.phase('build')
+        self._result_label.text = result_text
+        self._popup_shown = True
+        self._result_popup.open()
+        trace.phase('open')
+        trace.end()
+    
+    def _hide_result_popup(self):
+        """Close the result popup if it is showing; returns whether it was."""
+        if not self._popup_shown:
+            return False
+        self._popup_shown = False
+        # Without the fade-out the popup is free to be reopened immediately
+        self._result_popup.dismiss(animation=False)
+        return True
+    
+    def popup_next(self):
+        """Close the result popup and proceed to the next question."""
+        if self._hide_result_popup():
+            self.generate_question()
+            self.start_timer()
+    
+    def popup_end(self):
+        """Close the result popup and end training."""
+        if self._hide_result_popup():
+            self.end_training_session()
     
     def end_training_session(self):
         """End the training session and save results."""
-        if self.timer_event:
-            self.timer_event.cancel()
-        if self.unlimited_timer_event:
-            self.unlimited_timer_event.cancel()
+        trace = self.tracer.begin('end_training_session')
+        self.stop_timer()
         
         # Clean up audio
-        if self.current_sound:
-            self.current_sound.stop()
-        if self.current_temp_file:
-            self._cleanup_temp_file(self.current_temp_file)
+        self._stop_sound()
+        self.stop_question_pipeline()
+        self.session.finish()
+        trace.phase('cleanup')
         
-        # Save to database
-        if self.total_questions > 0:
-            db = Database()
-            db.add_training_session(
-                self.difficulty,
-                self.total_questions,
-                self.correct_answers,
-                self.time_per_question
-            )
+        # Save to database in the background so leaving the session never
+        # waits on disk I/O
+        app = App.get_running_app()
+        session = self.session
+        if session.total_questions > 0:
+            # Write the session's remaining attempts, then the session row,
+            # without waiting for either
+            app.async_db.run(save_session, session, app.db.profile_id,
+                             app.attempt_writer.flush(), self.tracer,
+                             callback=lambda uid: app.request_sync())
+        trace.phase('save')
         
         # Navigate to results screen
-        app = App.get_running_app()
         results_screen = app.root.get_screen('results')
         results_screen.show_results(
-            self.question_history,
-            self.correct_answers,
-            self.total_questions
+            session.history,
+            session.correct_answers,
+            session.total_questions
         )
+        trace.phase('results')
         app.root.current = 'results'
+        trace.phase('navigate')
+        trace.end()
     
     def on_enter(self):
         """Called when entering the screen."""
@@ -441,19 +550,26 @@ class TrainingScreen(Screen):
     def on_leave(self):
         """Called when leaving the screen."""
         Window.unbind(on_keyboard=self.handle_keyboard)
-        if self.timer_event:
-            self.timer_event.cancel()
-        if self.unlimited_timer_event:
-            self.unlimited_timer_event.cancel()
+        self.stop_timer()
+        
+        self._hide_result_popup()
         
         # Clean up audio
-        if self.current_sound:
-            self.current_sound.stop()
-        if self.current_temp_file:
-            self._cleanup_temp_file(self.current_temp_file)
+        self._stop_sound()
+        self.stop_question_pipeline()
+        if self.session:
+            self.session.finish()
     
     def handle_keyboard(self, instance, key, scancode, codepoint, modifier):
-        """Handle keyboard input during training."""
+        """Handle keyboard input during training and in the result popup."""
+        if self._popup_shown:
+            if key == KEYCODE_ENTER:
+                self.popup_next()
+                return True
+            if key == KEYCODE_ESCAPE:
+                self.popup_end()
+                return True
+            return False
         if key == KEYCODE_ESCAPE:
             self.end_training_session()
             return True
@@ -470,94 +586,157 @@ class SettingsScreen(Screen):
         self.custom_time = 10
 
 
+class StatsScreen(Screen):
+    """Progress screen with trends, percentiles and a per-fact heatmap."""
+    
+    summary_text = StringProperty(STATS_LOADING_TEXT)
+    difficulty_text = StringProperty("")
+    trend_text = StringProperty("")
+    heatmap_text = StringProperty("")
+    heatmap_texture = ObjectProperty(None, allownone=True)
+    
+    def on_enter(self):
+        """Called when entering the screen."""
+        self.update_report()
+    
+    def update_report(self):
+        """Request fresh analytics without blocking the UI thread."""
+        self.summary_text = STATS_LOADING_TEXT
+        App.get_running_app().async_db.run(
+            build_progress_report,
+            callback=self.show_report,
+            error_callback=self.show_report_error
+        )
+    
+    def show_report(self, report):
+        """Display analytics delivered by the database worker."""
+        self.summary_text = report['summary_text']
+        self.difficulty_text = report['difficulty_text']
+        self.trend_text = report['trend_text']
+        
+        image = report['heatmap']
+        if image is None:
+            self.heatmap_texture = None
+            self.heatmap_text = ""
+            return
+        height, width = image.shape[:2]
+        texture = Texture.create(size=(width, height), colorfmt='rgba')
+        texture.mag_filter = 'nearest'
+        # Texture rows start at the bottom; put the smallest first number on top
+        texture.blit_buffer(image[::-1].tobytes(), colorfmt='rgba', bufferfmt='ubyte')
+        self.heatmap_texture = texture
+        low, high = report['heatmap_range']
+        self.heatmap_text = f"Accuracy per fact {low}-{high} (rows: first number)"
+    
+    def show_report_error(self, error):
+        """Display a notice when analytics could not be computed."""
+        self.summary_text = "Progress is unavailable right now."
+        self.difficulty_text = ""
+        self.trend_text = ""
+
+
+class ResultRow(BoxLayout):
+    """One question in the results list (recycled by the RecycleView)."""
+    
+    number_text = StringProperty("")
+    question_text = StringProperty("")
+    answer_text = StringProperty("")
+    correct_text = StringProperty("")
+    time_text = StringProperty("")
+    status_text = StringProperty("")
+    is_correct = BooleanProperty(True)
+
+
 class ResultsScreen(Screen):
     """Results screen to show training summary."""
     
-    results_text = StringProperty("")
+    summary_text = StringProperty("")
     
     def show_results(self, question_history, correct_answers, total_questions):
-        """Display results from training session."""
-        # Calculate total time
-        total_time = sum(q['time_taken'] for q in question_history)
-        
-        # Build results text
-        results = []
-        results.append("=" * 50)
-        results.append("TRAINING RESULTS")
-        results.append("=" * 50)
+        """Display results from training session.
         
-        if total_questions > 0:
-            accuracy = correct_answers / total_questions * 100
-            average_time = total_time / total_questions
-            results.append(f"\nScore: {correct_answers}/{total_questions} ({accuracy:.1f}%)")
-            results.append(f"Total Time: {total_time:.1f} seconds")
-            results.append(f"Average Time per Question: {average_time:.1f}s\n")
-        else:
-            results.append("\nNo questions answered in this session.\n")
-        
-        results.append("=" * 50)
-        results.append("QUESTION DETAILS")
-        results.append("=" * 50)
-        
-        for i, q in enumerate(question_history, 1):
-            status = "✓" if q['is_correct'] else "✗"
-            results.append(f"\n{i}. {q['question']} = ?")
-            results.append(f"   Your answer: {q['user_answer']}")
-            results.append(f"   Correct answer: {q['correct_answer']}")
-            results.append(f"   Time: {q['time_taken']:.1f}s")
-            results.append(f"   {status} {'Correct' if q['is_correct'] else 'Incorrect'}")
-        
-        self.results_text = "\n".join(results)
+        Question details go to a RecycleView as plain row dicts, so only the
+        rows on screen get widgets, however long the session was.
+        """
+        summary_text, rows = summarize_history(
+            question_history, correct_answers, total_questions
+        )
+        self.summary_text = summary_text
+        self.ids.results_list.data = rows
+        self.ids.results_list.scroll_y = 1
+
+
+class LazyScreenManager(ScreenManager):
+    """ScreenManager that builds each screen the first time it is needed.
+    
+    Screens are registered with a factory and an optional kv file. The kv
+    rules are loaded and the screen is created on first navigation or
+    get_screen(); build_times records how long that took per screen.
+    """
+    
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self._factories = {}
+        self.build_times = {}
+    
+    def register(self, name, factory, kv_file=None):
+        """Register a screen to be built on first use."""
+        self._factories[name] = (factory, kv_file)
+    
+    def get_screen(self, name):
+        """Return the named screen, building it if needed."""
+        if name in self._factories:
+            self._build_screen(name)
+        return super().get_screen(name)
+    
+    def has_screen(self, name):
+        """Whether a screen is registered or built under this name."""
+        return name in self._factories or super().has_screen(name)
+    
+    def _build_screen(self, name):
+        """Load a registered screen's kv rules and create it."""
+        factory, kv_file = self._factories.pop(name)
+        start = time.perf_counter()
+        if kv_file:
+            Builder.load_file(os.path.join(KV_DIR, kv_file))
+        self.add_widget(factory(name=name))
+        self.build_times[name] = time.perf_counter() - start
 
 
 class BrainTrainerApp(App):
     """Main application class."""
     
     voice_enabled = BooleanProperty(False)
+    tts_engine = StringProperty('auto')  # 'auto', 'clips' (offline) or 'gtts'
     theme_mode = StringProperty('light')  # 'light' or 'dark'
+    profile_name = StringProperty(DEFAULT_PROFILE_NAME)  # whose history is shown
     
-    # Theme colors
-    theme_colors = DictProperty({
-        'light': {
-            'bg_primary': [0.96, 0.97, 0.98, 1],      # Very light gray-blue
-            'bg_secondary': [1, 1, 1, 1],              # White
-            'bg_card': [1, 1, 1, 1],                   # White
-            'text_primary': [0.13, 0.13, 0.13, 1],     # Dark gray
-            'text_secondary': [0.4, 0.4, 0.4, 1],      # Medium gray
-            'button_bg': [0.2, 0.51, 0.96, 1],         # Modern blue
-            'button_text': [1, 1, 1, 1],               # White
-            'button_bg_alt': [0.29, 0.76, 0.55, 1],    # Modern green
-            'accent': [0.5, 0.31, 0.94, 1],            # Purple accent
-            'border': [0.88, 0.89, 0.9, 1],            # Light border
-        },
-        'dark': {
-            'bg_primary': [0.11, 0.11, 0.13, 1],       # Very dark gray
-            'bg_secondary': [0.15, 0.15, 0.17, 1],     # Dark gray
-            'bg_card': [0.18, 0.18, 0.21, 1],          # Card background
-            'text_primary': [0.95, 0.95, 0.96, 1],     # Almost white
-            'text_secondary': [0.65, 0.65, 0.67, 1],   # Light gray
-            'button_bg': [0.27, 0.53, 0.95, 1],        # Modern blue
-            'button_text': [1, 1, 1, 1],               # White
-            'button_bg_alt': [0.29, 0.76, 0.55, 1],    # Modern green
-            'accent': [0.58, 0.42, 0.95, 1],           # Purple accent
-            'border': [0.25, 0.25, 0.28, 1],           # Dark border
-        }
-    })
+    # Current palette; kv rules bind to its per-color properties
+    theme = ObjectProperty(None)
     
     def __init__(self, **kwargs):
         super().__init__(**kwargs)
-        # Bind to theme_mode changes to update UI reactively
-        self.bind(theme_mode=self._on_theme_mode_change)
-    
-    def _on_theme_mode_change(self, *args):
-        """Called when theme_mode changes to trigger UI updates."""
-        # Force the theme_colors property to notify all bindings in KV file
-        # This ensures all app.get_color() calls are re-evaluated
-        self.property('theme_colors').dispatch(self)
+        # Shared database, opened once for the lifetime of the app
+        self.db = None
+        self.async_db = None
+        self.attempt_writer = None
+        self.audio_cache = None
+        self.settings_store = None
+        # Server URL history is synced to (None = sync off)
+        self.sync_server = None
+        self.sync_client = None
+        self.theme = Theme(self.theme_mode)
+        # Opt-in hot path tracing; costs one no-op call per phase when off
+        self.tracer = Tracer(enabled=tracing_requested())
+        self.trace_overlay = None
+    
+    def on_theme_mode(self, instance, value):
+        """Switch the palette; only colors that differ are dispatched."""
+        self.theme.apply(value)
     
     def get_color(self, color_key):
         """Get color for the current theme."""
-        return self.theme_colors[self.theme_mode].get(color_key, [1, 1, 1, 1])
+        return self.theme.color(color_key)
     
     def toggle_theme(self):
         """Toggle between light and dark theme."""
@@ -565,45 +744,148 @@ class BrainTrainerApp(App):
         self.save_settings()
     
     def load_settings(self):
-        """Load settings from file."""
-        try:
-            with open('brain_trainer_settings.json', 'r') as f:
-                settings = json.load(f)
-                self.voice_enabled = settings.get('voice_enabled', False)
-                self.theme_mode = settings.get('theme_mode', 'light')
-        except (FileNotFoundError, json.JSONDecodeError):
-            # Use defaults
-            pass
+        """Load settings and open the store that saves later changes."""
+        if SETTINGS_IN_DATABASE:
+            backend = DatabaseSettings(self.db, legacy_path=SETTINGS_FILE)
+        else:
+            backend = JsonSettingsFile(SETTINGS_FILE)
+        store = SettingsStore(backend)
+        settings = store.load()
+        self.voice_enabled = settings.get('voice_enabled', False)
+        self.theme_mode = settings.get('theme_mode', 'light')
+        self.tts_engine = settings.get('tts_engine', 'auto')
+        self.sync_server = settings.get('sync_server')
+        # Assigned last, so applying the loaded values saves nothing
+        self.settings_store = store
     
     def save_settings(self):
-        """Save settings to file."""
-        settings = {
+        """Queue the current settings; they are written in the background."""
+        if not self.settings_store:
+            return
+        self.settings_store.update({
             'voice_enabled': self.voice_enabled,
-            'theme_mode': self.theme_mode
-        }
-        with open('brain_trainer_settings.json', 'w') as f:
-            json.dump(settings, f)
+            'theme_mode': self.theme_mode,
+            'tts_engine': self.tts_engine
+        })
     
     def on_voice_enabled(self, instance, value):
         """Called when voice_enabled changes."""
+        # While settings load in build(), voice is set up once all are known
+        if value and self.settings_store:
+            self.setup_voice()
         self.save_settings()
     
+    def setup_voice(self):
+        """Load the speech stack and open the audio cache, once."""
+        if self.audio_cache:
+            return
+        # Imported here so apps without voice never pay for them
+        # Importing SoundLoader picks the audio provider; do it on the UI thread
+        from kivy.core.audio import SoundLoader
+        from tts_backends import get_backend
+        from tts_cache import AudioCache
+        # Speech engine; clips are synthesized in memory and kept in the cache
+        tts_backend = get_backend(self.tts_engine)
+        if tts_backend:
+            self.audio_cache = AudioCache(tts_backend)
+    
     def build(self):
         """Build the application."""
-        # Load settings
+        # Open the database once; screens reuse its connections
+        self.db = Database()
         self.load_settings()
+        self.async_db = AsyncDatabase(self.db)
+        self.attempt_writer = AttemptWriter(self.db)
+        if self.voice_enabled:
+            self.setup_voice()
+        if self.sync_server:
+            # Imported here so startup without sync never loads urllib
+            from sync import SyncClient
+            self.sync_client = SyncClient(self.db, self.sync_server, interval=SYNC_INTERVAL)
+            self.sync_client.start()
         
         # Create screen manager
-        sm = ScreenManager()
+        sm = LazyScreenManager()
+        
+        # Register screens; each is built on first navigation
+        sm.register('main', MainScreen)
+        sm.register('new_train', NewTrainScreen, 'new_train.kv')
+        sm.register('training', TrainingScreen, 'training.kv')
+        sm.register('settings', SettingsScreen, 'settings.kv')
+        sm.register('results', ResultsScreen, 'results.kv')
+        sm.register('stats', StatsScreen, 'stats.kv')
+        sm.register('profiles', ProfileScreen, 'profiles.kv')
+        
+        # Shared devices start at the profile picker
+        profiles = self.db.get_profiles()
+        if len(profiles) > 1:
+            sm.current = 'profiles'
+        else:
+            self.select_profile(*profiles[0], root=sm)
         
-        # Add screens
-        sm.add_widget(MainScreen(name='main'))
-        sm.add_widget(NewTrainScreen(name='new_train'))
-        sm.add_widget(TrainingScreen(name='training'))
-        sm.add_widget(SettingsScreen(name='settings'))
-        sm.add_widget(ResultsScreen(name='results'))
+        if self.tracer.enabled:
+            self.start_tracing()
         
         return sm
+    
+    def request_sync(self):
+        """Sync new history now, if a sync server is configured."""
+        if self.sync_client:
+            self.sync_client.request_sync()
+    
+    def select_profile(self, profile_id, name, root=None):
+        """Make a profile current and show its main menu."""
+        self.db.profile_id = profile_id
+        self.profile_name = name
+        (root or self.root).current = 'main'
+    
+    def start_tracing(self):
+        """Trace frame intervals and bind the debug keys (F12 overlay, F11 dump)."""
+        self._last_frame = self.tracer.clock()
+        Clock.schedule_interval(self._trace_frame, 0)
+        Window.bind(on_keyboard=self._on_debug_key)
+    
+    def _trace_frame(self, dt):
+        """Record the time since the previous frame; long ones are stalls."""
+        now = self.tracer.clock()
+        self.tracer.record('frame', self._last_frame, now - self._last_frame)
+        self._last_frame = now
+    
+    def _on_debug_key(self, instance, key, scancode, codepoint, modifier):
+        """Toggle the trace overlay or write the trace file."""
+        if key == KEYCODE_F12:
+            if self.trace_overlay is None:
+                from debug_overlay import TraceOverlay
+                self.trace_overlay = TraceOverlay(self.tracer)
+            self.trace_overlay.toggle()
+            return True
+        if key == KEYCODE_F11:
+            self.dump_trace()
+            return True
+        return False
+    
+    def dump_trace(self):
+        """Write the recent spans to TRACE_FILE."""
+        count = self.tracer.dump(TRACE_FILE)
+        # Warning level, so it shows with the quiet log level set above
+        logger.warning("Wrote %d traced spans to %s", count, TRACE_FILE)
+    
+    def on_stop(self):
+        """Called when the application is closing."""
+        if self.tracer.enabled:
+            self.dump_trace()
+        if self.audio_cache:
+            self.audio_cache.stop_prefetch()
+        if self.attempt_writer:
+            self.attempt_writer.close()
+        if self.sync_client:
+            self.sync_client.stop(SYNC_STOP_TIMEOUT)
+        if self.settings_store:
+            self.settings_store.close()
+        if self.async_db:
+            self.async_db.close()
+        if self.db:
+            self.db.close()
 
 
 if __name__ == '__main__':
@@ -0,0 +1,107 @@
+"""Look-ahead preparation of training questions."""
+import logging
+import queue
+import threading
+from collections import namedtuple
+
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_DEPTH = 3
+
+# Seconds between checks that the producer is still alive while waiting
+PRODUCER_POLL = 0.1
+
+# A question ready to be shown and its already loaded sound (or None when
+# voice is off or unavailable)
+PreparedQuestion = namedtuple('PreparedQuestion', 'question sound')
+
+
+class QuestionPipeline:
+    """Keeps the next few questions prepared on a worker thread.
+
+    The producer picks the question and loads its audio ahead of time into
+    a bounded queue, so taking the next question is a constant-time
+    dequeue. If the consumer ever outruns the producer, it waits for the
+    producer's next question; a pipeline that was never started prepares
+    questions synchronously.
+    """
+
+    def __init__(self, pick_question, load_sound=None, depth=DEFAULT_DEPTH):
+        """Create a pipeline.
+
+        Args:
+            pick_question: Callable returning the next Question.
+            load_sound: Optional callable (question) -> sound handle or
+                None, called on the worker thread.
+            depth: Number of questions kept prepared.
+        """
+        self.pick_question = pick_question
+        self.load_sound = load_sound
+        self._queue = queue.Queue(maxsize=depth)
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        """Start filling the queue in the background."""
+        self._thread = threading.Thread(
+            target=self._run, name='question-pipeline', daemon=True
+        )
+        self._thread.start()
+
+    def next(self):
+        """Take the next prepared question.
+
+        While the producer runs this waits for it, so questions are always
+        picked by one thread and shown in the order they were picked.
+        Without a running producer the question is prepared here instead.
+        """
+        while self._thread is not None and self._thread.is_alive():
+            try:
+                return self._queue.get(timeout=PRODUCER_POLL)
+            except queue.Empty:
+                continue
+        try:
+            return self._queue.get_nowait()
+        except queue.Empty:
+            return self._prepare()
+
+    def stop(self):
+        """Stop the producer and release any prepared audio."""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        while True:
+            try:
+                prepared = self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if prepared.sound:
+                prepared.sound.unload()
+
+    def _prepare(self):
+        """Build one question, loading its audio if enabled."""
+        question = self.pick_question()
+        sound = None
+        if self.load_sound:
+            try:
+                sound = self.load_sound(question)
+            except Exception as error:
+                # A missing clip must never hold up the question itself
+                logger.warning("Could not prepare question audio: %s", error)
+        return PreparedQuestion(question, sound)
+
+    def _run(self):
+        """Producer loop; blocks while the queue is full."""
+        while not self._stop.is_set():
+            prepared = self._prepare()
+            while not self._stop.is_set():
+                try:
+                    self._queue.put(prepared, timeout=PRODUCER_POLL)
+                    break
+                except queue.Full:
+                    continue
+            else:
+                if prepared.sound:
+                    prepared.sound.unload()
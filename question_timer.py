@@ -0,0 +1,75 @@
+"""Per-question timer display, computed from a deadline on a monotonic clock."""
+import math
+
+
+# Below this many seconds left the countdown shows tenths of a second
+FINE_DISPLAY_BELOW = 3.0
+
+
+class QuestionTimer:
+    """Timer text for the current question of a TrainingSession.
+
+    Nothing is counted down: remaining time is derived from the question's
+    start on the session's clock whenever the timer is read, so late or
+    irregular ticks never make it drift and the timeout is detected at the
+    first tick after the deadline. update() only returns text when the
+    displayed value changes, so ticking often costs no redraws.
+    """
+
+    def __init__(self, session, fine_below=FINE_DISPLAY_BELOW):
+        """Create a timer for a session.
+
+        Args:
+            session: The TrainingSession whose current question is timed.
+            fine_below: Seconds left below which the countdown shows tenths
+                (0 = whole seconds only).
+        """
+        self.session = session
+        self.fine_below = fine_below
+        self._shown = None
+
+    def reset(self):
+        """Forget the displayed value, e.g. when a new question starts."""
+        self._shown = None
+
+    def remaining(self):
+        """Seconds left for the current question; None when unlimited."""
+        limit = self.session.time_per_question
+        if not limit:
+            return None
+        return max(0.0, limit - self.session.elapsed())
+
+    def expired(self):
+        """Whether the current question has run out of time."""
+        remaining = self.remaining()
+        return remaining is not None and remaining <= 0
+
+    def _display(self):
+        """(fine, value) as displayed; value is in tenths when fine."""
+        remaining = self.remaining()
+        if remaining is None:
+            # Unlimited: count up in whole seconds
+            return False, int(self.session.elapsed())
+        if remaining < self.fine_below:
+            return True, math.ceil(remaining * 10)
+        return False, math.ceil(remaining)
+
+    def text(self):
+        """Timer text for the current moment."""
+        return self._format(*self._display())
+
+    def update(self):
+        """Return the timer text if it changed since the last call, else None."""
+        shown = self._display()
+        if shown == self._shown:
+            return None
+        self._shown = shown
+        return self._format(*shown)
+
+    def _format(self, fine, value):
+        """Format a displayed value."""
+        if self.session.time_per_question:
+            if fine:
+                return f"Time: {value / 10:.1f}"
+            return f"Time: {value}"
+        return f"Time: {value}s"
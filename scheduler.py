@@ -0,0 +1,191 @@
+"""Adaptive selection of multiplication facts."""
+import random
+import threading
+from array import array
+
+
+# Weight of a fact that has never been asked
+NEW_FACT_WEIGHT = 1.0
+# Floor so mastered facts still come up now and then
+MIN_WEIGHT = 0.2
+# Extra weight of a fact that is always answered wrong
+ERROR_WEIGHT = 4.0
+# Answer time (seconds) counted as "slow"; slowness adds up to MAX_SLOWNESS
+TARGET_TIME = 3.0
+MAX_SLOWNESS = 3.0
+# Smoothing factor of the moving averages (higher reacts faster)
+EMA_ALPHA = 0.3
+# Largest number of facts tracked individually (e.g. 0-1000 x 0-1000)
+MAX_FACTS = 1001 * 1001
+
+
+class FenwickTree:
+    """Binary indexed tree over non-negative weights.
+
+    Supports changing one weight and sampling an index in proportion to its
+    weight in O(log n), so weights never have to be rebuilt between draws.
+    Weights start out equal to a common baseline; the tree only stores the
+    differences from it, so creating even a very large tree is O(1) work.
+    """
+
+    def __init__(self, size, baseline=0.0):
+        """Create a tree of size weights, all equal to baseline."""
+        self.size = size
+        self.baseline = baseline
+        self._tree = array('d', bytes(8 * (size + 1)))
+        self._top_bit = 1 << (size.bit_length() - 1) if size else 0
+
+    def add(self, index, delta):
+        """Add delta to the weight at index (0-based)."""
+        i = index + 1
+        tree = self._tree
+        while i <= self.size:
+            tree[i] += delta
+            i += i & -i
+
+    def total(self):
+        """Sum of all weights."""
+        i = self.size
+        result = self.baseline * self.size
+        while i > 0:
+            result += self._tree[i]
+            i -= i & -i
+        return result
+
+    def find(self, value):
+        """Index whose cumulative weight range contains value."""
+        index = 0
+        bit = self._top_bit
+        tree = self._tree
+        baseline = self.baseline
+        while bit:
+            next_index = index + bit
+            # Node next_index covers exactly `bit` weights here
+            if next_index <= self.size:
+                node = tree[next_index] + baseline * bit
+                if node <= value:
+                    index = next_index
+                    value -= node
+            bit >>= 1
+        # Guard against floating point drift at the very end of the range
+        return min(index, self.size - 1)
+
+
+class UniformScheduler:
+    """Picks both operands uniformly; used for ranges too large to track."""
+
+    def __init__(self, min_range, max_range, rng=None):
+        """Create a scheduler for operands in [min_range, max_range]."""
+        self.min_range, self.max_range = sorted((min_range, max_range))
+        self.rng = rng or random.Random()
+
+    def pick(self):
+        """Return the (num1, num2) operands of the next question."""
+        return (self.rng.randint(self.min_range, self.max_range),
+                self.rng.randint(self.min_range, self.max_range))
+
+    def record(self, num1, num2, is_correct, time_taken):
+        """Uniform selection ignores answers."""
+
+    def load(self, attempts):
+        """Uniform selection ignores history."""
+
+    def load_facts(self, facts):
+        """Uniform selection ignores history."""
+
+
+class AdaptiveScheduler:
+    """Samples facts weighted toward slow and wrongly answered ones.
+
+    Every fact a x b of the range keeps a moving average of its error rate
+    and answer time in flat arrays. The sampling weight derived from them
+    lives in a Fenwick tree, so both recording an answer and drawing the next
+    fact cost O(log n) even for ranges with a million facts.
+    """
+
+    def __init__(self, min_range, max_range, rng=None):
+        """Create a scheduler for operands in [min_range, max_range]."""
+        self.min_range, self.max_range = sorted((min_range, max_range))
+        self.rng = rng or random.Random()
+        self.span = self.max_range - self.min_range + 1
+        size = self.span * self.span
+
+        self.attempts = array('I', bytes(4 * size))
+        self.ema_error = array('f', bytes(4 * size))
+        self.ema_time = array('f', bytes(4 * size))
+        self.weights = array('d', [NEW_FACT_WEIGHT]) * size
+        self._tree = FenwickTree(size, NEW_FACT_WEIGHT)
+        self._lock = threading.Lock()
+
+    def _index(self, num1, num2):
+        """Position of a fact in the arrays, or None if out of range."""
+        a = num1 - self.min_range
+        b = num2 - self.min_range
+        if 0 <= a < self.span and 0 <= b < self.span:
+            return a * self.span + b
+        return None
+
+    def weight(self, index):
+        """Sampling weight of a fact from its statistics."""
+        if not self.attempts[index]:
+            return NEW_FACT_WEIGHT
+        slowness = min(self.ema_time[index] / TARGET_TIME, MAX_SLOWNESS)
+        return MIN_WEIGHT + ERROR_WEIGHT * self.ema_error[index] + slowness
+
+    def pick(self):
+        """Return the (num1, num2) operands of the next question."""
+        with self._lock:
+            index = self._tree.find(self.rng.random() * self._tree.total())
+        a, b = divmod(index, self.span)
+        return a + self.min_range, b + self.min_range
+
+    def record(self, num1, num2, is_correct, time_taken):
+        """Update a fact's statistics with one answer."""
+        index = self._index(num1, num2)
+        if index is None:
+            return
+        error = 0.0 if is_correct else 1.0
+        with self._lock:
+            if self.attempts[index]:
+                self.ema_error[index] += EMA_ALPHA * (error - self.ema_error[index])
+                self.ema_time[index] += EMA_ALPHA * (time_taken - self.ema_time[index])
+            else:
+                self.ema_error[index] = error
+                self.ema_time[index] = time_taken
+            self.attempts[index] = min(self.attempts[index] + 1, 0xFFFFFFFF)
+
+            new_weight = self.weight(index)
+            self._tree.add(index, new_weight - self.weights[index])
+            self.weights[index] = new_weight
+
+    def load(self, attempts):
+        """Replay stored (num1, num2, is_correct, time_taken) attempts, oldest first."""
+        for num1, num2, is_correct, time_taken in attempts:
+            self.record(num1, num2, is_correct, time_taken)
+
+    def load_facts(self, facts):
+        """Take stored (num1, num2, attempts, ema_error, ema_time) statistics.
+
+        Costs O(log n) per fact rather than per attempt. Facts already
+        answered in this session keep their statistics.
+        """
+        with self._lock:
+            for num1, num2, attempts, ema_error, ema_time in facts:
+                index = self._index(num1, num2)
+                if index is None or self.attempts[index]:
+                    continue
+                self.attempts[index] = min(attempts, 0xFFFFFFFF)
+                self.ema_error[index] = ema_error
+                self.ema_time[index] = ema_time
+
+                new_weight = self.weight(index)
+                self._tree.add(index, new_weight - self.weights[index])
+                self.weights[index] = new_weight
+
+
+def create_scheduler(min_range, max_range, rng=None):
+    """Adaptive scheduler for the range, or a uniform one if it is too large."""
+    span = abs(max_range - min_range) + 1
+    if span * span > MAX_FACTS:
+        return UniformScheduler(min_range, max_range, rng)
+    return AdaptiveScheduler(min_range, max_range, rng)
@@ -0,0 +1,218 @@
+"""Training session logic, independent of the Kivy UI."""
+import random
+import threading
+import time
+import uuid
+from collections import deque
+
+from generators import DIFFICULTY_RANGES, BATCH_SIZE, Question, get_generator
+from scheduler import create_scheduler
+
+
+# Answer recorded for questions left blank or timed out
+NO_ANSWER = -1
+
+
+def make_question(num1, num2):
+    """Build the multiplication question for two operands."""
+    return Question(num1, num2, num1 * num2, f"{num1} x {num2}")
+
+
+class TrainingSession:
+    """State and scoring of one training session.
+
+    The session asks questions, times and checks the answers and keeps the
+    history. It has no UI dependencies: the clock and random number
+    generator are injectable, so the same logic drives the Kivy screen, the
+    headless simulator and tests.
+
+    Questions come from a generator (see generators.py). Multiplication
+    facts are picked by the adaptive scheduler; other generators' questions
+    are drawn in batches from a NumPy generator seeded from rng.
+    """
+
+    def __init__(self, difficulty='Easy', time_per_question=10, min_range=None,
+                 max_range=None, clock=time.monotonic, rng=None, scheduler=None,
+                 keep_history=True, seed=None):
+        """Create a session.
+
+        Args:
+            difficulty: 'Easy', 'Medium' or 'Hard', a generator spec such
+                as 'addition:0-20', or a generator name ('Custom' for
+                multiplication) with min_range and max_range.
+            time_per_question: Seconds allowed per question (0 = unlimited).
+            min_range, max_range: Operand range of a generator name.
+            clock: Callable returning the current time in seconds.
+            rng: random.Random used to pick questions; by default one
+                seeded with seed.
+            scheduler: Fact scheduler of a multiplication session; an
+                adaptive one for the range is created when omitted.
+            keep_history: Whether to keep every answered question in
+                history (disable for very long simulated sessions).
+            seed: Seed of the default rng; a random one is chosen when
+                omitted and kept in self.seed, so the session can be
+                recorded and repeated.
+        """
+        self.generator = get_generator(difficulty, min_range, max_range)
+        # Stored with the session: the generator and its range
+        self.difficulty = self.generator.label
+        self.time_per_question = time_per_question
+        self.min_range = self.generator.min_range
+        self.max_range = self.generator.max_range
+        self.clock = clock
+        self.seed = None
+        if rng is None:
+            self.seed = random.getrandbits(63) if seed is None else seed
+            rng = random.Random(self.seed)
+        self.rng = rng
+        self.scheduler = None
+        if self.generator.adaptive:
+            self.scheduler = scheduler or create_scheduler(
+                self.min_range, self.max_range, self.rng
+            )
+        self._batch = deque()
+        self._batch_rng = None
+        # pick() runs on a question pipeline's worker thread, but may also be
+        # called directly from other threads
+        self._batch_lock = threading.Lock()
+        self.keep_history = keep_history
+        self.uid = uuid.uuid4().hex
+        # Optional session_log.SessionRecorder logging questions and answers
+        self.recorder = None
+
+        self.total_questions = 0
+        self.correct_answers = 0
+        self.history = []
+        self.current = None
+        self.question_start = None
+
+    @property
+    def score_text(self):
+        """Score shown during the session."""
+        return f"Score: {self.correct_answers}/{self.total_questions}"
+
+    def pick(self):
+        """Choose the next question without starting it.
+
+        Called by the question pipeline's worker thread; safe to call from
+        several threads.
+        """
+        if self.scheduler:
+            return self.generator.question(*self.scheduler.pick())
+        with self._batch_lock:
+            if not self._batch:
+                if self._batch_rng is None:
+                    # Imported here so multiplication-only use never loads NumPy
+                    import numpy as np
+                    self._batch_rng = np.random.default_rng(self.rng.getrandbits(64))
+                self._batch.extend(self.generator.batch(self._batch_rng, BATCH_SIZE))
+            return self._batch.popleft()
+
+    def next_question(self, question=None):
+        """Start the next question and return it.
+
+        The question is picked now unless given (e.g. when it was prepared
+        ahead of time).
+        """
+        self.current = question or self.pick()
+        self.question_start = self.clock()
+        if self.recorder:
+            self.recorder.question(self.question_start, self.current)
+        return self.current
+
+    def elapsed(self):
+        """Seconds spent on the current question so far."""
+        if self.question_start is None:
+            return 0
+        return self.clock() - self.question_start
+
+    def answer(self, answer):
+        """Check an answer to the current question and record it.
+
+        Args:
+            answer: The text entered by the user; empty for no answer.
+
+        Returns:
+            The history entry of the answered question.
+        """
+        question = self.current
+        time_taken = self.elapsed()
+        if self.recorder:
+            self.recorder.answer(self.question_start + time_taken, answer)
+
+        try:
+            user_answer = int(answer) if answer else NO_ANSWER
+        except ValueError:
+            user_answer = NO_ANSWER
+
+        is_correct = user_answer == question.answer
+        self.total_questions += 1
+        if is_correct:
+            self.correct_answers += 1
+
+        # Steer upcoming questions toward slow or wrongly answered facts
+        if self.scheduler:
+            self.scheduler.record(question.num1, question.num2, is_correct, time_taken)
+
+        entry = {
+            'seq': self.total_questions,
+            'num1': question.num1,
+            'num2': question.num2,
+            'question': question.expression,
+            'user_answer': answer if answer else "(no answer)",
+            'correct_answer': question.answer,
+            'is_correct': is_correct,
+            'time_taken': time_taken
+        }
+        if self.keep_history:
+            self.history.append(entry)
+        return entry
+
+    def finish(self):
+        """End the session, completing its recording if any."""
+        if self.recorder:
+            self.recorder.close(self.clock())
+            self.recorder = None
+
+    def attempt_row(self, entry):
+        """Database row (ATTEMPT_COLUMNS order) for a history entry."""
+        answered = entry['user_answer'] != "(no answer)"
+        return (
+            self.uid, entry['seq'], entry['num1'], entry['num2'], entry['question'],
+            entry['user_answer'] if answered else None,
+            entry['correct_answer'], int(entry['is_correct']), entry['time_taken']
+        )
+
+
+def summarize_history(history, correct_answers, total_questions):
+    """Summary text and result rows of a finished session, in one pass.
+
+    Returns (summary_text, rows) where rows are small dicts, one per
+    question, ready to be used as RecycleView data.
+    """
+    rows = []
+    total_time = 0.0
+    for index, entry in enumerate(history, 1):
+        total_time += entry['time_taken']
+        is_correct = entry['is_correct']
+        rows.append({
+            'number_text': f"{index}.",
+            'question_text': f"{entry['question']} = ?",
+            'answer_text': f"Your answer: {entry['user_answer']}",
+            'correct_text': f"Correct answer: {entry['correct_answer']}",
+            'time_text': f"{entry['time_taken']:.1f}s",
+            'status_text': "✓ Correct" if is_correct else "✗ Incorrect",
+            'is_correct': is_correct,
+        })
+
+    if total_questions > 0:
+        accuracy = correct_answers / total_questions * 100
+        average_time = total_time / total_questions
+        summary_text = (
+            f"Score: {correct_answers}/{total_questions} ({accuracy:.1f}%)\n"
+            f"Total Time: {total_time:.1f} seconds\n"
+            f"Average Time per Question: {average_time:.1f}s"
+        )
+    else:
+        summary_text = "No questions answered in this session."
+    return summary_text, rows
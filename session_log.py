@@ -0,0 +1,231 @@
+#!/usr/bin/env python
+"""Recording and replay of training sessions.
+
+A recorded session is a small append-only JSON Lines file: a header with
+the session's seed and settings, then one short line per question shown
+and per answer given, stamped with the session clock (seconds since the
+session started), and a last line when the session ends:
+
+    {"version": 1, "seed": 123, "difficulty": "Hard", ...}
+    ["q", 0.0, 23, 41, 943, "23 x 41"]
+    ["a", 4.812, "943"]
+    ["e", 61.3]
+
+Replaying feeds the logged questions and answers back through a
+TrainingSession, as fast as possible or at the recorded pace. The
+questions come from the log rather than the seed, because in the app the
+adaptive scheduler also depends on history loaded in the background.
+Captured sessions can so be rerun as repeatable benchmarks of the
+engine and persistence paths (and, in benchmark.py, of the training
+screen).
+
+The app records every session into a directory when BRAIN_TRAINER_RECORD
+is set to it.
+
+Usage:
+    BRAIN_TRAINER_RECORD=recordings python main.py
+    python session_log.py recordings/*.jsonl
+    python session_log.py recordings/*.jsonl --realtime --db replay.db
+"""
+import argparse
+import json
+import os
+import time
+
+from generators import Question
+from session_engine import TrainingSession
+from simulate import SimulatedClock
+
+
+LOG_VERSION = 1
+RECORD_ENV = 'BRAIN_TRAINER_RECORD'
+
+# Event kinds
+QUESTION = 'q'
+ANSWER = 'a'
+END = 'e'
+
+# Timestamps are stored in microseconds of precision
+TIME_DIGITS = 6
+
+
+class ReplayError(Exception):
+    """A replay asked a different question than the log records."""
+
+
+def recording_dir():
+    """Directory the app records sessions into, or None when not recording."""
+    return os.environ.get(RECORD_ENV) or None
+
+
+class SessionRecorder:
+    """Appends the events of one session to its log as they happen.
+
+    Lines go through the file's buffer, so recording adds no disk write to
+    most answers; the log is complete once close() has run.
+    """
+
+    def __init__(self, path, session):
+        """Start the log of session at path, writing its header."""
+        self._file = open(path, 'a', encoding='utf-8')
+        self._start = session.clock()
+        self._write({
+            'version': LOG_VERSION,
+            'seed': session.seed,
+            'difficulty': session.difficulty,
+            'time_per_question': session.time_per_question,
+            'uid': session.uid,
+            'started': int(time.time()),
+        })
+
+    def _write(self, record):
+        self._file.write(json.dumps(record, ensure_ascii=False, separators=(',', ':')))
+        self._file.write('\n')
+
+    def _offset(self, now):
+        return round(now - self._start, TIME_DIGITS)
+
+    def question(self, now, question):
+        """Record a question shown at session clock time now."""
+        self._write([QUESTION, self._offset(now), *question])
+
+    def answer(self, now, answer):
+        """Record an answer (text as entered, '' for none) given at now."""
+        self._write([ANSWER, self._offset(now), answer])
+
+    def close(self, now):
+        """Record the end of the session and close the log."""
+        self._write([END, self._offset(now)])
+        self._file.close()
+
+
+class SessionLog:
+    """A recorded session read back from its log."""
+
+    def __init__(self, header, events):
+        self.header = header
+        self.events = events
+
+    @classmethod
+    def read(cls, path):
+        """Read a log; raises ValueError for an unsupported version."""
+        with open(path, encoding='utf-8') as f:
+            header = json.loads(f.readline())
+            if header.get('version') != LOG_VERSION:
+                raise ValueError(f"Unsupported session log version in {path}")
+            events = [json.loads(line) for line in f if line.strip()]
+        return cls(header, events)
+
+    @property
+    def duration(self):
+        """Recorded length of the session in seconds."""
+        return self.events[-1][1] if self.events else 0.0
+
+    def questions(self):
+        """The questions asked, in order."""
+        return [Question(*event[2:]) for event in self.events if event[0] == QUESTION]
+
+
+class ReplaySession(TrainingSession):
+    """A training session whose questions are those of a log, in order.
+
+    Once the logged questions are used up (e.g. by a question pipeline
+    preparing ahead), questions are picked as usual.
+    """
+
+    def __init__(self, log, clock=time.monotonic, keep_history=True):
+        header = log.header
+        super().__init__(
+            header['difficulty'], header['time_per_question'], clock=clock,
+            seed=header['seed'], keep_history=keep_history
+        )
+        self._logged = iter(log.questions())
+
+    def pick(self):
+        question = next(self._logged, None)
+        return question if question is not None else super().pick()
+
+    def check_question(self, payload):
+        """Raise ReplayError unless the current question is the one of a
+        logged QUESTION event (its payload)."""
+        expected = Question(*payload)
+        if self.current != expected:
+            asked = self.current.expression if self.current else None
+            raise ReplayError(
+                f"Question {self.total_questions + 1}: log has {expected.expression!r}, "
+                f"replay asked {asked!r}"
+            )
+
+
+def replay(log, db=None, realtime=False, sleep=time.sleep):
+    """Replay a log through a fresh session and return a summary dict.
+
+    Args:
+        log: SessionLog to replay.
+        db: Optional Database; attempts then go through an AttemptWriter
+            and the session row is stored at the end, as in the app.
+        realtime: Wait between events as long as the recorded session
+            did, instead of replaying them back to back.
+    """
+    clock = SimulatedClock()
+    session = ReplaySession(log, clock, keep_history=False)
+    writer = None
+    if db is not None:
+        from attempt_writer import AttemptWriter
+        writer = AttemptWriter(db)
+
+    started = time.perf_counter()
+    for kind, offset, *payload in log.events:
+        if realtime:
+            sleep(max(0.0, started + offset - time.perf_counter()))
+        clock.now = offset
+        if kind == QUESTION:
+            session.next_question(Question(*payload))
+        elif kind == ANSWER:
+            entry = session.answer(payload[0])
+            if writer:
+                writer.add(session.attempt_row(entry))
+    if writer:
+        writer.close()
+        db.add_training_session(
+            session.difficulty, session.total_questions, session.correct_answers,
+            session.time_per_question, uid=session.uid
+        )
+    elapsed = time.perf_counter() - started
+
+    return {
+        'questions': session.total_questions,
+        'correct_answers': session.correct_answers,
+        'recorded_seconds': log.duration,
+        'wall_seconds': elapsed,
+    }
+
+
+def main(argv=None):
+    """Command line entry point: replay logs."""
+    parser = argparse.ArgumentParser(description='Replay recorded training sessions')
+    parser.add_argument('logs', nargs='+', help='Session log files')
+    parser.add_argument('--realtime', action='store_true',
+                        help='Replay at the recorded pace instead of full speed')
+    parser.add_argument('--db', help='Also store the replayed sessions in this database')
+    args = parser.parse_args(argv)
+
+    db = None
+    if args.db:
+        from database import Database
+        db = Database(args.db)
+    try:
+        for path in args.logs:
+            result = replay(SessionLog.read(path), db, args.realtime)
+            print(f"{path}: {result['questions']} questions "
+                  f"({result['correct_answers']} correct), "
+                  f"recorded {result['recorded_seconds']:.1f} s, "
+                  f"replayed in {result['wall_seconds']:.3f} s")
+    finally:
+        if db:
+            db.close()
+    return 0
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
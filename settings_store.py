@@ -0,0 +1,179 @@
+"""Debounced, background persistence of app settings."""
+import json
+import logging
+import os
+import queue
+import threading
+import time
+
+
+logger = logging.getLogger(__name__)
+
+# Changes are written once no other change has arrived for this long
+DEFAULT_DEBOUNCE = 0.5  # seconds
+
+_CHANGED = object()
+_FLUSH = object()
+_STOP = object()
+
+
+class JsonSettingsFile:
+    """Settings kept in a JSON file, replaced atomically on every write."""
+
+    def __init__(self, path):
+        self.path = path
+
+    def read(self):
+        """Stored settings; {} when the file does not exist.
+
+        A file that cannot be parsed is moved aside to <path>.corrupt and
+        logged, rather than silently overwritten with defaults.
+        """
+        try:
+            with open(self.path, encoding='utf-8') as f:
+                settings = json.load(f)
+        except FileNotFoundError:
+            return {}
+        except (OSError, ValueError) as e:
+            logger.warning("Unreadable settings file %s (%s), using defaults", self.path, e)
+            try:
+                os.replace(self.path, f"{self.path}.corrupt")
+            except OSError:
+                pass
+            return {}
+        return settings if isinstance(settings, dict) else {}
+
+    def write(self, settings):
+        """Write settings to a temporary file, then rename it over the old one."""
+        temp_path = f"{self.path}.tmp"
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            json.dump(settings, f)
+            f.flush()
+            os.fsync(f.fileno())
+        # A crash before the rename leaves the previous settings intact
+        os.replace(temp_path, self.path)
+
+
+class DatabaseSettings:
+    """Settings kept in the settings table of a Database.
+
+    When the table is still empty, settings of a legacy JSON file are
+    imported once, so upgrading keeps them.
+    """
+
+    def __init__(self, db, legacy_path=None):
+        self.db = db
+        self.legacy_path = legacy_path
+
+    def read(self):
+        """Stored settings, importing the legacy file on first use."""
+        settings = self.db.get_settings()
+        if not settings and self.legacy_path and os.path.exists(self.legacy_path):
+            settings = JsonSettingsFile(self.legacy_path).read()
+            if settings:
+                self.db.save_settings(settings)
+        return settings
+
+    def write(self, settings):
+        """Store settings in one transaction."""
+        self.db.save_settings(settings)
+
+
+class SettingsStore:
+    """Settings in memory, written to a backend on a background thread.
+
+    update() only changes the in-memory copy and wakes the writer thread,
+    so the UI thread never touches the disk. The writer waits until no
+    change has arrived for `debounce` seconds and then stores the latest
+    settings once, so a burst of changes costs a single write.
+    """
+
+    def __init__(self, backend, debounce=DEFAULT_DEBOUNCE):
+        """Start the writer thread for a backend (JsonSettingsFile or DatabaseSettings)."""
+        self.backend = backend
+        self.debounce = debounce
+        self._settings = {}
+        self._dirty = False
+        self._lock = threading.Lock()
+        self._queue = queue.Queue()
+        self._thread = threading.Thread(
+            target=self._run, name='settings-writer', daemon=True
+        )
+        self._thread.start()
+
+    def load(self):
+        """Read the stored settings; returns a copy of them as a dict."""
+        settings = self.backend.read()
+        with self._lock:
+            self._settings = dict(settings)
+            self._dirty = False
+            return dict(self._settings)
+
+    def get(self, key, default=None):
+        """Current value of a setting."""
+        with self._lock:
+            return self._settings.get(key, default)
+
+    def update(self, changes):
+        """Change settings; they are written after the debounce window."""
+        with self._lock:
+            changes = {key: value for key, value in changes.items()
+                       if key not in self._settings or self._settings[key] != value}
+            if not changes:
+                return
+            self._settings.update(changes)
+            self._dirty = True
+        self._queue.put(_CHANGED)
+
+    def flush(self):
+        """Ask the writer to store pending changes now.
+
+        Returns a threading.Event that is set once they have been written.
+        """
+        done = threading.Event()
+        self._queue.put((_FLUSH, done))
+        return done
+
+    def close(self, timeout=None):
+        """Write pending changes and stop the writer thread."""
+        if self._thread.is_alive():
+            self._queue.put((_STOP, None))
+            self._thread.join(timeout)
+
+    def _run(self):
+        """Worker loop writing settings once changes settle."""
+        deadline = None
+        while True:
+            timeout = None if deadline is None else max(0.0, deadline - time.monotonic())
+            try:
+                item = self._queue.get(timeout=timeout)
+            except queue.Empty:
+                item = None
+
+            if item is _CHANGED:
+                # Every change restarts the window
+                deadline = time.monotonic() + self.debounce
+                continue
+
+            self._write()
+            deadline = None
+            if item is not None:
+                command, done = item
+                if done is not None:
+                    done.set()
+                if command is _STOP:
+                    return
+
+    def _write(self):
+        """Store the current settings if they changed, logging failures."""
+        with self._lock:
+            if not self._dirty:
+                return
+            settings = dict(self._settings)
+            self._dirty = False
+        try:
+            self.backend.write(settings)
+        except Exception:
+            logger.exception("Failed to save settings")
+            with self._lock:
+                self._dirty = True
@@ -0,0 +1,166 @@
+#!/usr/bin/env python
+"""Headless training simulator for load testing.
+
+Runs the training session engine without Kivy, answering questions with a
+simulated learner on a simulated clock, so millions of questions can be
+pushed through the scheduler (and optionally the persistence layer) in
+seconds.
+
+Usage:
+    python simulate.py --questions 1000000 --difficulty Hard
+    python simulate.py --questions 200000 --db simulation.db
+    python simulate.py --questions 1000000 --difficulty mixed:0-12
+    python simulate.py --questions 500 --difficulty Hard --record hard.jsonl
+"""
+import argparse
+import random
+import time
+
+from session_engine import TrainingSession
+
+
+class SimulatedClock:
+    """Clock that only moves when told to."""
+
+    def __init__(self, start=0.0):
+        self.now = start
+
+    def __call__(self):
+        return self.now
+
+    def advance(self, seconds):
+        """Move the clock forward."""
+        self.now += seconds
+
+
+class SimulatedLearner:
+    """Answers questions like a learner who finds some facts harder than others.
+
+    Each fact gets a fixed difficulty derived from its operands: harder facts
+    are answered wrongly more often and more slowly.
+    """
+
+    def __init__(self, rng, accuracy=0.8, mean_time=2.5):
+        """Create a learner with an overall accuracy and mean answer time."""
+        self.rng = rng
+        self.accuracy = accuracy
+        self.mean_time = mean_time
+
+    @staticmethod
+    def fact_difficulty(num1, num2):
+        """Stable pseudo-random difficulty of a fact, in [0, 1)."""
+        return ((num1 * 7919) ^ (num2 * 104729)) % 100 / 100
+
+    def respond(self, question):
+        """Return (answer text, seconds taken) for a question."""
+        difficulty = self.fact_difficulty(question.num1, question.num2)
+        p_correct = min(1.0, max(0.0, self.accuracy + (0.5 - difficulty) * 0.4))
+        time_taken = self.mean_time * (0.5 + difficulty) * self.rng.lognormvariate(0, 0.3)
+        if self.rng.random() < p_correct:
+            return str(question.answer), time_taken
+        return str(question.answer + 1), time_taken
+
+
+def simulate(questions, difficulty='Easy', min_range=None, max_range=None,
+             time_per_question=10, seed=None, accuracy=0.8, mean_time=2.5,
+             db=None, batch_size=1000, record=None):
+    """Simulate one long session and return a summary dict.
+
+    Args:
+        questions: Number of questions to answer.
+        db: Optional Database; attempts then go through an AttemptWriter
+            and the session row is stored at the end.
+        record: Optional path to record the session to (see session_log.py).
+    """
+    rng = random.Random(seed)
+    clock = SimulatedClock()
+    session = TrainingSession(
+        difficulty, time_per_question, min_range, max_range,
+        clock=clock, rng=rng, keep_history=False
+    )
+    learner = SimulatedLearner(random.Random(rng.random()), accuracy, mean_time)
+    if record:
+        from session_log import SessionRecorder
+        session.recorder = SessionRecorder(record, session)
+
+    writer = None
+    if db is not None:
+        from attempt_writer import AttemptWriter
+        writer = AttemptWriter(db, batch_size=batch_size)
+
+    started = time.perf_counter()
+    for _ in range(questions):
+        question = session.next_question()
+        answer, time_taken = learner.respond(question)
+        if time_per_question and time_taken >= time_per_question:
+            # Timed out, as the countdown in the app would
+            answer, time_taken = "", time_per_question
+        clock.advance(time_taken)
+        entry = session.answer(answer)
+        if writer:
+            writer.add(session.attempt_row(entry))
+    answered = time.perf_counter() - started
+    session.finish()
+
+    if writer:
+        writer.close()
+        db.add_training_session(
+            session.difficulty, session.total_questions, session.correct_answers,
+            session.time_per_question, uid=session.uid
+        )
+    elapsed = time.perf_counter() - started
+
+    return {
+        'questions': session.total_questions,
+        'correct_answers': session.correct_answers,
+        'simulated_seconds': clock.now,
+        'answer_seconds': answered,
+        'wall_seconds': elapsed,
+        'questions_per_minute': session.total_questions / elapsed * 60 if elapsed else 0,
+    }
+
+
+def main(argv=None):
+    """Command line entry point."""
+    parser = argparse.ArgumentParser(description='Simulate training sessions without a UI')
+    parser.add_argument('--questions', type=int, default=100000)
+    parser.add_argument('--difficulty', default='Easy',
+                        help="Easy, Medium, Hard, Custom (with --min and --max) or a "
+                             "generator spec such as addition:0-20")
+    parser.add_argument('--min', type=int, dest='min_range', help='Custom range minimum')
+    parser.add_argument('--max', type=int, dest='max_range', help='Custom range maximum')
+    parser.add_argument('--time', type=int, default=10, help='Seconds per question (0 = unlimited)')
+    parser.add_argument('--accuracy', type=float, default=0.8)
+    parser.add_argument('--mean-time', type=float, default=2.5)
+    parser.add_argument('--seed', type=int)
+    parser.add_argument('--db', help='Also persist attempts to this database')
+    parser.add_argument('--record', help='Record the session to this log file')
+    args = parser.parse_args(argv)
+
+    if args.difficulty == 'Custom' and (args.min_range is None or args.max_range is None):
+        parser.error("--difficulty Custom needs --min and --max")
+
+    db = None
+    if args.db:
+        from database import Database
+        db = Database(args.db)
+    try:
+        result = simulate(
+            args.questions, args.difficulty, args.min_range, args.max_range,
+            args.time, args.seed, args.accuracy, args.mean_time, db,
+            record=args.record
+        )
+    finally:
+        if db:
+            db.close()
+
+    accuracy = result['correct_answers'] / result['questions'] * 100 if result['questions'] else 0
+    print(f"Questions: {result['questions']} ({accuracy:.1f}% correct)")
+    print(f"Simulated time: {result['simulated_seconds'] / 3600:.1f} hours")
+    print(f"Wall time: {result['wall_seconds']:.2f} s")
+    print(f"Throughput: {result['questions_per_minute']:,.0f} questions/minute")
+    return 0
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
@@ -0,0 +1,205 @@
+#!/usr/bin/env python
+"""Concurrency stress test for a database shared by several devices.
+
+Starts writer and reader processes against one database file. Writers
+store sessions the way the app does (a batch of question attempts, then
+the session row); readers load statistics and recent sessions the way the
+main menu does. Reports throughput, p50/p99 latency, operations that
+failed because the database stayed locked, and write transactions that
+had to be retried.
+
+Usage:
+    python stress.py --writers 8 --readers 8 --duration 10   # temporary database
+    python stress.py --db /mnt/shared/brain_trainer.db --journal-mode DELETE
+    python stress.py --busy-timeout 0 --retries 0   # without lock handling
+"""
+import argparse
+import multiprocessing
+import os
+import shutil
+import sqlite3
+import tempfile
+import threading
+import time
+import uuid
+
+from database import BUSY_TIMEOUT, WRITE_RETRIES, Database, is_lock_error
+from latency import summarize
+
+
+# Question attempts stored with every written session
+ATTEMPTS_PER_SESSION = 20
+
+# Longest the parent waits past the duration for a worker's results
+RESULT_GRACE = 60.0
+
+
+def _write_session(db):
+    """Store one session and its attempts, as the app does."""
+    uid = uuid.uuid4().hex
+    db.add_question_attempts([
+        (uid, seq, 7, 8, "7 x 8", "56", 56, 1, 2.5)
+        for seq in range(1, ATTEMPTS_PER_SESSION + 1)
+    ])
+    db.add_training_session('Easy', ATTEMPTS_PER_SESSION, ATTEMPTS_PER_SESSION, 10, uid=uid)
+
+
+def _read_statistics(db):
+    """Load what the main menu shows."""
+    db.get_statistics()
+    db.get_recent_sessions()
+
+
+OPERATIONS = {
+    'writer': _write_session,
+    'reader': _read_statistics,
+}
+
+
+def _worker(role, options, barrier, results):
+    """Process body: run one role's operation until the duration is up."""
+    db = None
+    operation = OPERATIONS[role]
+    latencies = []
+    failures = 0
+    try:
+        try:
+            db = Database(
+                options['db_path'], options['journal_mode'],
+                busy_timeout=options['busy_timeout'], write_retries=options['retries']
+            )
+        except BaseException:
+            # Release the other workers instead of leaving them at the barrier
+            barrier.abort()
+            raise
+        # Start together, so the processes contend from the first operation
+        barrier.wait()
+        deadline = time.monotonic() + options['duration']
+        while time.monotonic() < deadline:
+            start = time.perf_counter()
+            try:
+                operation(db)
+            except sqlite3.OperationalError as error:
+                if not is_lock_error(error):
+                    raise
+                failures += 1
+                continue
+            latencies.append((time.perf_counter() - start) * 1000)
+    except threading.BrokenBarrierError:
+        pass  # another worker failed to start; report nothing done
+    finally:
+        results.put((role, latencies, failures, db.lock_retries if db else 0))
+        if db:
+            db.close()
+
+
+def stress(db_path, writers=4, readers=4, duration=10.0, journal_mode='WAL',
+           busy_timeout=BUSY_TIMEOUT, retries=WRITE_RETRIES):
+    """Run writer and reader processes against db_path for duration seconds.
+
+    Returns {role: stats} with the role's processes, completed operations,
+    throughput, latency summary (ms), lock failures and retries, plus
+    'sessions_stored': sessions the database gained. Raises RuntimeError if
+    a worker failed (e.g. could not open the database).
+    """
+    # Create the schema before the workers race to open the file
+    db = Database(db_path, journal_mode)
+    sessions_before = db.count_sessions()
+    db.close()
+
+    options = {
+        'db_path': db_path,
+        'journal_mode': journal_mode,
+        'busy_timeout': busy_timeout,
+        'retries': retries,
+        'duration': duration,
+    }
+    roles = ['writer'] * writers + ['reader'] * readers
+    # Fresh interpreters, as on separate devices: nothing is inherited
+    context = multiprocessing.get_context('spawn')
+    barrier = context.Barrier(len(roles))
+    results = context.Queue()
+    processes = [
+        context.Process(target=_worker, args=(role, options, barrier, results))
+        for role in roles
+    ]
+    for process in processes:
+        process.start()
+    collected = [results.get(timeout=duration + RESULT_GRACE) for _ in processes]
+    for process in processes:
+        process.join()
+    failed = sum(1 for process in processes if process.exitcode)
+    if failed:
+        raise RuntimeError(f"{failed} stress worker(s) failed; see the tracebacks above")
+
+    report = {}
+    for role in OPERATIONS:
+        rows = [row for row in collected if row[0] == role]
+        if not rows:
+            continue
+        latencies = [value for row in rows for value in row[1]]
+        stats = {
+            'processes': len(rows),
+            'operations': len(latencies),
+            'ops_per_s': len(latencies) / duration,
+            'lock_failures': sum(row[2] for row in rows),
+            'lock_retries': sum(row[3] for row in rows),
+        }
+        if latencies:
+            stats.update(summarize(latencies))
+        report[role] = stats
+
+    db = Database(db_path, journal_mode)
+    report['sessions_stored'] = db.count_sessions() - sessions_before
+    db.close()
+    return report
+
+
+def main(argv=None):
+    """Command line entry point."""
+    parser = argparse.ArgumentParser(description='Stress a shared database with concurrent processes')
+    parser.add_argument('--db', help='Database file (default: a temporary one)')
+    parser.add_argument('--writers', type=int, default=4, help='Writer processes')
+    parser.add_argument('--readers', type=int, default=4, help='Reader processes')
+    parser.add_argument('--duration', type=float, default=10.0, help='Seconds to run')
+    parser.add_argument('--journal-mode', default='WAL',
+                        help='WAL, or DELETE for files on network volumes')
+    parser.add_argument('--busy-timeout', type=float, default=BUSY_TIMEOUT,
+                        help='Seconds a statement waits for a lock')
+    parser.add_argument('--retries', type=int, default=WRITE_RETRIES,
+                        help='Retries of a write transaction that found the database locked')
+    args = parser.parse_args(argv)
+
+    temp_dir = None
+    db_path = args.db
+    if not db_path:
+        temp_dir = tempfile.mkdtemp(prefix='brain_trainer_stress_')
+        db_path = os.path.join(temp_dir, 'stress.db')
+    try:
+        report = stress(
+            db_path, args.writers, args.readers, args.duration, args.journal_mode,
+            args.busy_timeout, args.retries
+        )
+    finally:
+        if temp_dir:
+            shutil.rmtree(temp_dir, ignore_errors=True)
+
+    print(f"{args.db or 'temporary database'} ({args.journal_mode}), {args.duration:g} s")
+    for role in OPERATIONS:
+        stats = report.get(role)
+        if not stats:
+            continue
+        line = (f"  {role}s: {stats['processes']} processes, {stats['operations']} ops "
+                f"({stats['ops_per_s']:,.1f}/s)")
+        if stats['operations']:
+            line += f", p50 {stats['p50_ms']:.2f} ms, p99 {stats['p99_ms']:.2f} ms"
+        line += f", {stats['lock_failures']} lock failures, {stats['lock_retries']} retries"
+        print(line)
+    writes = report.get('writer', {})
+    attempted = writes.get('operations', 0) + writes.get('lock_failures', 0)
+    print(f"  sessions stored: {report['sessions_stored']} of {attempted} attempted")
+    return 0
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
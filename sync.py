@@ -0,0 +1,294 @@
+#!/usr/bin/env python
+"""Delta sync of training history to a central server.
+
+Each device remembers, per server, the id of the last session the server
+has acknowledged (its high-water mark). A sync only sends the sessions
+after that mark, with their question attempts, as gzip-compressed JSON
+batches. The server skips rows it already has (sessions by uid, attempts
+by uid and seq), so re-sending a batch whose response was lost is
+harmless. Failed requests are retried with exponential backoff, and
+SyncClient runs all of this on a background thread.
+
+Usage:
+    python sync.py --server http://central.local:8765
+    python sync.py --server http://central.local:8765 --db kiosk.db --batch-size 200
+    python sync.py --server http://central.local:8765 --enable   # sync from the app
+    python sync.py --disable
+"""
+import argparse
+import gzip
+import json
+import logging
+import random
+import threading
+import time
+import urllib.error
+import urllib.request
+import zlib
+
+from database import ATTEMPT_COLUMNS, SESSION_RECORD_COLUMNS, Database
+
+
+logger = logging.getLogger(__name__)
+
+PAYLOAD_VERSION = 1
+SYNC_PATH = '/sync'
+
+DEFAULT_BATCH_SIZE = 500  # sessions per request
+# Question attempts per request; batches hold whole sessions, so a longer
+# session is sent alone
+DEFAULT_BATCH_ATTEMPTS = 50000
+DEFAULT_INTERVAL = 300.0  # seconds between background syncs
+REQUEST_TIMEOUT = 30.0  # seconds
+
+# Retries of a failed request, waiting BACKOFF_BASE * 2**n seconds (with
+# jitter, at most BACKOFF_MAX) before retry n
+MAX_RETRIES = 5
+BACKOFF_BASE = 1.0
+BACKOFF_MAX = 60.0
+
+# Largest compressed request body the server accepts
+MAX_REQUEST_BYTES = 16 * 1024 * 1024
+# Largest batch accepted once decompressed, against compression bombs
+MAX_BATCH_BYTES = 64 * 1024 * 1024
+
+# A synced session: its record columns followed by its profile's name
+SYNC_SESSION_FIELDS = len(SESSION_RECORD_COLUMNS) + 1
+
+# Position of total_questions in get_unsynced_sessions() rows
+_TOTAL_QUESTIONS = 1 + SESSION_RECORD_COLUMNS.index('total_questions')
+
+# Setting holding the server the app syncs to
+SERVER_SETTING = 'sync_server'
+
+
+class SyncError(Exception):
+    """A batch could not be delivered to the server."""
+
+
+class BatchTooLargeError(SyncError):
+    """The server rejected a batch as too large (HTTP 413)."""
+
+
+class OversizedBatchError(ValueError):
+    """A request body decompresses to more than MAX_BATCH_BYTES."""
+
+
+def encode_batch(device_id, sessions, attempts):
+    """Compressed request body for a batch of sessions and their attempts."""
+    payload = {
+        'version': PAYLOAD_VERSION,
+        'device': device_id,
+        'sessions': sessions,
+        'attempts': attempts,
+    }
+    return gzip.compress(json.dumps(payload, separators=(',', ':')).encode('utf-8'))
+
+
+def decode_batch(body):
+    """Parse and check a request body written by encode_batch().
+
+    Returns the payload with rows as tuples; raises ValueError if the body
+    is malformed, OversizedBatchError if it decompresses to more than
+    MAX_BATCH_BYTES.
+    """
+    decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+    try:
+        data = decompressor.decompress(body, MAX_BATCH_BYTES)
+    except zlib.error as e:
+        raise ValueError(f"Batch is not gzip data: {e}") from e
+    if decompressor.unconsumed_tail:
+        raise OversizedBatchError("Batch is too large")
+    payload = json.loads(data)
+    if not isinstance(payload, dict) or payload.get('version') != PAYLOAD_VERSION:
+        raise ValueError("Unsupported batch version")
+    rows = {}
+    for key, width in (('sessions', SYNC_SESSION_FIELDS), ('attempts', len(ATTEMPT_COLUMNS))):
+        values = payload.get(key)
+        if not isinstance(values, list) or any(
+                not isinstance(row, list) or len(row) != width for row in values):
+            raise ValueError(f"Malformed {key} in batch")
+        rows[key] = [tuple(row) for row in values]
+    if any(not isinstance(row[-1], str) for row in rows['sessions']):
+        raise ValueError("Malformed profile name in batch")
+    payload.update(rows)
+    return payload
+
+
+def _retryable(error):
+    """Whether a failed request may succeed when repeated."""
+    if isinstance(error, urllib.error.HTTPError):
+        return error.code >= 500 or error.code == 429
+    return True  # connection refused, reset, timed out, ...
+
+
+def post_batch(url, body, timeout=REQUEST_TIMEOUT):
+    """POST one batch and return the server's JSON response."""
+    request = urllib.request.Request(url, data=body, method='POST', headers={
+        'Content-Type': 'application/json',
+        'Content-Encoding': 'gzip',
+    })
+    with urllib.request.urlopen(request, timeout=timeout) as response:
+        return json.loads(response.read())
+
+
+def deliver(url, body, retries=MAX_RETRIES, sleep=time.sleep, rng=random):
+    """POST a batch, retrying transient failures with exponential backoff.
+
+    Raises SyncError once the retries are used up or the server rejects
+    the batch, BatchTooLargeError if it rejects the batch as too large.
+    """
+    for attempt in range(retries + 1):
+        try:
+            return post_batch(url, body)
+        except (OSError, ValueError) as error:
+            if isinstance(error, urllib.error.HTTPError) and error.code == 413:
+                raise BatchTooLargeError(f"Sync to {url} failed: {error}") from error
+            if attempt == retries or not _retryable(error):
+                raise SyncError(f"Sync to {url} failed: {error}") from error
+            # Jitter keeps devices that failed together from retrying together
+            delay = min(BACKOFF_MAX, BACKOFF_BASE * 2 ** attempt) * rng.uniform(0.5, 1.0)
+            logger.warning("Sync to %s failed (%s); retrying in %.1fs", url, error, delay)
+            sleep(delay)
+
+
+def _limit_attempts(rows, max_attempts):
+    """Leading session rows with at most max_attempts questions in all
+    (always at least one row)."""
+    total = 0
+    for count, row in enumerate(rows):
+        total += row[_TOTAL_QUESTIONS]
+        if total > max_attempts and count:
+            return rows[:count]
+    return rows
+
+
+def sync_once(db, server, batch_size=DEFAULT_BATCH_SIZE, retries=MAX_RETRIES,
+              sleep=time.sleep, max_attempts=DEFAULT_BATCH_ATTEMPTS):
+    """Send every session created since the last sync to a server.
+
+    Batches hold at most batch_size sessions and max_attempts attempts; a
+    batch the server rejects as too large is split in half and sent again.
+    The high-water mark moves after each acknowledged batch, so an
+    interrupted sync resumes where it stopped. Returns the number of
+    sessions sent.
+    """
+    url = server.rstrip('/') + SYNC_PATH
+    device_id, mark = db.get_sync_state(server)
+    sent = 0
+    while True:
+        rows = _limit_attempts(db.get_unsynced_sessions(mark, batch_size), max_attempts)
+        if not rows:
+            return sent
+        last_id = rows[-1][0]
+        attempts = db.get_session_range_attempts(mark, last_id)
+        body = encode_batch(device_id, [row[1:] for row in rows], attempts)
+        try:
+            if len(body) > MAX_REQUEST_BYTES:
+                raise BatchTooLargeError(f"Batch is over {MAX_REQUEST_BYTES} bytes")
+            deliver(url, body, retries, sleep)
+        except BatchTooLargeError:
+            if len(rows) == 1:
+                raise
+            batch_size = len(rows) // 2
+            logger.warning("Sync batch too large; sending %d sessions at a time", batch_size)
+            continue
+        db.set_sync_mark(server, last_id)
+        mark = last_id
+        sent += len(rows)
+
+
+class SyncClient:
+    """Syncs a database to a server on a background thread.
+
+    A sync runs when the client starts, every `interval` seconds, and
+    whenever request_sync() is called (e.g. after a session is saved).
+    """
+
+    def __init__(self, db, server, interval=DEFAULT_INTERVAL,
+                 batch_size=DEFAULT_BATCH_SIZE, retries=MAX_RETRIES):
+        self.db = db
+        self.server = server
+        self.interval = interval
+        self.batch_size = batch_size
+        self.retries = retries
+        self.sessions_sent = 0
+        self._wake = threading.Event()
+        self._stopping = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='history-sync', daemon=True)
+
+    def start(self):
+        """Start syncing in the background."""
+        self._thread.start()
+
+    def request_sync(self):
+        """Sync as soon as possible, without waiting for the interval."""
+        self._wake.set()
+
+    def stop(self, timeout=None):
+        """Stop the sync thread, abandoning any backoff wait."""
+        self._stopping.set()
+        self._wake.set()
+        if self._thread.is_alive():
+            self._thread.join(timeout)
+
+    def _sleep(self, delay):
+        """Backoff wait that ends early, failing the sync, when stopping."""
+        if self._stopping.wait(delay):
+            raise SyncError("Sync stopped")
+
+    def _run(self):
+        """Worker loop."""
+        while not self._stopping.is_set():
+            try:
+                self.sessions_sent += sync_once(
+                    self.db, self.server, self.batch_size, self.retries, self._sleep
+                )
+            except SyncError as e:
+                logger.warning("%s", e)
+            except Exception:
+                logger.exception("Sync to %s failed", self.server)
+            self._wake.wait(self.interval)
+            self._wake.clear()
+
+
+def main(argv=None):
+    """Command line entry point: sync once, or turn background sync on or off."""
+    parser = argparse.ArgumentParser(description='Send new training history to a sync server')
+    parser.add_argument('--server', help='Server URL, e.g. http://host:8765')
+    parser.add_argument('--db', default='brain_trainer.db', help='Database file')
+    parser.add_argument('--batch-size', type=int, default=DEFAULT_BATCH_SIZE,
+                        help='Sessions per request')
+    parser.add_argument('--max-attempts', type=int, default=DEFAULT_BATCH_ATTEMPTS,
+                        help='Question attempts per request')
+    parser.add_argument('--retries', type=int, default=MAX_RETRIES,
+                        help='Retries of a failed request')
+    mode = parser.add_mutually_exclusive_group()
+    mode.add_argument('--enable', action='store_true',
+                      help="Make the app sync to --server in the background (takes "
+                           "effect the next time it starts)")
+    mode.add_argument('--disable', action='store_true',
+                      help='Stop the app from syncing in the background')
+    args = parser.parse_args(argv)
+    if not args.server and not args.disable:
+        parser.error('--server is required')
+
+    db = Database(args.db)
+    try:
+        if args.enable or args.disable:
+            server = None if args.disable else args.server
+            db.save_settings({SERVER_SETTING: server})
+            print(f"Background sync to {server}" if server else "Background sync off")
+            return 0
+        sent = sync_once(db, args.server, args.batch_size, args.retries,
+                         max_attempts=args.max_attempts)
+    except SyncError as e:
+        parser.exit(1, f"Error: {e}\n")
+    finally:
+        db.close()
+    print(f"Sent {sent} sessions")
+    return 0
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
@@ -0,0 +1,136 @@
+#!/usr/bin/env python
+"""Reference server for sync.py: collects training history from devices.
+
+Batches are inserted with the same bulk imports history_transfer.py uses,
+which skip rows the server already has, so a device that re-sends a batch
+after a lost response does not create duplicates. Sessions are filed under
+a server profile with the same name as the device's profile.
+
+The server handles one request at a time, since ingesting switches the
+database's current profile while it runs.
+
+Usage:
+    python sync_server.py --db central.db --port 8765
+"""
+import argparse
+import json
+import logging
+import sqlite3
+from http.server import BaseHTTPRequestHandler, HTTPServer
+
+from database import Database
+from history_transfer import use_profile
+from sync import MAX_REQUEST_BYTES, SYNC_PATH, OversizedBatchError, decode_batch
+
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_PORT = 8765
+
+
+def ingest_batch(db, batch):
+    """Insert a decoded batch into db.
+
+    Attempts go in before their sessions, as on the devices. Returns
+    {'sessions': rows inserted, 'attempts': rows inserted}.
+    """
+    attempts = db.add_question_attempts(batch['attempts'])
+    by_profile = {}
+    for *record, profile_name in batch['sessions']:
+        by_profile.setdefault(profile_name, []).append(tuple(record))
+    sessions = 0
+    current = db.profile_id
+    try:
+        for profile_name, records in by_profile.items():
+            use_profile(db, profile_name, create=True)
+            sessions += db.import_session_records(records)
+    finally:
+        db.profile_id = current
+    return {'sessions': sessions, 'attempts': attempts}
+
+
+class SyncRequestHandler(BaseHTTPRequestHandler):
+    """Accepts POST /sync batches."""
+
+    def do_POST(self):
+        if self.path != SYNC_PATH:
+            self._reply(404, {'error': 'Not found'})
+            return
+        try:
+            length = int(self.headers.get('Content-Length') or 0)
+        except ValueError:
+            length = -1
+        if length < 0:
+            self._reply(400, {'error': 'Invalid Content-Length'})
+            return
+        if length > MAX_REQUEST_BYTES:
+            self._reply(413, {'error': 'Batch is too large'})
+            return
+        try:
+            batch = decode_batch(self.rfile.read(length))
+        except OversizedBatchError as e:
+            self._reply(413, {'error': str(e)})
+            return
+        except ValueError as e:
+            self._reply(400, {'error': str(e)})
+            return
+        try:
+            counts = ingest_batch(self.server.db, batch)
+        except sqlite3.OperationalError as e:
+            # e.g. the database is locked: worth retrying later
+            logger.exception("Could not store a batch")
+            self._reply(503, {'error': str(e)})
+            return
+        except Exception as e:
+            # Rows of the wrong types: re-sending the same batch cannot help
+            logger.exception("Rejected a batch")
+            self._reply(400, {'error': f"Could not store batch: {e}"})
+            return
+        logger.info("Device %s: %d sessions, %d attempts inserted",
+                    batch.get('device'), counts['sessions'], counts['attempts'])
+        self._reply(200, counts)
+
+    def _reply(self, status, body):
+        data = json.dumps(body).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        logger.info("%s %s", self.address_string(), format % args)
+
+
+class SyncServer(HTTPServer):
+    """HTTP server ingesting sync batches into a Database."""
+
+    def __init__(self, address, db):
+        super().__init__(address, SyncRequestHandler)
+        self.db = db
+
+
+def main(argv=None):
+    """Command line entry point."""
+    parser = argparse.ArgumentParser(description='Collect training history from devices')
+    parser.add_argument('--db', default='brain_trainer_central.db', help='Database file')
+    parser.add_argument('--host', default='', help='Address to listen on (default: all)')
+    parser.add_argument('--port', type=int, default=DEFAULT_PORT, help='Port to listen on')
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO)
+    db = Database(args.db)
+    server = SyncServer((args.host, args.port), db)
+    logger.info("Listening on port %d", server.server_address[1])
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        db.close()
+    return 0
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
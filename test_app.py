@@ -1,18 +1,20 @@
 #!/usr/bin/env python
 """
 Test script to validate Brain Trainer app components without GUI.
-This script tests the core functionality without requiring Kivy to be installed.
+This script tests the core functionality without opening a window. Kivy is
+only needed for the theme palette tests, which are skipped without it.
 """
 
 import sys
 import os
+import random
 
 # Test database functionality
 print("=" * 60)
 print("Testing Database Module")
 print("=" * 60)
 
-from database import Database
+from database import RECENT_SESSIONS_SQL, Database
 
 # Create a test database
 test_db = Database('test_validation.db')
@@ -44,10 +46,393 @@ print(f"   Retrieved {len(recent)} recent sessions")
 assert len(recent) == 3, "Expected 3 recent sessions"
 print("   ✓ Recent sessions retrieval works")
 
+# Test connection reuse
+print("\n4. Checking connection reuse...")
+assert test_db.get_connection() is test_db.get_connection(), "Expected one connection per thread"
+journal_mode = test_db.get_connection().execute('PRAGMA journal_mode').fetchone()[0]
+assert journal_mode == 'wal', f"Expected WAL journaling, got {journal_mode}"
+print("   ✓ Connection is shared and configured once")
+
+# Test paged history
+print("\n5. Paging through session history...")
+page, cursor = test_db.get_session_page(limit=3)
+assert len(page) == 3 and cursor is not None, "Expected a full first page"
+rest, cursor = test_db.get_session_page(limit=3, before=cursor)
+assert len(rest) == 1 and cursor is None, "Expected the last session on page two"
+assert {row[0] for row in page + rest} == {1, 2, 3, 4}, "Expected every session exactly once"
+hard_page, _ = test_db.get_session_page(difficulty='Hard')
+assert [row[1] for row in hard_page] == ['Hard'], "Expected only Hard sessions"
+plan = test_db.get_connection().execute(
+    "EXPLAIN QUERY PLAN SELECT id, correct_answers FROM training_sessions "
+    "WHERE profile_id = 1 AND difficulty = 'Easy' ORDER BY date DESC, id DESC LIMIT 5"
+).fetchall()
+assert not any('TEMP B-TREE' in row[-1] for row in plan), "Expected an index-ordered scan"
+assert all('COVERING INDEX' in row[-1] for row in plan), "Expected a covering index"
+print("   ✓ Keyset pagination uses the profile indexes")
+
+# Test materialized statistics
+print("\n6. Checking materialized statistics...")
+easy_stats = test_db.get_statistics('Easy')
+assert easy_stats['total_sessions'] == 1, "Expected 1 Easy session"
+assert easy_stats['correct_answers'] == 8, "Expected 8 correct Easy answers"
+assert test_db.get_statistics('Unknown')['total_sessions'] == 0, "Expected no Unknown sessions"
+assert test_db.verify_statistics() == [], "Expected consistent totals"
+test_db.get_connection().execute("UPDATE session_totals SET total_sessions = 99")
+assert test_db.verify_statistics(), "Expected stale totals to be detected"
+test_db.rebuild_statistics()
+assert test_db.verify_statistics() == [], "Expected rebuilt totals to be consistent"
+print("   ✓ Totals are maintained, verified and rebuilt")
+
+# Test write-behind question attempts
+print("\n7. Writing question attempts in the background...")
+from attempt_writer import AttemptWriter
+writer = AttemptWriter(test_db, batch_size=3, flush_interval=60)
+session_uid = test_db.add_training_session('Easy', 4, 3, 10)
+for seq in range(1, 5):
+    writer.add((session_uid, seq, seq, 2, f"{seq} x 2", str(seq * 2), seq * 2, 1, 1.5))
+assert writer.flush().wait(5), "Expected the flush to complete"
+attempts = test_db.get_question_attempts(session_uid)
+assert [a[1] for a in attempts] == [1, 2, 3, 4], "Expected all attempts in order"
+fact_attempts = list(test_db.get_fact_attempts(2, 3))
+assert fact_attempts == [(2, 2, 1, 1.5), (3, 2, 1, 1.5)], "Expected attempts within the range"
+writer.close(5)
+print("   ✓ Attempts are batched and stored")
+
+# Test asynchronous database access
+print("\n8. Running database calls on a worker thread...")
+import threading
+from async_db import AsyncDatabase
+delivered = []
+async_db = AsyncDatabase(test_db, dispatch=lambda func: func())
+async_db.submit('add_training_session', 'Easy', 5, 5, 10)
+future = async_db.submit('get_statistics', callback=delivered.append)
+assert future.result(5)['total_sessions'] == 6, "Expected the queued write to be visible"
+failed = threading.Event()
+async_db.submit('get_statistics', 'Easy', 'extra', error_callback=lambda e: failed.set())
+assert failed.wait(5), "Expected the error callback to run"
+async_db.close()
+assert delivered and delivered[0]['total_sessions'] == 6, "Expected the callback result"
+print("   ✓ Calls run in order and deliver results")
+
 # Clean up test database
+test_db.close()
 os.remove('test_validation.db')
+# Test upgrading a database created by an older version of the app
+print("\n9. Migrating a legacy database...")
+import sqlite3
+legacy_conn = sqlite3.connect('test_legacy.db')
+legacy_conn.execute('''
+    CREATE TABLE training_sessions (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        difficulty TEXT NOT NULL,
+        total_questions INTEGER NOT NULL,
+        correct_answers INTEGER NOT NULL,
+        time_per_question INTEGER NOT NULL,
+        date TEXT NOT NULL
+    )
+''')
+legacy_conn.execute(
+    "INSERT INTO training_sessions (difficulty, total_questions, correct_answers, "
+    "time_per_question, date) VALUES ('Easy', 10, 7, 10, '2024-01-02T03:04:05.000006')"
+)
+legacy_conn.commit()
+legacy_conn.close()
+legacy_db = Database('test_legacy.db')
+assert legacy_db.get_statistics()['correct_answers'] == 7, "Expected migrated totals"
+legacy_date = legacy_db.get_recent_sessions(1)[0][3]
+assert legacy_date == '2024-01-02T03:04:05', f"Expected converted date, got {legacy_date}"
+legacy_db.close()
+os.remove('test_legacy.db')
+print("   ✓ Legacy database upgraded")
+
+# Test moving history between databases
+print("\n10. Exporting and importing history...")
+import shutil
+import tempfile
+from history_transfer import export_history, import_history
+transfer_dir = tempfile.mkdtemp()
+source_db = Database(os.path.join(transfer_dir, 'source.db'))
+uid = source_db.add_training_session('Easy', 2, 1, 10)
+source_db.add_question_attempts([
+    (uid, 1, 2, 3, "2 x 3", "6", 6, 1, 1.25),
+    (uid, 2, 4, 5, "4 x 5", None, 20, 0, 10.0),
+])
+target_db = Database(os.path.join(transfer_dir, 'target.db'))
+for fmt in ('csv', 'jsonl'):
+    dump = os.path.join(transfer_dir, fmt)
+    assert export_history(source_db, dump, fmt, chunk_size=1) == {'sessions': 1, 'attempts': 2}
+    counts = import_history(target_db, dump, batch_size=1)
+    expected = (2, 2 if fmt == 'csv' else 0)
+    assert counts['attempts'] == expected, f"Unexpected {fmt} import counts: {counts}"
+assert target_db.get_question_attempts(uid) == source_db.get_question_attempts(uid)
+assert target_db.get_statistics() == source_db.get_statistics(), "Expected merged totals"
+source_db.close()
+target_db.close()
+shutil.rmtree(transfer_dir)
+print("   ✓ History round-trips and duplicates are skipped")
+
+print("\n11. Keeping each profile's history apart...")
+profile_dir = tempfile.mkdtemp()
+profile_db = Database(os.path.join(profile_dir, 'profiles.db'))
+assert profile_db.get_profiles() == [(1, 'Default')], "Expected the default profile"
+ada = profile_db.create_profile('Ada')
+try:
+    profile_db.create_profile('ADA')
+    raise AssertionError("Expected duplicate profile names to be rejected")
+except sqlite3.IntegrityError:
+    pass
+profile_db.add_training_session('Easy', 10, 9, 10)
+uid = profile_db.add_training_session('Hard', 4, 1, 10, profile_id=ada)
+profile_db.add_question_attempts([(uid, 1, 2, 3, "2 x 3", "7", 6, 0, 4.0)])
+assert profile_db.get_statistics()['total_sessions'] == 1, "Expected the default profile's totals"
+assert list(profile_db.get_fact_attempts(0, 10)) == []
+profile_db.profile_id = ada
+assert profile_db.get_statistics()['correct_answers'] == 1, "Expected Ada's totals"
+assert [row[0] for row in profile_db.get_recent_sessions()] == ['Hard']
+assert list(profile_db.get_fact_attempts(0, 10)) == [(2, 3, 0, 4.0)]
+assert profile_db.verify_statistics() == []
+plan = profile_db.get_connection().execute(
+    "EXPLAIN QUERY PLAN " + RECENT_SESSIONS_SQL, (ada, 5)
+).fetchall()
+assert all('COVERING INDEX' in row[-1] and 'TEMP B-TREE' not in row[-1] for row in plan)
+profile_db.close()
+shutil.rmtree(profile_dir)
+print("   ✓ Statistics, history and attempts are read per profile")
+
+print("\n12. Saving settings in the background...")
+from settings_store import DatabaseSettings, JsonSettingsFile, SettingsStore
+settings_dir = tempfile.mkdtemp()
+settings_path = os.path.join(settings_dir, 'settings.json')
+writes = []
+class CountingSettingsFile(JsonSettingsFile):
+    def write(self, settings):
+        writes.append(settings)
+        super().write(settings)
+store = SettingsStore(CountingSettingsFile(settings_path), debounce=0.05)
+assert store.load() == {}, "Expected no settings yet"
+for mode in ('dark', 'light', 'dark'):
+    store.update({'theme_mode': mode, 'voice_enabled': True})
+assert store.flush().wait(5)
+assert writes == [{'theme_mode': 'dark', 'voice_enabled': True}], "Expected one batched write"
+store.update({'theme_mode': 'dark'})
+store.close()
+assert len(writes) == 1, "Unchanged settings should not be written"
+assert JsonSettingsFile(settings_path).read() == writes[0]
+settings_db = Database(os.path.join(settings_dir, 'settings.db'))
+assert DatabaseSettings(settings_db, legacy_path=settings_path).read() == writes[0]
+assert settings_db.get_settings() == writes[0], "Expected the legacy file imported"
+settings_db.close()
+with open(settings_path, 'w') as f:
+    f.write('{"theme_mode": "da')
+assert JsonSettingsFile(settings_path).read() == {}
+assert os.path.exists(settings_path + '.corrupt'), "Expected the corrupt file kept"
+shutil.rmtree(settings_dir)
+print("   ✓ Changes batched, written atomically and imported into the database")
+
+print("\n13. Syncing history to a server...")
+import threading
+from sync import SyncError, deliver, sync_once
+from sync_server import SyncServer
+sync_dir = tempfile.mkdtemp()
+central_db = Database(os.path.join(sync_dir, 'central.db'))
+sync_server = SyncServer(('127.0.0.1', 0), central_db)
+threading.Thread(target=sync_server.serve_forever, daemon=True).start()
+server_url = f"http://127.0.0.1:{sync_server.server_address[1]}"
+device_db = Database(os.path.join(sync_dir, 'device.db'))
+grace = device_db.create_profile('Grace')
+uid = device_db.add_training_session('Easy', 2, 1, 10)
+device_db.add_question_attempts([
+    (uid, 1, 2, 3, "2 x 3", "6", 6, 1, 1.25),
+    (uid, 2, 4, 5, "4 x 5", None, 20, 0, 10.0),
+])
+device_db.add_training_session('Hard', 5, 4, 10, profile_id=grace)
+device_db.add_training_session('Medium', 3, 3, 10, profile_id=grace)
+assert sync_once(device_db, server_url, batch_size=2) == 3, "Expected every session sent"
+assert sync_once(device_db, server_url) == 0, "Expected nothing left to send"
+assert central_db.get_question_attempts(uid) == device_db.get_question_attempts(uid)
+assert central_db.get_statistics() == device_db.get_statistics()
+from history_transfer import use_profile
+use_profile(central_db, 'Grace')
+device_db.profile_id = grace
+assert central_db.get_statistics() == device_db.get_statistics(), "Expected Grace's totals"
+device_db.set_sync_mark(server_url, 0)  # a lost acknowledgement: everything is re-sent
+assert sync_once(device_db, server_url) == 3
+assert central_db.get_statistics()['total_sessions'] == 2, "Re-sent sessions should be skipped"
+import http.client
+for bad_length in ('abc', '-5'):
+    connection = http.client.HTTPConnection('127.0.0.1', sync_server.server_address[1], timeout=5)
+    connection.putrequest('POST', '/sync')
+    connection.putheader('Content-Length', bad_length)
+    connection.endheaders()
+    assert connection.getresponse().status == 400, f"Expected Content-Length {bad_length!r} rejected"
+    connection.close()
+from sync import encode_batch, main as sync_main
+import sync_server as sync_server_module
+delays = []
+try:
+    deliver(server_url + '/sync', encode_batch('bad', [['u', ['Easy'], 1, 1, 10, 0, 'Default']], []),
+            sleep=delays.append)
+    raise AssertionError("Expected a batch that cannot be stored to be rejected")
+except SyncError:
+    pass
+assert delays == [], "Expected a rejected batch not to be retried"
+marathon_db = Database(os.path.join(sync_dir, 'marathon.db'))
+marathon_rng = random.Random(2)
+for _ in range(4):
+    uid = marathon_db.add_training_session('Hard', 300, 0, 0)
+    marathon_db.add_question_attempts([
+        (uid, seq, a, b, f"{a} x {b}", None, a * b, 0, marathon_rng.random())
+        for seq, (a, b) in enumerate([(marathon_rng.randint(20, 99), marathon_rng.randint(20, 99))
+                                      for _ in range(300)], 1)
+    ])
+one_session = len(encode_batch('x', [], marathon_db.get_session_range_attempts(0, 1)))
+saved_limit = sync_server_module.MAX_REQUEST_BYTES
+sync_server_module.MAX_REQUEST_BYTES = one_session * 3 // 2
+try:
+    assert sync_once(marathon_db, server_url, max_attempts=10000) == 4, "Expected oversized batches split"
+finally:
+    sync_server_module.MAX_REQUEST_BYTES = saved_limit
+marathon_db.set_sync_mark(server_url, 0)
+assert sync_once(marathon_db, server_url, max_attempts=300) == 4, "Expected one session per batch"
+marathon_db.close()
+settings_db_path = os.path.join(sync_dir, 'device.db')
+sync_main(['--db', settings_db_path, '--server', server_url, '--enable'])
+assert Database(settings_db_path).get_settings()['sync_server'] == server_url
+sync_main(['--db', settings_db_path, '--disable'])
+assert Database(settings_db_path).get_settings()['sync_server'] is None
+sync_server.shutdown()
+sync_server.server_close()
+delays = []
+try:
+    deliver(server_url + '/sync', b'', retries=2, sleep=delays.append)
+    raise AssertionError("Expected an unreachable server to fail")
+except SyncError:
+    pass
+assert len(delays) == 2 and delays[0] < delays[1] * 2, f"Expected backoff, got {delays}"
+central_db.close()
+device_db.close()
+shutil.rmtree(sync_dir)
+print("   ✓ Only new sessions are sent, and re-sent batches are harmless")
+
+print("\n14. Retrying writes while another process holds the lock...")
+lock_dir = tempfile.mkdtemp()
+lock_path = os.path.join(lock_dir, 'shared.db')
+patient_db = Database(lock_path, busy_timeout=0)
+impatient_db = Database(lock_path, busy_timeout=0, write_retries=0)
+blocker = sqlite3.connect(lock_path, check_same_thread=False)
+blocker.execute('BEGIN IMMEDIATE')
+try:
+    impatient_db.add_training_session('Easy', 1, 1, 10)
+    raise AssertionError("Expected the locked write to fail without retries")
+except sqlite3.OperationalError:
+    pass
+threading.Timer(0.2, blocker.rollback).start()
+patient_db.add_training_session('Easy', 1, 1, 10)
+assert patient_db.lock_retries > 0, "Expected the write to be retried"
+assert patient_db.get_statistics()['total_sessions'] == 1, "Expected the session stored"
+blocker.close()
+patient_db.close()
+impatient_db.close()
+shutil.rmtree(lock_dir)
+print("   ✓ Locked writes back off and retry instead of losing the session")
+
 print("\n✓ Database module tests passed!")
 
+# Test audio cache
+print("\n" + "=" * 60)
+print("Testing Audio Cache and Question Pipeline")
+print("=" * 60)
+
+import shutil
+import tempfile
+from tts_cache import AudioCache, speech_text
+
+print("\n1. Prefetching a range...")
+cache_dir = tempfile.mkdtemp()
+synthesized = []
+class FakeBackend:
+    name = 'fake'
+    file_suffix = '.wav'
+    def synthesize(self, text, lang):
+        synthesized.append(text)
+        return b"x" * 10
+cache = AudioCache(FakeBackend(), cache_dir, max_bytes=1000)
+assert cache.prefetch_range(0, 2) == 9, "Expected 3 x 3 clips"
+assert cache.get(speech_text(2, 2)) is not None, "Expected a cached clip"
+cache.get_or_create(speech_text(1, 1))
+assert len(synthesized) == 9, "Expected cached clips to be reused"
+print("   ✓ Range prefetched and reused")
+
+print("\n2. Evicting least recently used clips...")
+cache = AudioCache(FakeBackend(), cache_dir, max_bytes=50)
+assert len(cache) == 9, "Expected clips on disk to be indexed"
+recent = cache.get(speech_text(0, 0))
+cache.put("one more", b"y" * 10)
+assert cache.total_bytes <= 50, "Expected the cache to respect its cap"
+assert cache.get(speech_text(0, 0)) == recent, "Expected the recently used clip to survive"
+assert len(os.listdir(cache_dir)) == len(cache), "Expected evicted files to be deleted"
+shutil.rmtree(cache_dir)
+print("   ✓ Cache stays within its size cap")
+
+print("\n3. Stitching offline voice clips in memory...")
+import io
+import wave
+from tts_backends import ClipConcatBackend, number_words
+assert number_words(42) == ['forty', 'two'], "Expected 42 spelled out"
+assert number_words(305) == ['three', 'hundred', 'five'], "Expected 305 spelled out"
+clips_dir = tempfile.mkdtemp()
+os.makedirs(os.path.join(clips_dir, 'en'))
+for index, word in enumerate(['twelve', 'times', 'seven']):
+    with wave.open(os.path.join(clips_dir, 'en', f"{word}.wav"), 'wb') as clip:
+        clip.setnchannels(1)
+        clip.setsampwidth(2)
+        clip.setframerate(8000)
+        clip.writeframes(bytes([index + 1, 0]) * 100)
+audio = ClipConcatBackend(clips_dir, gap_ms=10).synthesize("12 times 7")
+with wave.open(io.BytesIO(audio), 'rb') as spoken:
+    assert spoken.getnframes() == 3 * 100 + 2 * 80, "Expected three words and two gaps"
+try:
+    ClipConcatBackend(clips_dir).synthesize("12 times 8")
+    assert False, "Expected a missing clip to be reported"
+except LookupError:
+    pass
+shutil.rmtree(clips_dir)
+print("   ✓ Question audio assembled without temp files")
+
+print("\n4. Preparing questions ahead of time...")
+from question_pipeline import QuestionPipeline
+class FakeSound:
+    def __init__(self, name):
+        self.name = name
+        self.unloaded = False
+    def unload(self):
+        self.unloaded = True
+from session_engine import make_question
+questions = iter([make_question(a, b) for a, b in [(2, 3), (4, 5), (6, 7), (8, 9), (1, 1), (2, 2)]])
+pipeline = QuestionPipeline(lambda: next(questions), load_sound=lambda q: FakeSound(q.expression), depth=2)
+pipeline.start()
+first = pipeline.next()
+assert first.question[:3] == (2, 3, 6), "Expected questions in order"
+assert first.question.text == "2 x 3 = ?" and first.sound.name == "2 x 3", "Expected text and audio"
+assert pipeline.next().question.answer == 20, "Expected the next prepared question"
+pipeline.stop()
+import threading
+import time
+pickers = []
+def slow_pick():
+    pickers.append(threading.current_thread().name)
+    time.sleep(0.01)
+    return make_question(len(pickers), 1)
+pipeline = QuestionPipeline(slow_pick, depth=2)
+pipeline.start()
+taken = [pipeline.next().question.num1 for _ in range(6)]
+pipeline.stop()
+assert taken == [1, 2, 3, 4, 5, 6], f"Expected questions in picked order, got {taken}"
+assert set(pickers) == {'question-pipeline'}, "Expected every pick on the producer thread"
+print("   ✓ Questions are prepared with their audio")
+
+print("\n✓ Audio cache and pipeline tests passed!")
+
 # Test application logic
 print("\n" + "=" * 60)
 print("Testing Application Logic")
@@ -84,8 +469,300 @@ for timer in timer_values:
     assert timer > 0, "Timer must be positive"
     print(f"   {timer} seconds ✓")
 
+print("\n4. Testing adaptive question scheduling...")
+from scheduler import AdaptiveScheduler, UniformScheduler, create_scheduler
+scheduler = AdaptiveScheduler(0, 3, random.Random(7))
+for _ in range(200):
+    num1, num2 = scheduler.pick()
+    assert 0 <= num1 <= 3 and 0 <= num2 <= 3, "Expected operands within range"
+scheduler.record(2, 3, False, 8.0)
+picks = [scheduler.pick() for _ in range(4000)]
+share = picks.count((2, 3)) / len(picks)
+assert share > 0.2, f"Expected the missed fact to come up more often, got {share:.2f}"
+for _ in range(10):
+    scheduler.record(2, 3, True, 0.5)
+picks = [scheduler.pick() for _ in range(4000)]
+assert picks.count((2, 3)) / len(picks) < 0.1, "Expected a mastered fact to come up less"
+assert isinstance(create_scheduler(0, 5000), UniformScheduler), "Expected uniform picks for huge ranges"
+fact_db = Database(':memory:')
+fact_rng = random.Random(9)
+for _ in range(20):
+    uid = f"fact-{fact_rng.random()}"
+    fact_db.add_question_attempts([
+        (uid, seq, a, b, f"{a} x {b}", None, a * b, fact_rng.random() < 0.7, fact_rng.uniform(0.5, 9))
+        for seq, (a, b) in enumerate([(fact_rng.randint(0, 4), fact_rng.randint(0, 4)) for _ in range(30)], 1)
+    ] + [(uid, 31, 1, 1, "1 + 1", "2", 2, 1, 1.0)])
+    fact_db.add_training_session('Easy', 31, 20, 10, uid=uid)
+replayed = AdaptiveScheduler(0, 4)
+replayed.load(fact_db.get_fact_attempts(0, 4))
+stored = AdaptiveScheduler(0, 4)
+stored.load_facts(fact_db.get_fact_stats(0, 4))
+assert list(stored.attempts) == list(replayed.attempts), "Expected the stored attempt counts"
+assert all(abs(x - y) < 1e-4 for x, y in zip(stored.weights, replayed.weights)), "Expected the replayed weights"
+fact_db.close()
+print("   Missed facts are repeated, mastered facts fade ✓")
+
+print("\n5. Testing the headless session engine...")
+from session_engine import TrainingSession
+from simulate import SimulatedClock, simulate
+clock = SimulatedClock()
+session = TrainingSession('Medium', 10, clock=clock, rng=random.Random(3))
+question = session.next_question()
+assert 10 <= question.num1 <= 20 and 10 <= question.num2 <= 20, "Expected Medium operands"
+clock.advance(2.5)
+entry = session.answer(str(question.answer))
+assert entry['is_correct'] and entry['time_taken'] == 2.5, "Expected a timed correct answer"
+session.next_question(make_question(3, 4))
+entry = session.answer("")
+assert not entry['is_correct'] and entry['user_answer'] == "(no answer)", "Expected a missed answer"
+assert session.score_text == "Score: 1/2", "Expected the running score"
+assert session.attempt_row(entry)[5] is None, "Expected no stored answer"
+summary = simulate(5000, 'Easy', seed=1)
+assert summary['questions'] == 5000, "Expected every simulated question answered"
+first_run, second_run = simulate(500, 'Easy', seed=9), simulate(500, 'Easy', seed=9)
+assert first_run['correct_answers'] == second_run['correct_answers'], "Expected seeded runs to repeat"
+assert first_run['simulated_seconds'] == second_run['simulated_seconds'], "Expected seeded runs to repeat"
+print("   Scoring, timing and simulation work without a UI ✓")
+
+print("\n6. Testing question generators...")
+import numpy as np
+from generators import get_generator, spoken_text
+rng = np.random.default_rng(5)
+for name, check in [
+    ('addition', lambda q: q.answer == q.num1 + q.num2),
+    ('subtraction', lambda q: q.answer == q.num1 - q.num2 >= 0),
+    ('division', lambda q: q.num2 > 0 and q.answer * q.num2 == q.num1 and 0 <= q.answer <= 12),
+    ('squares', lambda q: q.num1 == q.num2 and q.answer == q.num1 ** 2),
+]:
+    batch = get_generator(name, 0, 12).batch(rng, 500)
+    assert all(check(q) for q in batch), f"Expected correct {name} questions"
+mixed = get_generator('mixed:0-12').batch(rng, 500)
+zero_mixed = get_generator('mixed:0-0').batch(rng, 100)
+assert all(q.answer == 0 and '÷' not in q.expression for q in zero_mixed), "Expected division left out"
+assert {q.expression.split()[1] if ' ' in q.expression else '²' for q in mixed} == {'x', '+', '-', '÷', '²'}
+seeded = [TrainingSession('division:1-9', 10, rng=random.Random(4)) for _ in range(2)]
+first_questions = [[s.next_question() for _ in range(300)] for s in seeded]
+assert first_questions[0] == first_questions[1], "Expected seeded sessions to repeat"
+assert seeded[0].difficulty == 'division:1-9' and seeded[0].scheduler is None
+shared = TrainingSession('addition:0-9', 10)
+picked = []
+pickers = [threading.Thread(target=lambda: picked.extend(shared.pick() for _ in range(2000)))
+           for _ in range(4)]
+for picker in pickers:
+    picker.start()
+for picker in pickers:
+    picker.join()
+assert len(picked) == 8000, "Expected concurrent picks to share the batches"
+assert TrainingSession('Custom', 10, 0, 10).difficulty == 'Easy', "Expected the preset name kept"
+assert TrainingSession('Custom', 10, 5, 12).difficulty == 'multiplication:5-12'
+assert spoken_text("12 ÷ 4") == "12 divided by 4" and spoken_text("7²") == "7 squared"
+for bad in ('cubes:0-9', 'addition'):
+    try:
+        get_generator(bad)
+        raise AssertionError(f"Expected {bad!r} to be rejected")
+    except ValueError:
+        pass
+print("   Batched, seeded questions of every kind are correct ✓")
+
+print("\n7. Testing session recording and replay...")
+from session_log import SessionLog, replay
+record_dir = tempfile.mkdtemp()
+log_path = os.path.join(record_dir, 'session.jsonl')
+recorded = simulate(300, 'Hard', seed=11, record=log_path)
+log = SessionLog.read(log_path)
+assert log.header['difficulty'] == 'Hard' and len(log.questions()) == 300
+assert [event[0] for event in log.events[-2:]] == ['a', 'e'], "Expected the end recorded"
+waits = []
+replayed = replay(log, realtime=True, sleep=waits.append)
+assert replayed['questions'] == 300 and replayed['correct_answers'] == recorded['correct_answers']
+assert len(waits) == len(log.events) and max(waits) > 0, "Expected waits at the recorded pace"
+replay_db = Database(os.path.join(record_dir, 'replay.db'))
+replay(log, replay_db)
+stats = replay_db.get_statistics('Hard')
+assert (stats['total_questions'], stats['correct_answers']) == (300, recorded['correct_answers'])
+replay_db.close()
+from session_log import QUESTION, ANSWER, ReplayError, ReplaySession
+replay_clock = SimulatedClock()
+piped = ReplaySession(log, replay_clock)
+replay_pipeline = QuestionPipeline(piped.pick)
+replay_pipeline.start()
+for kind, offset, *payload in log.events:
+    replay_clock.now = offset
+    if kind == QUESTION:
+        piped.next_question(replay_pipeline.next().question)
+        piped.check_question(payload)
+    elif kind == ANSWER:
+        piped.answer(payload[0])
+replay_pipeline.stop()
+assert piped.correct_answers == recorded['correct_answers'], "Expected the pipeline replay to score the same"
+try:
+    piped.check_question(log.events[0][2:])
+    raise AssertionError("Expected a question mismatch to be reported")
+except ReplayError:
+    pass
+shutil.rmtree(record_dir)
+print("   Sessions replay with the recorded answers, timing and scores ✓")
+
+print("\n8. Testing results summary...")
+from session_engine import summarize_history
+summary_text, rows = summarize_history(session.history, session.correct_answers, session.total_questions)
+assert summary_text.startswith("Score: 1/2 (50.0%)"), "Expected the score in the summary"
+assert [row['status_text'] for row in rows] == ["✓ Correct", "✗ Incorrect"], "Expected one row per question"
+assert summarize_history([], 0, 0) == ("No questions answered in this session.", []), "Expected an empty summary"
+print("   Summary and result rows built in one pass ✓")
+
+print("\n9. Testing the question timer...")
+from question_timer import QuestionTimer
+clock = SimulatedClock()
+timer = QuestionTimer(TrainingSession('Easy', 10, clock=clock, rng=random.Random(1)))
+timer.session.next_question()
+assert timer.update() == "Time: 10"
+clock.advance(0.5)
+assert timer.update() is None, "Unchanged value must not be reported"
+clock.advance(7.2)  # a late tick lands on the true remaining time
+assert timer.update() == "Time: 2.3"
+clock.advance(2.3)
+assert timer.expired() and timer.update() == "Time: 0.0"
+unlimited = QuestionTimer(TrainingSession('Easy', 0, clock=clock, rng=random.Random(1)))
+unlimited.session.next_question()
+clock.advance(61.4)
+assert unlimited.remaining() is None and not unlimited.expired()
+assert unlimited.update() == "Time: 61s"
+print("   Deadline-based countdown and count-up ✓")
+
+print("\n10. Testing theme palettes...")
+import importlib.util
+if importlib.util.find_spec('kivy') is None:
+    print("   Skipped: the theme's observable colors need Kivy")
+else:
+    os.environ.setdefault('KIVY_NO_CONSOLELOG', '1')
+    from theme import PALETTES, Theme
+    theme = Theme('light')
+    notified = []
+    theme.bind(bg_primary=lambda *args: notified.append('bg_primary'),
+               button_text=lambda *args: notified.append('button_text'))
+    theme.apply('dark')
+    theme.apply('dark')
+    assert list(theme.bg_primary) == PALETTES['dark']['bg_primary']
+    assert notified == ['bg_primary'], f"Only changed colors should dispatch, got {notified}"
+    print("   Switching themes only notifies changed colors ✓")
+
+print("\n11. Testing hot path tracing...")
+import json
+from tracing import NULL_TRACE, Tracer
+assert Tracer().begin('check_answer') is NULL_TRACE, "Disabled tracing should record nothing"
+ticks = iter(range(0, 10**9, 1000))
+tracer = Tracer(enabled=True, capacity=4, clock=lambda: next(ticks))
+for _ in range(2):
+    trace = tracer.begin('check_answer')
+    trace.phase('score')
+    trace.end()
+assert len(tracer.spans) == 4 and tracer.stats['check_answer'].count == 2
+assert [row[:2] for row in tracer.summary()] == [('check_answer', 2), ('check_answer.score', 2)]
+assert tracer.summary()[1][2] == 0.001, "Expected 1 µs phases"
+trace_dir = tempfile.mkdtemp()
+trace_path = os.path.join(trace_dir, 'trace.json')
+assert tracer.dump(trace_path) == 4
+with open(trace_path) as f:
+    events = json.load(f)['traceEvents']
+assert [event['dur'] for event in events if event['ph'] == 'X'] == [1.0, 2.0, 1.0, 2.0]
+shutil.rmtree(trace_dir)
+print("   Phases timed into a ring buffer and dumped as a trace file ✓")
+
 print("\n✓ Application logic tests passed!")
 
+# Test analytics
+print("\n" + "=" * 60)
+print("Testing Analytics")
+print("=" * 60)
+
+import analytics
+analytics_dir = tempfile.mkdtemp()
+analytics_db = Database(os.path.join(analytics_dir, 'analytics.db'))
+for difficulty, answers in (('Easy', [(2, 3, 1, 1.0), (2, 3, 0, 3.0)]),
+                            ('Hard', [(4, 5, 1, 2.0)])):
+    uid = analytics_db.add_training_session(difficulty, len(answers), 1, 10)
+    analytics_db.add_question_attempts([
+        (uid, seq, n1, n2, f"{n1} x {n2}", str(n1 * n2), n1 * n2, ok, t)
+        for seq, (n1, n2, ok, t) in enumerate(answers, 1)
+    ])
+
+print("\n1. Loading history into columns...")
+history = analytics.load_history(analytics_db)
+assert len(history.sessions) == 2 and len(history.attempts) == 3
+assert os.path.exists(analytics.snapshot_path(analytics_db)), "Expected a snapshot"
+uid = analytics_db.add_training_session('Easy', 1, 1, 10)
+analytics_db.add_question_attempts([(uid, 1, 2, 3, "2 x 3", "6", 6, 1, 2.0)])
+history = analytics.load_history(analytics_db)
+assert len(history.sessions) == 3 and len(history.attempts) == 4, "Expected the new session"
+print("   ✓ Snapshot reused and extended with new sessions")
+
+print("\n2. Computing statistics...")
+breakdown = analytics.difficulty_breakdown(history, percentiles=(50,))
+assert breakdown['Easy']['questions'] == 3 and breakdown['Easy']['p50'] == 2.0
+assert round(breakdown['Easy']['accuracy']) == 67 and breakdown['Hard']['accuracy'] == 100
+heatmap = analytics.fact_heatmap(history)
+assert (heatmap['min_range'], heatmap['max_range']) == (2, 5)
+assert heatmap['questions'][0, 1] == 3 and round(heatmap['accuracy'][0, 1], 2) == 0.67
+assert analytics.heatmap_rgba(heatmap['accuracy']).shape == (4, 4, 4)
+trend = analytics.daily_trend(history)
+assert trend['questions'].sum() == 4 and trend['rolling_accuracy'][-1] == 75
+assert list(analytics.rolling_sum([1, 2, 3, 4], 2)) == [1, 3, 5, 7]
+report = analytics.build_report(analytics_db)
+assert report['summary_text'].startswith("Questions answered: 4")
+print("   ✓ Percentiles, heatmap and trends computed")
+
+print("\n3. Other operations and long difficulty labels...")
+for difficulty, n1, n2 in (('subtraction:0-100', 90, 5), ('subtraction:0-10', 9, 5)):
+    uid = analytics_db.add_training_session(difficulty, 1, 1, 10)
+    analytics_db.add_question_attempts([(uid, 1, n1, n2, f"{n1} - {n2}", str(n1 - n2), n1 - n2, 1, 1.0)])
+history = analytics.load_history(analytics_db)
+breakdown = analytics.difficulty_breakdown(history)
+assert breakdown['subtraction:0-100']['questions'] == 1, "Expected untruncated labels"
+assert breakdown['subtraction:0-10']['questions'] == 1
+assert analytics.History.open(analytics.snapshot_path(analytics_db)).difficulties == history.difficulties
+heatmap = analytics.fact_heatmap(history)
+assert (heatmap['min_range'], heatmap['max_range']) == (2, 5), "Expected multiplication facts only"
+assert heatmap['questions'].sum() == 4
+print("   ✓ Labels kept whole, heatmap limited to multiplication")
+
+print("\n4. Rebuilding snapshots of another version...")
+snapshot = analytics.snapshot_path(analytics_db)
+with open(snapshot, 'wb') as f:
+    np.savez(f, sessions=history.sessions[:1], attempts=history.attempts[:1],
+                difficulties=np.array(['subtraction:0-1'], dtype='U16'))
+history = analytics.load_history(analytics_db)
+assert len(history.sessions) == 5 and 'subtraction:0-1' not in history.difficulties
+print("   ✓ Unversioned snapshot discarded and rebuilt")
+
+print("\n5. Grouping days by local time...")
+if hasattr(time, 'tzset'):
+    saved_tz = os.environ.get('TZ')
+    os.environ['TZ'] = 'America/New_York'
+    time.tzset()
+    try:
+        # 2024-01-02 10:00 and 21:00 in New York: 15:00 UTC and 02:00 UTC the next day
+        dates = [int(time.mktime((2024, 1, 2, hour, 0, 0, 0, 0, -1))) for hour in (10, 21)]
+        sessions = np.zeros(2, analytics.SESSION_DTYPE)
+        sessions['id'], sessions['date'] = [1, 2], dates
+        attempts = np.zeros(2, analytics.ATTEMPT_DTYPE)
+        attempts['session'], attempts['is_correct'] = [1, 2], [1, 0]
+        trend = analytics.daily_trend(analytics.History(sessions, attempts, ['Easy']))
+        assert list(trend['questions']) == [2], "Expected one local day"
+        assert time.strftime('%Y-%m-%d', time.localtime(int(trend['day'][0]))) == '2024-01-02'
+        assert trend['day'][0] == time.mktime((2024, 1, 2, 0, 0, 0, 0, 0, -1)), "Expected local midnight"
+    finally:
+        if saved_tz is None:
+            del os.environ['TZ']
+        else:
+            os.environ['TZ'] = saved_tz
+        time.tzset()
+    print("   ✓ Days follow the local calendar")
+
+analytics_db.close()
+shutil.rmtree(analytics_dir)
+print("\n✓ Analytics tests passed!")
+
 # Summary
 print("\n" + "=" * 60)
 print("TEST SUMMARY")
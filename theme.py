@@ -0,0 +1,92 @@
+"""Color themes, exposed as one observable property per color."""
+from kivy.event import EventDispatcher
+from kivy.properties import ColorProperty
+
+
+PALETTES = {
+    'light': {
+        'bg_primary': [0.96, 0.97, 0.98, 1],      # Very light gray-blue
+        'bg_secondary': [1, 1, 1, 1],              # White
+        'bg_card': [1, 1, 1, 1],                   # White
+        'text_primary': [0.13, 0.13, 0.13, 1],     # Dark gray
+        'text_secondary': [0.4, 0.4, 0.4, 1],      # Medium gray
+        'button_bg': [0.2, 0.51, 0.96, 1],         # Modern blue
+        'button_text': [1, 1, 1, 1],               # White
+        'button_bg_alt': [0.29, 0.76, 0.55, 1],    # Modern green
+        'accent': [0.5, 0.31, 0.94, 1],            # Purple accent
+        'border': [0.88, 0.89, 0.9, 1],            # Light border
+    },
+    'dark': {
+        'bg_primary': [0.11, 0.11, 0.13, 1],       # Very dark gray
+        'bg_secondary': [0.15, 0.15, 0.17, 1],     # Dark gray
+        'bg_card': [0.18, 0.18, 0.21, 1],          # Card background
+        'text_primary': [0.95, 0.95, 0.96, 1],     # Almost white
+        'text_secondary': [0.65, 0.65, 0.67, 1],   # Light gray
+        'button_bg': [0.27, 0.53, 0.95, 1],        # Modern blue
+        'button_text': [1, 1, 1, 1],               # White
+        'button_bg_alt': [0.29, 0.76, 0.55, 1],    # Modern green
+        'accent': [0.58, 0.42, 0.95, 1],           # Purple accent
+        'border': [0.25, 0.25, 0.28, 1],           # Dark border
+    },
+}
+
+DEFAULT_THEME = 'light'
+
+# Returned for color keys no palette defines
+FALLBACK_COLOR = [1, 1, 1, 1]
+
+
+def _compile(palette, previous):
+    """(key, color) pairs of a palette that differ from the previous one."""
+    return tuple(
+        (key, list(color)) for key, color in palette.items()
+        if previous is None or previous[key] != color
+    )
+
+
+# Each palette resolved once, both in full and as the changes from every
+# other palette, so switching sets only the colors that differ
+_FULL = {mode: _compile(palette, None) for mode, palette in PALETTES.items()}
+_CHANGES = {
+    (old, new): _compile(PALETTES[new], PALETTES[old])
+    for old in PALETTES for new in PALETTES if old != new
+}
+
+
+class Theme(EventDispatcher):
+    """The current palette, one observable color property per key.
+
+    kv rules bind to single colors (e.g. `app.theme.bg_card`), so switching
+    theme only notifies the canvas instructions whose color changed.
+    """
+
+    bg_primary = ColorProperty(PALETTES[DEFAULT_THEME]['bg_primary'])
+    bg_secondary = ColorProperty(PALETTES[DEFAULT_THEME]['bg_secondary'])
+    bg_card = ColorProperty(PALETTES[DEFAULT_THEME]['bg_card'])
+    text_primary = ColorProperty(PALETTES[DEFAULT_THEME]['text_primary'])
+    text_secondary = ColorProperty(PALETTES[DEFAULT_THEME]['text_secondary'])
+    button_bg = ColorProperty(PALETTES[DEFAULT_THEME]['button_bg'])
+    button_text = ColorProperty(PALETTES[DEFAULT_THEME]['button_text'])
+    button_bg_alt = ColorProperty(PALETTES[DEFAULT_THEME]['button_bg_alt'])
+    accent = ColorProperty(PALETTES[DEFAULT_THEME]['accent'])
+    border = ColorProperty(PALETTES[DEFAULT_THEME]['border'])
+
+    def __init__(self, mode=DEFAULT_THEME, **kwargs):
+        super().__init__(**kwargs)
+        self.mode = None
+        self.apply(mode)
+
+    def apply(self, mode):
+        """Switch to the palette of a theme mode ('light' or 'dark')."""
+        if mode == self.mode:
+            return
+        if mode not in PALETTES:
+            raise ValueError(f"Unknown theme {mode!r}")
+        changes = _FULL[mode] if self.mode is None else _CHANGES[self.mode, mode]
+        for key, color in changes:
+            setattr(self, key, color)
+        self.mode = mode
+
+    def color(self, key):
+        """Current color of a key."""
+        return getattr(self, key, FALLBACK_COLOR)
@@ -0,0 +1,188 @@
+"""Opt-in, low-overhead tracing of hot paths.
+
+Traced operations are split into phases timed on a monotonic nanosecond
+clock. Finished spans go into a fixed-size ring buffer (the most recent
+spans, for the trace file) and into per-span counters and histograms (the
+whole run, for the debug overlay). While tracing is disabled, begin()
+returns a shared do-nothing trace, so instrumented code pays one method
+call per phase and allocates nothing.
+
+Enable with BRAIN_TRAINER_TRACE=1. Trace files use the Chrome trace event
+format and open in chrome://tracing or https://ui.perfetto.dev.
+"""
+import collections
+import json
+import os
+import threading
+import time
+
+
+# Environment variable that turns tracing on
+TRACE_ENV = 'BRAIN_TRAINER_TRACE'
+
+# Spans kept for the trace file
+DEFAULT_CAPACITY = 4096
+
+# Histogram bucket i counts durations of 2**(i-1) up to 2**i nanoseconds
+HISTOGRAM_BUCKETS = 40
+
+
+def tracing_requested():
+    """Whether the environment asks for tracing."""
+    return os.environ.get(TRACE_ENV, '') not in ('', '0')
+
+
+class _NullTrace:
+    """Stands in for a Trace while tracing is disabled."""
+
+    __slots__ = ()
+
+    def phase(self, name):
+        pass
+
+    def end(self):
+        pass
+
+
+NULL_TRACE = _NullTrace()
+
+
+class Trace:
+    """One traced operation, timed phase by phase."""
+
+    __slots__ = ('tracer', 'name', 'start', 'last')
+
+    def __init__(self, tracer, name):
+        self.tracer = tracer
+        self.name = name
+        self.start = self.last = tracer.clock()
+
+    def phase(self, name):
+        """Record the phase that just finished as <operation>.<name>."""
+        now = self.tracer.clock()
+        self.tracer.record(f"{self.name}.{name}", self.last, now - self.last)
+        self.last = now
+
+    def end(self):
+        """Record the whole operation."""
+        self.tracer.record(self.name, self.start, self.tracer.clock() - self.start)
+
+
+class SpanStats:
+    """Count, total, maximum and power-of-two histogram of one span's durations."""
+
+    __slots__ = ('count', 'total_ns', 'max_ns', 'buckets')
+
+    def __init__(self):
+        self.count = 0
+        self.total_ns = 0
+        self.max_ns = 0
+        self.buckets = [0] * HISTOGRAM_BUCKETS
+
+    def add(self, duration_ns):
+        """Count one duration."""
+        self.count += 1
+        self.total_ns += duration_ns
+        if duration_ns > self.max_ns:
+            self.max_ns = duration_ns
+        self.buckets[min(duration_ns.bit_length(), HISTOGRAM_BUCKETS - 1)] += 1
+
+    def percentile(self, fraction):
+        """Upper bound in nanoseconds of the bucket holding a percentile."""
+        rank = fraction * self.count
+        seen = 0
+        for index, count in enumerate(self.buckets):
+            seen += count
+            if count and seen >= rank:
+                return min(1 << index, self.max_ns)
+        return self.max_ns
+
+
+class Tracer:
+    """Collects spans of traced operations from any thread."""
+
+    def __init__(self, enabled=False, capacity=DEFAULT_CAPACITY, clock=time.perf_counter_ns):
+        """Create a tracer.
+
+        Args:
+            enabled: Whether begin() records anything.
+            capacity: Number of recent spans kept for dump().
+            clock: Monotonic clock returning integer nanoseconds.
+        """
+        self.enabled = enabled
+        self.clock = clock
+        self.spans = collections.deque(maxlen=capacity)
+        self.stats = {}
+        self._threads = {}
+        self._lock = threading.Lock()
+
+    def begin(self, name):
+        """Start tracing an operation; returns a Trace (or a no-op one)."""
+        if not self.enabled:
+            return NULL_TRACE
+        return Trace(self, name)
+
+    def record(self, name, start_ns, duration_ns):
+        """Record a finished span."""
+        thread = threading.get_ident()
+        with self._lock:
+            if thread not in self._threads:
+                self._threads[thread] = threading.current_thread().name
+            self.spans.append((name, start_ns, duration_ns, thread))
+            stats = self.stats.get(name)
+            if stats is None:
+                stats = self.stats[name] = SpanStats()
+            stats.add(duration_ns)
+
+    def clear(self):
+        """Forget every recorded span and statistic."""
+        with self._lock:
+            self.spans.clear()
+            self.stats.clear()
+
+    def summary(self):
+        """Rows of (span, count, mean ms, p50 ms, p99 ms, max ms), by span name.
+
+        Percentiles are bucket upper bounds, exact to within a factor of two.
+        """
+        with self._lock:
+            items = sorted(self.stats.items())
+            rows = [
+                (name, stats.count, stats.total_ns / stats.count / 1e6,
+                 stats.percentile(0.5) / 1e6, stats.percentile(0.99) / 1e6,
+                 stats.max_ns / 1e6)
+                for name, stats in items
+            ]
+        return rows
+
+    def summary_text(self):
+        """The summary as aligned text, for the debug overlay."""
+        lines = [f"{'span':<34}{'n':>6}{'mean':>9}{'p50':>9}{'p99':>9}{'max':>9}"]
+        for name, count, mean, p50, p99, maximum in self.summary():
+            lines.append(f"{name:<34}{count:>6}{mean:>9.2f}{p50:>9.2f}{p99:>9.2f}{maximum:>9.2f}")
+        return '\n'.join(lines)
+
+    def dump(self, path):
+        """Write the buffered spans as a Chrome trace event file.
+
+        Returns the number of spans written.
+        """
+        with self._lock:
+            spans = list(self.spans)
+            threads = dict(self._threads)
+        pid = os.getpid()
+        events = [
+            {'name': 'thread_name', 'ph': 'M', 'pid': pid, 'tid': thread,
+             'args': {'name': name}}
+            for thread, name in threads.items()
+        ]
+        events.extend(
+            {'name': name, 'ph': 'X', 'pid': pid, 'tid': thread,
+             'ts': start / 1000, 'dur': duration / 1000}
+            for name, start, duration, thread in spans
+        )
+        temp_path = f"{path}.tmp"
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            json.dump({'traceEvents': events, 'displayTimeUnit': 'ms'}, f)
+        os.replace(temp_path, path)
+        return len(spans)
@@ -0,0 +1,188 @@
+"""Text-to-speech engines used to speak questions."""
+import importlib.util
+import io
+import os
+import threading
+import wave
+
+
+DEFAULT_CLIPS_DIR = 'voice_clips'
+
+_ONES = [
+    'zero', 'one', 'two', 'three', 'four', 'five', 'six', 'seven', 'eight',
+    'nine', 'ten', 'eleven', 'twelve', 'thirteen', 'fourteen', 'fifteen',
+    'sixteen', 'seventeen', 'eighteen', 'nineteen'
+]
+_TENS = [
+    '', '', 'twenty', 'thirty', 'forty', 'fifty', 'sixty', 'seventy',
+    'eighty', 'ninety'
+]
+
+
+def number_words(number):
+    """Spell out an integer as a list of English words.
+
+    Examples: 7 -> ['seven'], 42 -> ['forty', 'two'],
+    305 -> ['three', 'hundred', 'five'].
+    """
+    if number < 0:
+        return ['minus'] + number_words(-number)
+    if number < 20:
+        return [_ONES[number]]
+    if number < 100:
+        tens, ones = divmod(number, 10)
+        return [_TENS[tens]] + ([_ONES[ones]] if ones else [])
+    if number < 1000:
+        hundreds, rest = divmod(number, 100)
+        return [_ONES[hundreds], 'hundred'] + (number_words(rest) if rest else [])
+    if number < 1000000:
+        thousands, rest = divmod(number, 1000)
+        return number_words(thousands) + ['thousand'] + (number_words(rest) if rest else [])
+    raise ValueError(f"Number too large to speak: {number}")
+
+
+def text_words(text):
+    """Split question text such as '12 times 7' into clip words."""
+    words = []
+    for token in text.split():
+        try:
+            words.extend(number_words(int(token)))
+        except ValueError:
+            words.append(token.lower())
+    return words
+
+
+class TTSBackend:
+    """Base class for speech engines.
+
+    A backend turns text into encoded audio bytes in memory; nothing is
+    written to disk by the backend itself.
+    """
+
+    #: Short identifier stored in settings and used to namespace cached clips
+    name = ''
+    #: File extension matching the encoded audio
+    file_suffix = '.wav'
+    #: Whether synthesis works without a network connection
+    offline = True
+
+    @classmethod
+    def is_available(cls):
+        """Whether the engine can be used on this system."""
+        return True
+
+    def synthesize(self, text, lang='en'):
+        """Return the encoded audio for text."""
+        raise NotImplementedError
+
+
+class GTTSBackend(TTSBackend):
+    """Google Translate text-to-speech (needs network access)."""
+
+    name = 'gtts'
+    file_suffix = '.mp3'
+    offline = False
+
+    @classmethod
+    def is_available(cls):
+        """Whether gTTS is installed (checked without importing it)."""
+        return importlib.util.find_spec('gtts') is not None
+
+    def synthesize(self, text, lang='en'):
+        """Return MP3 bytes synthesized by gTTS."""
+        from gtts import gTTS
+
+        buffer = io.BytesIO()
+        gTTS(text=text, lang=lang, slow=False).write_to_fp(buffer)
+        return buffer.getvalue()
+
+
+class ClipConcatBackend(TTSBackend):
+    """Offline engine stitching pre-recorded word clips together.
+
+    Expects one WAV file per word in <clips_dir>/<lang>/, e.g.
+    voice_clips/en/twelve.wav, voice_clips/en/times.wav. All clips of a
+    language must share the same channel count, sample width and rate.
+    Clips are decoded once and kept in memory; each question is assembled
+    by concatenating their frames into an in-memory WAV.
+    """
+
+    name = 'clips'
+    file_suffix = '.wav'
+    offline = True
+
+    def __init__(self, clips_dir=DEFAULT_CLIPS_DIR, gap_ms=40):
+        """Create the engine; gap_ms of silence separates consecutive words."""
+        self.clips_dir = clips_dir
+        self.gap_ms = gap_ms
+        self._clips = {}  # (lang, word) -> (params, frames)
+        self._lock = threading.Lock()
+
+    @classmethod
+    def is_available(cls, clips_dir=DEFAULT_CLIPS_DIR):
+        """Whether a clip set is installed."""
+        return os.path.exists(os.path.join(clips_dir, 'en', 'times.wav'))
+
+    def _clip(self, lang, word):
+        """Decoded (params, frames) of one word clip."""
+        key = (lang, word)
+        with self._lock:
+            clip = self._clips.get(key)
+        if clip is None:
+            path = os.path.join(self.clips_dir, lang, f"{word}.wav")
+            try:
+                with wave.open(path, 'rb') as f:
+                    clip = (f.getparams(), f.readframes(f.getnframes()))
+            except FileNotFoundError:
+                raise LookupError(f"No voice clip for '{word}' ({lang})") from None
+            with self._lock:
+                self._clips[key] = clip
+        return clip
+
+    def synthesize(self, text, lang='en'):
+        """Return WAV bytes speaking text."""
+        clips = [self._clip(lang, word) for word in text_words(text)]
+        if not clips:
+            raise ValueError("Nothing to speak")
+
+        params = clips[0][0]
+        frame_size = params.nchannels * params.sampwidth
+        gap = b'\x00' * (frame_size * params.framerate * self.gap_ms // 1000)
+
+        buffer = io.BytesIO()
+        with wave.open(buffer, 'wb') as out:
+            out.setnchannels(params.nchannels)
+            out.setsampwidth(params.sampwidth)
+            out.setframerate(params.framerate)
+            for index, (clip_params, frames) in enumerate(clips):
+                if (clip_params.nchannels, clip_params.sampwidth, clip_params.framerate) != \
+                        (params.nchannels, params.sampwidth, params.framerate):
+                    raise ValueError("Voice clips use different audio formats")
+                if index:
+                    out.writeframesraw(gap)
+                out.writeframesraw(frames)
+        return buffer.getvalue()
+
+
+# Engines by setting name, in order of preference for 'auto'
+BACKENDS = {
+    ClipConcatBackend.name: ClipConcatBackend,
+    GTTSBackend.name: GTTSBackend,
+}
+
+
+def get_backend(name='auto'):
+    """Create the named engine, or the best available one for 'auto'.
+
+    Returns None when the requested engine (or, for 'auto', every engine)
+    is unavailable.
+    """
+    if name == 'auto':
+        for backend_class in BACKENDS.values():
+            if backend_class.is_available():
+                return backend_class()
+        return None
+    backend_class = BACKENDS.get(name)
+    if backend_class is None or not backend_class.is_available():
+        return None
+    return backend_class()
@@ -0,0 +1,186 @@
+"""On-disk cache of synthesized question audio."""
+import hashlib
+import logging
+import os
+import threading
+from collections import OrderedDict
+
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CACHE_DIR = 'tts_cache'
+DEFAULT_MAX_BYTES = 64 * 1024 * 1024  # 64 MB
+
+
+def speech_text(num1, num2):
+    """Text spoken for a multiplication question."""
+    return f"{num1} times {num2}"
+
+
+class AudioCache:
+    """Content-addressed, size-capped cache of spoken question clips.
+
+    Clips are stored as files named after a hash of the speech engine,
+    language and text, so a clip is synthesized once and then reused across
+    questions, sessions and app restarts. When the cache grows past max_bytes
+    the least recently used clips are deleted; file modification times record
+    recency so the order survives restarts.
+    """
+
+    def __init__(self, backend, cache_dir=DEFAULT_CACHE_DIR, max_bytes=DEFAULT_MAX_BYTES):
+        """Open (or create) the cache directory and index existing clips.
+
+        Args:
+            backend: TTSBackend used to synthesize missing clips.
+        """
+        self.backend = backend
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.suffix = backend.file_suffix
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()  # key -> size, least recently used first
+        self._total_bytes = 0
+        self._prefetch_stop = None
+        os.makedirs(cache_dir, exist_ok=True)
+        self._load_index()
+
+    def _load_index(self):
+        """Index clips already on disk, oldest first."""
+        clips = []
+        for name in os.listdir(self.cache_dir):
+            if not name.endswith(self.suffix):
+                continue
+            try:
+                stat = os.stat(os.path.join(self.cache_dir, name))
+            except OSError:
+                continue
+            clips.append((stat.st_mtime, name[:-len(self.suffix)], stat.st_size))
+        for _, key, size in sorted(clips):
+            self._entries[key] = size
+            self._total_bytes += size
+
+    def key(self, text, lang='en'):
+        """Cache key for a piece of text in a language."""
+        source = f"{self.backend.name}\0{lang}\0{text}"
+        return hashlib.sha1(source.encode('utf-8')).hexdigest()
+
+    def _path(self, key):
+        """File path of a cached clip."""
+        return os.path.join(self.cache_dir, key + self.suffix)
+
+    @property
+    def total_bytes(self):
+        """Total size of the cached clips."""
+        return self._total_bytes
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, text, lang='en'):
+        """Path of the cached clip for text, or None on a cache miss."""
+        key = self.key(text, lang)
+        with self._lock:
+            if key not in self._entries:
+                return None
+            self._entries.move_to_end(key)
+        path = self._path(key)
+        try:
+            os.utime(path)
+        except OSError:
+            # The file was removed behind our back; forget it
+            with self._lock:
+                self._total_bytes -= self._entries.pop(key, 0)
+            return None
+        return path
+
+    def get_or_create(self, text, lang='en'):
+        """Path of the clip for text, synthesizing and storing it on a miss."""
+        path = self.get(text, lang)
+        if path is None:
+            path = self.put(text, self.backend.synthesize(text, lang), lang)
+        return path
+
+    def put(self, text, audio, lang='en'):
+        """Store clip bytes for text and return the clip's path."""
+        key = self.key(text, lang)
+        path = self._path(key)
+        # Write then rename so readers never see a partial clip
+        temp_path = f"{path}.{threading.get_ident()}.tmp"
+        with open(temp_path, 'wb') as f:
+            f.write(audio)
+        os.replace(temp_path, path)
+
+        with self._lock:
+            self._total_bytes -= self._entries.pop(key, 0)
+            self._entries[key] = len(audio)
+            self._total_bytes += len(audio)
+            evicted = self._evict_locked(keep=key)
+        for old_key in evicted:
+            try:
+                os.remove(self._path(old_key))
+            except OSError:
+                pass
+        return path
+
+    def _evict_locked(self, keep):
+        """Drop least recently used entries until the cache fits its cap."""
+        evicted = []
+        while self._total_bytes > self.max_bytes and len(self._entries) > 1:
+            key, size = next(iter(self._entries.items()))
+            if key == keep:
+                break
+            del self._entries[key]
+            self._total_bytes -= size
+            evicted.append(key)
+        return evicted
+
+    def prefetch_range(self, min_range, max_range, lang='en', stop_event=None):
+        """Synthesize every question of a number range that is not cached.
+
+        Stops early when stop_event is set or when the cache is full, since
+        going on would only evict clips prefetched a moment ago.
+
+        Returns the number of clips synthesized.
+        """
+        created = 0
+        for num1 in range(min_range, max_range + 1):
+            for num2 in range(min_range, max_range + 1):
+                if stop_event is not None and stop_event.is_set():
+                    return created
+                if self._total_bytes >= self.max_bytes:
+                    return created
+                text = speech_text(num1, num2)
+                if self.get(text, lang) is not None:
+                    continue
+                try:
+                    self.put(text, self.backend.synthesize(text, lang), lang)
+                except Exception as error:
+                    # Typically offline; whatever is cached so far still helps
+                    logger.warning("Audio prefetch stopped: %s", error)
+                    return created
+                created += 1
+        return created
+
+    def start_prefetch(self, min_range, max_range, lang='en'):
+        """Prefetch a number range on a background thread.
+
+        Any prefetch still running for a previous range is cancelled first.
+        Returns the started thread.
+        """
+        self.stop_prefetch()
+        stop_event = threading.Event()
+        self._prefetch_stop = stop_event
+        thread = threading.Thread(
+            target=self.prefetch_range,
+            args=(min_range, max_range, lang, stop_event),
+            name='tts-prefetch',
+            daemon=True
+        )
+        thread.start()
+        return thread
+
+    def stop_prefetch(self):
+        """Cancel a running background prefetch, if any."""
+        if self._prefetch_stop is not None:
+            self._prefetch_stop.set()
+            self._prefetch_stop = None